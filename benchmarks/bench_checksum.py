@@ -0,0 +1,68 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Micro-benchmark of the MRZ check digit calculation.
+Compares the table driven mrz_checksum and the batch APIs with the original character by character loop.
+
+    python benchmarks/bench_checksum.py
+"""
+
+import random
+import string
+import timeit
+
+from disaster_id_scan.mrz import encode_mrz_array, mrz_checksum, mrz_checksum_array, mrz_checksums
+
+ALPHABET = string.ascii_uppercase + string.digits + "<"
+
+
+def reference_checksum(text: str, start_position: int = 0) -> int:
+    # Implementation of mrz_checksum up to version 0.3.0
+    values = [7, 3, 1]
+    text = text.upper()
+    values = values[start_position:] + values[:start_position]
+    checksum = 0
+    for i, char in enumerate(text):
+        if char.isalpha():
+            checksum += (ord(char) - 55) * values[i % len(values)]
+        elif char.isdigit():
+            checksum += int(char) * values[i % len(values)]
+    return checksum % 10
+
+
+def random_fields(count: int, width: int) -> list[str]:
+    rng = random.Random(42)
+    return ["".join(rng.choice(ALPHABET) for _ in range(width)) for _ in range(count)]
+
+
+def check_equal():
+    # The new implementation must give exactly the same results, also for unusual input
+    texts = [*random_fields(2000, 39), "", "abc<def", "ÄÖÜ123", "L898902C3", "mustermann<<erika", "x" * 100]
+    for start_position in (-4, -1, 0, 1, 2, 3, 5):
+        for text in texts:
+            assert mrz_checksum(text, start_position) == reference_checksum(text, start_position), text
+    ascii_texts = random_fields(2000, 39)
+    assert list(mrz_checksum_array(encode_mrz_array(ascii_texts))) == [reference_checksum(t) for t in ascii_texts]
+
+
+def main():
+    check_equal()
+    for width in (6, 9, 39):
+        texts = random_fields(10000, width)
+        encoded = encode_mrz_array(texts)
+        reference = timeit.timeit(lambda texts=texts: [reference_checksum(t) for t in texts], number=5) / 5
+        scalar = timeit.timeit(lambda texts=texts: [mrz_checksum(t) for t in texts], number=5) / 5
+        batch = timeit.timeit(lambda texts=texts: mrz_checksums(texts), number=5) / 5
+        vectorised = timeit.timeit(lambda texts=texts: mrz_checksum_array(encode_mrz_array(texts)), number=5) / 5
+        precoded = timeit.timeit(lambda encoded=encoded: mrz_checksum_array(encoded), number=5) / 5
+        print(f"{len(texts)} fields of {width} characters:")
+        print(f"  reference loop     {reference * 1000:8.2f} ms")
+        print(f"  mrz_checksum       {scalar * 1000:8.2f} ms  ({reference / scalar:5.1f}x)")
+        print(f"  mrz_checksums      {batch * 1000:8.2f} ms  ({reference / batch:5.1f}x)")
+        print(f"  numpy incl. encode {vectorised * 1000:8.2f} ms  ({reference / vectorised:5.1f}x)")
+        print(f"  numpy pre-encoded  {precoded * 1000:8.2f} ms  ({reference / precoded:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
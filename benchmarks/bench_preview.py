@@ -0,0 +1,56 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Benchmark of the preparation of a preview frame.
+Compares the conversion of the full frame with a PIL resize (up to 0.3.0) with the single cv2.resize into a
+reused buffer of the preview pipeline. Creating the Tk image is not included, it needs a display.
+
+    python benchmarks/bench_preview.py [width] [height]
+"""
+
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from disaster_id_scan.preview import PREVIEW_FPS, PREVIEW_WIDTH, PreviewPipeline, preview_size
+
+ROUNDS = 100
+
+
+def legacy(frame: np.ndarray):
+    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    image = Image.fromarray(frame)
+    if image.width > PREVIEW_WIDTH:
+        image = Image.fromarray(frame).resize(preview_size(image.width, image.height))
+    return image
+
+
+def timed(function, frame: np.ndarray) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        function(frame)
+    return (time.perf_counter() - start) / ROUNDS
+
+
+def main():
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 1920
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 1080
+    frame = np.random.default_rng(42).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    pipeline = PreviewPipeline(None, None)
+
+    old = timed(legacy, frame)
+    new = timed(pipeline._prepare, frame)
+    print(f"{width}x{height} frame, scaled to {'x'.join(map(str, preview_size(width, height)))}")
+    print(
+        f"  per frame    full conversion and PIL resize {old * 1000:6.2f} ms   "
+        f"cv2.resize into buffer {new * 1000:6.2f} ms ({old / new:.1f}x)"
+    )
+    print(f"  at {PREVIEW_FPS} fps   {old * PREVIEW_FPS:.0%} of a core   {new * PREVIEW_FPS:.0%} of a core")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Benchmark of the autosave format and the memory used by the registrants.
+Compares the JSON lines format (version 2) with the jsonpickle dump of plain Person objects (version 1).
+
+    python benchmarks/bench_store.py [count]
+"""
+
+import gc
+import random
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import jsonpickle
+
+from disaster_id_scan.store import Person, Registrants
+
+
+class LegacyPerson:
+    # Person up to version 0.3.0, with a __dict__ per instance
+    def __init__(self):
+        self.first_name = None
+        self.last_name = None
+        self.date_of_birth = None
+        self.nationality = None
+        self.residence = None
+        self.place_of_catastrophe = None
+        self.place_of_shelter = None
+        self.date_of_catastrope = None
+        # As in the old Person
+        self.time_of_registration = datetime.now()  # noqa: DTZ005
+
+
+# Dump it like the old Person, so loading the dump goes through the upgrade of old autosave files
+LegacyPerson.__module__ = "disaster_id_scan.store"
+LegacyPerson.__qualname__ = "Person"
+
+
+def fill(person, rng: random.Random, index: int):
+    person.first_name = "".join(rng.choices(string.ascii_letters, k=6))
+    person.last_name = "".join(rng.choices(string.ascii_letters, k=8))
+    person.date_of_birth = date(1940, 1, 1) + timedelta(days=rng.randrange(30000))
+    person.nationality = "D"
+    person.residence = "D"
+    person.place_of_catastrophe = "Ahrweiler"
+    person.place_of_shelter = f"Turnhalle {index % 20}"
+    # Naive like the time of registration of the persons in the store
+    person.time_of_registration = datetime(2023, 7, 15) + timedelta(seconds=index)  # noqa: DTZ001
+    return person
+
+
+def build(cls, count: int) -> list:
+    rng = random.Random(42)
+    return [fill(cls(), rng, index) for index in range(count)]
+
+
+def allocated(cls, count: int) -> int:
+    # Memory held by the persons including their values
+    gc.collect()
+    tracemalloc.start()
+    persons = build(cls, count)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del persons
+    return size
+
+
+def timed(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"{count} registrants")
+
+    legacy_size = allocated(LegacyPerson, count)
+    size = allocated(Person, count)
+    print(
+        f"  memory of the persons   plain class {legacy_size / 2 ** 20:7.1f} MiB   "
+        f"slots {size / 2 ** 20:7.1f} MiB ({legacy_size / size:.1f}x)"
+    )
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = Path(folder)
+        store = Registrants()
+        store.save_path = path
+        snapshot = store.get_savepoint_path()
+
+        legacy = build(LegacyPerson, count)
+        legacy_encode = timed(
+            lambda legacy=legacy: snapshot.write_text(jsonpickle.encode({"seq": 0, "registrants": legacy}))
+        )
+        legacy_bytes = snapshot.stat().st_size
+        # The benchmark decodes the file it has just written
+        legacy_decode = timed(lambda: jsonpickle.decode(snapshot.read_text()))  # noqa: S301
+        # Loading an old autosave includes the upgrade of the persons
+        upgrade = timed(store._load)
+        del legacy
+
+        persons = store.get_all()
+        encode = timed(lambda: store._write_snapshot(persons, count, 0))
+        new_bytes = snapshot.stat().st_size
+        decode = timed(store._load)
+
+    print(
+        f"  encode                  jsonpickle  {legacy_encode * 1000:7.0f} ms      "
+        f"JSON lines {encode * 1000:7.0f} ms ({legacy_encode / encode:.1f}x)"
+    )
+    print(
+        f"  decode                  jsonpickle  {legacy_decode * 1000:7.0f} ms      "
+        f"JSON lines {decode * 1000:7.0f} ms ({legacy_decode / decode:.1f}x)"
+    )
+    print(f"  load and upgrade an old autosave    {upgrade * 1000:7.0f} ms")
+    print(
+        f"  file size               jsonpickle  {legacy_bytes / 2 ** 20:7.1f} MiB     "
+        f"JSON lines {new_bytes / 2 ** 20:7.1f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    main()
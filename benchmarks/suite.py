@@ -0,0 +1,302 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Benchmark suite over the MRZ parsing, the store, the CSV export and the recognition of synthetic documents.
+Results are written as JSON baseline, a second run can be compared with it to find regressions.
+
+    python benchmarks/suite.py [--sizes 1000,10000,100000] [--output results.json]
+    python benchmarks/suite.py --compare benchmarks/baselines/0.3.0.json
+
+The end to end recognition (recognize/*) is only measured if easyocr is installed, the shipped baseline was
+recorded without it. Times depend on the machine, only compare results of the same machine.
+"""
+
+import argparse
+import importlib.util
+import json
+import platform
+import random
+import string
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional
+
+from disaster_id_scan.__about__ import __version__
+from disaster_id_scan.export import CSVExporter
+from disaster_id_scan.mrz import mrz_checksum, parse_mrz, parse_mrz_checked
+from disaster_id_scan.store import Person, Registrants
+from disaster_id_scan.synthetic import build_mrz, generate_set, random_identity
+
+FORMAT_NAME = "disaster-id-scan-benchmarks"
+FORMAT_VERSION = 1
+BASELINE_FOLDER = Path(__file__).parent.joinpath("baselines")
+
+FORMATS = ("TD1", "TD2", "TD3")
+# Results that got slower by more than this share are reported as regression
+REGRESSION_THRESHOLD = 0.2
+
+
+def measure(
+    function: Callable[[], object], items: int = 1, repeat: int = 7, setup: Optional[Callable[[], object]] = None
+) -> dict:
+    """
+    Best of repeat runs, the best run is the least disturbed by other processes. setup is not timed.
+    """
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return {"seconds": best, "items": items, "per_item": best / items}
+
+
+def random_persons(count: int) -> list[Person]:
+    rng = random.Random(42)
+    persons = []
+    for index in range(count):
+        person = Person()
+        person.first_name = "".join(rng.choices(string.ascii_letters, k=6))
+        person.last_name = "".join(rng.choices(string.ascii_letters, k=8))
+        person.date_of_birth = date(1940, 1, 1) + timedelta(days=rng.randrange(30000))
+        person.nationality = "D"
+        person.residence = "D"
+        person.place_of_catastrophe = "Ahrweiler"
+        person.place_of_shelter = f"Turnhalle {index % 20}"
+        person.date_of_catastrophe = date(2023, 7, 14)
+        # Naive like the time of registration of the persons in the store
+        person.time_of_registration = datetime(2023, 7, 15) + timedelta(seconds=index)  # noqa: DTZ001
+        persons.append(person)
+    return persons
+
+
+def with_errors(mrz: str, rng: random.Random, count: int = 2) -> str:
+    # Typical OCR confusions in digit fields
+    swaps = {"0": "O", "1": "I", "5": "S", "8": "B", "2": "Z"}
+    positions = [i for i, char in enumerate(mrz) if char in swaps]
+    chars = list(mrz)
+    for i in rng.sample(positions, min(count, len(positions))):
+        chars[i] = swaps[chars[i]]
+    return "".join(chars)
+
+
+def bench_checksum(results: dict):
+    rng = random.Random(42)
+    alphabet = string.ascii_uppercase + string.digits + "<"
+    fields = ["".join(rng.choice(alphabet) for _ in range(39)) for _ in range(10000)]
+    results["mrz_checksum"] = measure(lambda: [mrz_checksum(field) for field in fields], len(fields))
+
+
+def bench_parse(results: dict):
+    rng = random.Random(42)
+    for document_format in FORMATS:
+        mrzs = [build_mrz(document_format, **random_identity(rng)) for _ in range(500)]
+        results[f"parse_mrz/{document_format}"] = measure(lambda mrzs=mrzs: [parse_mrz(mrz) for mrz in mrzs], len(mrzs))
+        damaged = [with_errors(mrz, rng) for mrz in mrzs]
+        results[f"parse_mrz/{document_format}/corrected"] = measure(
+            lambda damaged=damaged: [parse_mrz_checked(mrz) for mrz in damaged], len(damaged)
+        )
+
+
+def bench_store(results: dict, sizes: list[int]):
+    for size in sizes:
+        persons = random_persons(size)
+        with tempfile.TemporaryDirectory() as folder:
+            store = Registrants()
+            store.set_path(Path(folder))
+            store.add_many(persons)
+            store.save()
+
+            def change(store=store, persons=persons):
+                # save() only writes the snapshot if there are changes
+                store.update(persons[0].person_id, persons[0])
+
+            results[f"store/save/{size}"] = measure(store.save, size, repeat=3, setup=change)
+            store.close()
+
+            def open_store(folder=folder):
+                opened = Registrants()
+                opened.set_path(Path(folder))
+                opened.close()
+
+            results[f"store/set_path/{size}"] = measure(open_store, size, repeat=3)
+
+
+def bench_export(results: dict, sizes: list[int]):
+    for size in sizes:
+        persons = random_persons(size)
+        with tempfile.TemporaryDirectory() as folder:
+            # No background writes while measuring
+            exporter = CSVExporter(Path(folder).joinpath("export.csv"), lambda persons=persons: persons, delay=3600)
+
+            def regenerate(exporter=exporter):
+                exporter.changed()
+                exporter.flush()
+
+            def clear_cache(exporter=exporter):
+                exporter._rows = {}
+
+            results[f"export/csv/{size}"] = measure(regenerate, size, repeat=3, setup=clear_cache)
+            results[f"export/csv/{size}/cached"] = measure(regenerate, size, repeat=3)
+            exporter.close()
+
+
+def bench_recognition(results: dict, count: int):
+    from disaster_id_scan.detect import locate_mrz
+    from disaster_id_scan.ocr import get_engine
+    from disaster_id_scan.preprocess import prepare_crop, prepare_frame
+
+    documents = list(generate_set(count))
+    found = 0
+    start = time.perf_counter()
+    for document in documents:
+        region = locate_mrz(document.image)
+        found += region is not None and region.document_format == document.document_format
+    seconds = time.perf_counter() - start
+    results["detect/synthetic"] = {
+        "seconds": seconds,
+        "items": count,
+        "per_item": seconds / count,
+        "rate": found / count,
+    }
+
+    found = 0
+    crops = []
+    start = time.perf_counter()
+    for document in documents:
+        region = locate_mrz(prepare_frame(document.image).image)
+        found += region is not None and region.document_format == document.document_format
+        if region is not None:
+            crops.append((document, region.crop))
+    seconds = time.perf_counter() - start
+    results["detect/synthetic/preprocessed"] = {
+        "seconds": seconds,
+        "items": count,
+        "per_item": seconds / count,
+        "rate": found / count,
+    }
+
+    # The grid recognizer alone, rate is the share of located MRZs it reads without falling back to easyocr
+    grid = get_engine(recognizer="grid")
+    grid.load()
+    crops = [(document, prepare_crop(crop)) for document, crop in crops]
+    correct = 0
+    start = time.perf_counter()
+    for document, crop in crops:
+        correct += grid.read_grid(crop) == " ".join(document.lines())
+    seconds = time.perf_counter() - start
+    if not crops:
+        print("no MRZ located, skipping the grid recognizer", file=sys.stderr)
+    else:
+        results["ocr/grid/synthetic"] = {
+            "seconds": seconds,
+            "items": len(crops),
+            "per_item": seconds / len(crops),
+            "rate": correct / len(crops),
+        }
+
+    if importlib.util.find_spec("easyocr") is None:
+        print("easyocr is not installed, skipping the end to end recognition", file=sys.stderr)
+        return
+    from disaster_id_scan.recognition import recognize_frame
+
+    for name, recognizer in (("recognize/synthetic", "easyocr"), ("recognize/synthetic/grid", "grid")):
+        engine = get_engine(recognizer=recognizer)
+        engine.warm_up().join()
+        correct = 0
+        start = time.perf_counter()
+        for document in documents:
+            person = recognize_frame(document.image, engine).person
+            correct += (
+                person is not None
+                and person.last_name.upper() == document.last_name
+                and person.date_of_birth == document.date_of_birth
+            )
+        seconds = time.perf_counter() - start
+        results[name] = {"seconds": seconds, "items": count, "per_item": seconds / count, "rate": correct / count}
+
+
+def run(sizes: list[int], documents: int) -> dict:
+    results = {}
+    for name, bench in (
+        ("checksum", lambda: bench_checksum(results)),
+        ("parse", lambda: bench_parse(results)),
+        ("store", lambda: bench_store(results, sizes)),
+        ("export", lambda: bench_export(results, sizes)),
+        ("recognition", lambda: bench_recognition(results, documents)),
+    ):
+        print(f"running {name}...", file=sys.stderr)
+        bench()
+    return {
+        "format": FORMAT_NAME,
+        "format_version": FORMAT_VERSION,
+        "version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": datetime.now().astimezone().isoformat(timespec="seconds"),
+        "results": results,
+    }
+
+
+def print_results(report: dict, baseline: Optional[dict] = None, threshold: float = REGRESSION_THRESHOLD) -> int:
+    """
+    Print the results, compared with the baseline if given. Returns the number of regressions.
+    """
+    old_results = baseline["results"] if baseline is not None else {}
+    if baseline is not None:
+        print(f"compared with {baseline['version']} ({baseline['created']})")
+    regressions = 0
+    for name, result in report["results"].items():
+        line = f"  {name:34} {result['per_item'] * 1e6:12.2f} us/item"
+        if "rate" in result:
+            line += f"  rate {result['rate']:.0%}"
+        old = old_results.get(name)
+        if old is not None:
+            ratio = result["per_item"] / old["per_item"]
+            line += f"  {ratio:5.2f}x"
+            if ratio > 1 + threshold:
+                line += "  REGRESSION"
+                regressions += 1
+            if "rate" in old and result.get("rate", 0) < old["rate"]:
+                line += f"  rate was {old['rate']:.0%}"
+                regressions += 1
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="numbers of registrants for store and export")
+    parser.add_argument("--documents", type=int, default=30, help="number of synthetic documents to recognize")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help=f"file to write the results to, default {BASELINE_FOLDER}/<version>.json unless comparing",
+    )
+    parser.add_argument("--compare", type=Path, default=None, help="baseline to compare with")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="slowdown reported as regression")
+    args = parser.parse_args()
+
+    report = run([int(size) for size in args.sizes.split(",")], args.documents)
+    baseline = json.loads(args.compare.read_text()) if args.compare is not None else None
+    regressions = print_results(report, baseline, args.threshold)
+
+    output = args.output
+    if output is None and baseline is None:
+        output = BASELINE_FOLDER.joinpath(f"{__version__}.json")
+    if output is not None:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"results written to {output}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+from collections import Counter
+from typing import Callable, Optional
+
+import cv2
+import numpy as np
+
+from disaster_id_scan.detect import to_grayscale
+from disaster_id_scan.mrz import ParsedMRZ, normalize_mrz, parse_mrz_checked
+from disaster_id_scan.recognition import RecognitionQueue
+from disaster_id_scan.store import Person
+
+# Width frames are scaled to before judging their quality
+QUALITY_WIDTH = 640
+
+
+class FrameQuality:
+    """
+    Cheap quality measures of a frame.
+    sharpness is the variance of the Laplacian, contrast the standard deviation of the gray values.
+    """
+
+    sharpness: float
+    contrast: float
+
+    def __init__(self, sharpness: float, contrast: float):
+        self.sharpness = sharpness
+        self.contrast = contrast
+
+    def __repr__(self):
+        return f"FrameQuality(sharpness={self.sharpness:.1f}, contrast={self.contrast:.1f})"
+
+
+def frame_quality(frame: np.ndarray) -> FrameQuality:
+    frame = to_grayscale(frame)
+    height, width = frame.shape[:2]
+    # Scale down first, so the score does not depend on the camera resolution and stays cheap
+    if width > QUALITY_WIDTH:
+        frame = cv2.resize(frame, (QUALITY_WIDTH, int(height * QUALITY_WIDTH / width)), interpolation=cv2.INTER_AREA)
+    sharpness = cv2.Laplacian(frame, cv2.CV_64F).var()
+    contrast = float(frame.std())
+    return FrameQuality(sharpness, contrast)
+
+
+class MRZVoter:
+    """
+    Combines MRZ readings of several frames of the same document.
+    Readings of the same length are voted on character by character, until the reading or the combined
+    result passes all check digits. Check digit correction is applied to both, a corrected MRZ is only
+    accepted with at least min_confidence.
+    """
+
+    candidates: dict[int, list[str]]
+    min_confidence: float
+
+    def __init__(self, min_confidence: float = 0.5):
+        self.candidates = {}
+        self.min_confidence = min_confidence
+
+    def reset(self):
+        self.candidates = {}
+
+    def reading_count(self) -> int:
+        return sum(len(readings) for readings in self.candidates.values())
+
+    def consensus(self, length: int) -> Optional[str]:
+        readings = self.candidates.get(length)
+        if not readings:
+            return None
+        return "".join(Counter(chars).most_common(1)[0][0] for chars in zip(*readings))
+
+    def is_accepted(self, parsed: Optional[ParsedMRZ]) -> bool:
+        return parsed is not None and parsed.valid and parsed.confidence >= self.min_confidence
+
+    def add(self, mrz: str) -> Optional[ParsedMRZ]:
+        """
+        Add a reading, returns the parsed MRZ once one passes all check digits.
+        """
+        mrz = normalize_mrz(mrz)
+        parsed = parse_mrz_checked(mrz)
+        if parsed is None:
+            return None
+        if self.is_accepted(parsed):
+            return parsed
+        # Only readings of the correct length can be aligned character by character
+        if len(mrz) != parsed.document.row_length * parsed.document.row_count:
+            return None
+        self.candidates.setdefault(len(mrz), []).append(mrz)
+        consensus = parse_mrz_checked(self.consensus(len(mrz)))
+        if self.is_accepted(consensus):
+            return consensus
+        return None
+
+
+class AutoScanner:
+    """
+    Scans documents from a stream of frames without user interaction.
+    Frames are offered with offer_frame(), blurry or flat frames are dropped before any OCR is done.
+    Promising frames are recognized in the background, collect() returns the person once the votes over
+    the readings give a MRZ with valid check digits. Failed recognitions are passed to on_error, after
+    max_errors of them in a row the scanner stops until reset().
+    """
+
+    min_sharpness: float
+    min_contrast: float
+    max_readings: int
+    max_errors: int
+    on_error: Optional[Callable[[Exception], None]]
+    stopped: bool
+    last_error: Optional[Exception]
+    errors_in_row: int
+    frames_seen: int
+    frames_rejected: int
+    frames_recognized: int
+    last_quality: Optional[FrameQuality]
+
+    def __init__(
+        self,
+        recognition: Optional[RecognitionQueue] = None,
+        *,
+        min_sharpness: float = 100.0,
+        min_contrast: float = 20.0,
+        max_readings: int = 8,
+        max_errors: int = 3,
+        on_error: Optional[Callable[[Exception], None]] = None,
+    ):
+        self.recognition = recognition if recognition is not None else RecognitionQueue()
+        self.min_sharpness = min_sharpness
+        self.min_contrast = min_contrast
+        # After this many readings without result, start over, the document may have been replaced
+        self.max_readings = max_readings
+        # The OCR failing again and again, e.g. because the models can not be loaded, stops the scan
+        self.max_errors = max_errors
+        self.on_error = on_error
+        self.stopped = False
+        self.last_error = None
+        self.errors_in_row = 0
+        self.voter = MRZVoter()
+        self.frames_seen = 0
+        self.frames_rejected = 0
+        self.frames_recognized = 0
+        self.last_quality = None
+
+    def is_promising(self, quality: FrameQuality) -> bool:
+        return quality.sharpness >= self.min_sharpness and quality.contrast >= self.min_contrast
+
+    def offer_frame(self, frame: np.ndarray, quality: Optional[FrameQuality] = None) -> bool:
+        """
+        Offer a frame of the live stream, returns True if it was queued for recognition.
+        Frames are skipped while the previous one is still being recognized. The quality is computed if not
+        given.
+        """
+        self.frames_seen += 1
+        if self.stopped or self.recognition.current_job() is not None:
+            return False
+        self.last_quality = quality if quality is not None else frame_quality(frame)
+        if not self.is_promising(self.last_quality):
+            self.frames_rejected += 1
+            return False
+        self.frames_recognized += 1
+        # Reading the full frame is too slow for a continuous scan, frames without MRZ region are skipped
+        self.recognition.submit(frame, fallback=False)
+        return True
+
+    def collect(self) -> Optional[Person]:
+        """
+        Fetch finished recognitions, returns the person once a MRZ with valid check digits was read.
+        """
+        parsed = self.collect_mrz()
+        return parsed.get_person() if parsed is not None else None
+
+    def collect_mrz(self) -> Optional[ParsedMRZ]:
+        """
+        Like collect(), but returns the parsed MRZ.
+        """
+        for _, result, error in self.recognition.poll():
+            if error is not None:
+                self._failed(error)
+                if self.stopped:
+                    return None
+                continue
+            self.errors_in_row = 0
+            if result.parsed is None:
+                continue
+            if result.cached and self.voter.reading_count() > 0:
+                # The same reading again, it would outvote the readings of other frames
+                continue
+            # Vote on the readings as they are, the correction is repeated on the consensus
+            parsed = self.voter.add(result.parsed.original)
+            if parsed is not None:
+                self.voter.reset()
+                return parsed
+            if self.voter.reading_count() >= self.max_readings:
+                self.voter.reset()
+        return None
+
+    def _failed(self, error: Exception):
+        self.last_error = error
+        self.errors_in_row += 1
+        if self.on_error is not None:
+            self.on_error(error)
+        if self.errors_in_row >= self.max_errors:
+            self.recognition.cancel()
+            self.voter.reset()
+            self.stopped = True
+
+    def reset(self):
+        self.recognition.cancel()
+        self.voter.reset()
+        self.stopped = False
+        self.errors_in_row = 0
+
+    def shutdown(self):
+        self.recognition.shutdown()
@@ -0,0 +1,267 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional, Sequence
+
+from disaster_id_scan.names import normalize_name
+from disaster_id_scan.ocr import DEFAULT_LANGUAGES
+from disaster_id_scan.preprocessing import DEFAULT_PREPROCESSING, Preprocessing
+from disaster_id_scan.store import Person, Registrants
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+
+# Files in the data folder that keep track of batch runs
+MANIFEST_FILENAME = "disaster-id-scan_batch_processed.jsonl"
+REPORT_FILENAME = "disaster-id-scan_batch_report.csv"
+
+
+class BatchItem:
+    """
+    Result of processing one image in a batch.
+    """
+
+    path: str
+    person: Optional[Person]
+    mrz: Optional[str]
+    confidence: float
+    error: Optional[str]
+    seconds: float
+
+    def __init__(self, path: str):
+        self.path = path
+        self.person = None
+        self.mrz = None
+        self.confidence = 0.0
+        self.error = None
+        self.seconds = 0.0
+
+
+class BatchSummary:
+    """
+    Counts of a batch run. Skipped are images of an earlier run and persons that are already registered.
+    """
+
+    processed: int
+    added: int
+    failed: int
+    skipped: int
+    duplicates: int
+    seconds: float
+
+    def __init__(self):
+        self.processed = 0
+        self.added = 0
+        self.failed = 0
+        self.skipped = 0
+        # Added persons that were likely registered before
+        self.duplicates = 0
+        self.seconds = 0.0
+
+    def images_per_second(self) -> float:
+        return self.processed / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        return (
+            f"Processed {self.processed} images ({self.images_per_second():.2f} images/s), "
+            f"added {self.added} ({self.duplicates} possible duplicates), failed {self.failed}, "
+            f"skipped {self.skipped}"
+        )
+
+
+def find_images(directory: Path) -> list[Path]:
+    return sorted(path for path in directory.rglob("*") if path.is_file() and path.suffix.lower() in IMAGE_SUFFIXES)
+
+
+def _file_key(path: Path) -> dict:
+    # An image is processed again if it was changed since the last run
+    stat = path.stat()
+    return {"path": str(path.resolve()), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+class BatchManifest:
+    """
+    Append only record of the images that were already processed, so a re-run can skip them.
+    """
+
+    path: Path
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        if path.exists():
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["path"]] = entry
+        self._file = None
+
+    def is_processed(self, image: Path, *, include_failed: bool = True) -> bool:
+        key = _file_key(image)
+        entry = self.entries.get(key["path"])
+        if entry is None or entry["size"] != key["size"] or entry["mtime"] != key["mtime"]:
+            return False
+        return include_failed or entry["ok"]
+
+    def record(self, image: Path, *, ok: bool):
+        entry = _file_key(image)
+        entry["ok"] = ok
+        self.entries[entry["path"]] = entry
+        if self._file is None:
+            self._file = open(self.path, "a")
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# OCR engine and preprocessing of a worker process, set by _init_worker, every worker loads its own models once
+_worker = {"engine": None, "preprocessing": DEFAULT_PREPROCESSING}
+
+
+def _init_worker(languages: Sequence[str], preprocessing: Preprocessing, recognizer: str):
+    import cv2
+
+    from disaster_id_scan.ocr import get_engine
+
+    # Every process works on one image at a time, parallelism comes from the number of processes
+    cv2.setNumThreads(1)
+    try:
+        import torch
+
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    _worker["engine"] = get_engine(languages, recognizer=recognizer)
+    _worker["preprocessing"] = preprocessing
+    # Load the models now instead of on the first image, a failure is raised on the first image
+    _worker["engine"].warm_up().join()
+
+
+def _process_image(path: str) -> BatchItem:
+    import cv2
+
+    from disaster_id_scan.recognition import recognize_frame
+
+    item = BatchItem(path)
+    start = time.perf_counter()
+    try:
+        frame = cv2.imread(path)
+        if frame is None:
+            item.error = "image can not be read"
+        else:
+            result = recognize_frame(frame, _worker["engine"], preprocessing=_worker["preprocessing"])
+            if result.parsed is None:
+                item.error = "no MRZ found"
+            else:
+                item.mrz = result.mrz
+                item.confidence = result.parsed.confidence
+                if result.parsed.valid:
+                    item.person = result.person
+                else:
+                    item.error = "check digits do not match: " + ", ".join(result.parsed.failed_checks)
+    except Exception as e:
+        item.error = f"{type(e).__name__}: {e}"
+    item.seconds = time.perf_counter() - start
+    return item
+
+
+def _same_identity(a: Person, b: Person) -> bool:
+    return (
+        normalize_name(a.last_name) == normalize_name(b.last_name)
+        and normalize_name(a.first_name) == normalize_name(b.first_name)
+        and a.date_of_birth == b.date_of_birth
+        and a.nationality == b.nationality
+    )
+
+
+def run_batch(
+    directory: Path,
+    store: Registrants,
+    *,
+    workers: Optional[int] = None,
+    languages: Sequence[str] = DEFAULT_LANGUAGES,
+    retry_failed: bool = False,
+    progress: Optional[Callable[[BatchItem], None]] = None,
+    preprocessing: Preprocessing = DEFAULT_PREPROCESSING,
+    recognizer: str = "easyocr",
+) -> BatchSummary:
+    """
+    Recognize the MRZ in all images below directory and add the persons to the store.
+    Images are processed by a pool of worker processes, each with its own OCR engine. Images that were
+    processed in an earlier run are skipped (failed ones are retried with retry_failed), images without
+    valid MRZ are written to the failure report in the data folder of the store. A person with the same
+    names, date of birth and nationality as a registrant is not added again, so an image whose person was
+    added right before a crash, but not yet recorded as processed, does not add the person twice.
+    """
+    summary = BatchSummary()
+    manifest = BatchManifest(store.save_path.joinpath(MANIFEST_FILENAME))
+    try:
+        images = []
+        for image in find_images(directory):
+            if manifest.is_processed(image, include_failed=not retry_failed):
+                summary.skipped += 1
+            else:
+                images.append(image)
+        if not images:
+            return summary
+
+        report_path = store.save_path.joinpath(REPORT_FILENAME)
+        new_report = not report_path.exists()
+        start = time.perf_counter()
+        # Spawn fresh processes, forking a process with loaded models and threads is not safe
+        context = multiprocessing.get_context("spawn")
+        workers = workers or os.cpu_count() or 1
+        with open(report_path, "a", newline="") as report_file, ProcessPoolExecutor(
+            min(workers, len(images)),
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(tuple(languages), preprocessing, recognizer),
+        ) as pool:
+            report = csv.DictWriter(report_file, fieldnames=["Zeit", "Bild", "Fehler", "MRZ", "Konfidenz"])
+            if new_report:
+                report.writeheader()
+            # Results arrive in order and are stored while the other images are still being processed
+            for image, item in zip(images, pool.map(_process_image, [str(image) for image in images])):
+                summary.processed += 1
+                if item.person is not None:
+                    duplicates = store.find_duplicates(item.person)
+                    if any(_same_identity(item.person, person) for _, person, _ in duplicates):
+                        summary.skipped += 1
+                    else:
+                        if duplicates:
+                            summary.duplicates += 1
+                        # Every person is journaled right away, a crash does not lose the batch so far
+                        store.add(item.person)
+                        summary.added += 1
+                else:
+                    summary.failed += 1
+                    report.writerow(
+                        {
+                            "Zeit": datetime.now().astimezone().strftime("%d.%m.%Y %H:%M:%S"),
+                            "Bild": item.path,
+                            "Fehler": item.error,
+                            "MRZ": item.mrz,
+                            "Konfidenz": f"{item.confidence:.2f}",
+                        }
+                    )
+                    report_file.flush()
+                manifest.record(image, ok=item.person is not None)
+                if progress is not None:
+                    progress(item)
+    finally:
+        # Closed on errors and Ctrl-C as well
+        manifest.close()
+    summary.seconds = time.perf_counter() - start
+    return summary
@@ -0,0 +1,305 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Optional
+
+# Camera indexes that are tried where the devices can not be listed
+MAX_CAMERAS = 10
+# Seconds a camera may take to open and deliver a frame while probing
+PROBE_TIMEOUT = 5.0
+
+CACHE_PATH = Path(os.environ.get("XDG_CACHE_HOME", Path.home().joinpath(".cache"))).joinpath(
+    "disaster-id-scan", "cameras.json"
+)
+
+# Resolutions tried one by one where the supported modes can not be queried
+POSSIBLE_RESOLUTIONS = [
+    (640, 480),
+    (1024, 600),
+    (1024, 640),
+    (960, 720),
+    (1024, 768),
+    (1024, 800),
+    (1280, 720),
+    (1280, 768),
+    (1280, 800),
+    (1024, 1024),
+    (1080, 1200),
+    (1280, 1024),
+    (1440, 1024),
+    (1440, 1080),
+    (1600, 1024),
+    (1680, 1050),
+    (1600, 1200),
+    (1600, 1280),
+    (1920, 1080),
+    (2048, 1080),
+    (1920, 1200),
+    (2048, 1152),
+    (1920, 1280),
+    (2400, 1080),
+    (1800, 1440),
+    (2048, 1280),
+    (1920, 1400),
+    (2520, 1080),
+    (1920, 1440),
+    (2560, 1080),
+    (2160, 1440),
+    (2560, 1440),
+    (2560, 1600),
+    (2880, 1440),
+    (2960, 1440),
+    (2560, 1700),
+    (2560, 1800),
+    (2560, 1920),
+]
+
+_V4L2_SIZE = re.compile(r"Size: Discrete (\d+)x(\d+)")
+
+
+class CameraInfo:
+    """
+    Capabilities of a camera, as probed or read from the cache.
+    key identifies the device across restarts, where possible independent of its index.
+    """
+
+    index: int
+    key: str
+    name: Optional[str]
+    resolutions: list[tuple[int, int]]
+
+    def __init__(self, index: int, key: str, name: Optional[str] = None, resolutions: Optional[list] = None):
+        self.index = index
+        self.key = key
+        self.name = name
+        self.resolutions = [tuple(resolution) for resolution in resolutions or []]
+
+    def best_resolution(self) -> Optional[tuple[int, int]]:
+        return max(self.resolutions, key=lambda size: size[0] * size[1]) if self.resolutions else None
+
+    def label(self) -> str:
+        return f"{self.index}: {self.name}" if self.name else str(self.index)
+
+    def to_dict(self) -> dict:
+        return {"index": self.index, "key": self.key, "name": self.name, "resolutions": self.resolutions}
+
+    @staticmethod
+    def from_dict(data: dict) -> "CameraInfo":
+        return CameraInfo(data["index"], data["key"], data.get("name"), data.get("resolutions"))
+
+    def __repr__(self):
+        return f"CameraInfo({self.label()}, {len(self.resolutions)} resolutions)"
+
+
+def list_devices() -> Optional[dict[int, tuple[str, Optional[str]]]]:
+    """
+    List the video devices without opening them, as index -> (key, name).
+    Only possible on Linux, returns None elsewhere.
+    """
+    sysfs = Path("/sys/class/video4linux")
+    if not sys.platform.startswith("linux") or not sysfs.is_dir():
+        return None
+    devices = {}
+    for device in sysfs.glob("video*"):
+        try:
+            index = int(device.name[len("video") :])
+            name = device.joinpath("name").read_text().strip()
+            # The physical device (USB port) and the node number within it stay the same when the /dev/video
+            # numbering changes, the node number tells apart the capture and metadata nodes of one camera
+            node = device.joinpath("index").read_text().strip() if device.joinpath("index").exists() else ""
+            key = f"{os.path.realpath(device.joinpath('device'))}|{name}|{node}"
+        except (ValueError, OSError):
+            continue
+        devices[index] = (key, name)
+    return devices
+
+
+def query_resolutions(index: int) -> Optional[list[tuple[int, int]]]:
+    """
+    Ask the driver for the supported frame sizes (v4l2-ctl on Linux), None if not possible.
+    """
+    v4l2_ctl = shutil.which("v4l2-ctl")
+    if v4l2_ctl is None:
+        return None
+    try:
+        # The executable is found on the PATH, the device path is built from an index
+        output = subprocess.run(  # noqa: S603
+            [v4l2_ctl, "-d", f"/dev/video{index}", "--list-formats-ext"],
+            check=False,
+            capture_output=True,
+            text=True,
+            timeout=PROBE_TIMEOUT,
+        ).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    resolutions = sorted({(int(width), int(height)) for width, height in _V4L2_SIZE.findall(output)})
+    return resolutions or None
+
+
+def probe_resolutions(cap) -> list[tuple[int, int]]:
+    """
+    Find the supported resolutions of an open capture by trying POSSIBLE_RESOLUTIONS.
+    """
+    import cv2
+
+    resolutions = []
+    for width, height in POSSIBLE_RESOLUTIONS:
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if cap.get(cv2.CAP_PROP_FRAME_WIDTH) == width and cap.get(cv2.CAP_PROP_FRAME_HEIGHT) == height:
+            resolutions.append((width, height))
+    return resolutions
+
+
+def probe_camera(index: int, key: Optional[str] = None, name: Optional[str] = None) -> Optional[CameraInfo]:
+    """
+    Open a camera, check that it delivers frames and find its resolutions. None if it is no working camera.
+    """
+    import cv2
+
+    cap = cv2.VideoCapture(index)
+    try:
+        if not cap.isOpened() or not cap.read()[0]:
+            return None
+        resolutions = query_resolutions(index)
+        if resolutions is None:
+            resolutions = probe_resolutions(cap)
+    finally:
+        cap.release()
+    return CameraInfo(index, key or f"index|{index}", name, resolutions)
+
+
+def probe_cameras(
+    devices: dict[int, tuple[str, Optional[str]]],
+    timeout: float = PROBE_TIMEOUT,
+    errors: Optional[list[str]] = None,
+) -> list[CameraInfo]:
+    """
+    Probe all devices at the same time, cameras that do not answer within timeout are left out.
+    Cameras that fail are left out as well, the reasons are appended to errors.
+    """
+    results = {}
+
+    def probe(index: int, key: str, name: Optional[str]):
+        try:
+            results[index] = probe_camera(index, key, name)
+        except Exception as e:
+            if errors is not None:
+                errors.append(f"Probing camera {index} failed: {e}")
+
+    # Daemon threads, a hanging driver call must not keep the program from exiting
+    threads = [
+        threading.Thread(target=probe, args=(index, key, name), name=f"camera-probe-{index}", daemon=True)
+        for index, (key, name) in devices.items()
+    ]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(deadline - time.monotonic(), 0))
+    return sorted((info for info in list(results.values()) if info is not None), key=lambda info: info.index)
+
+
+class CameraRegistry:
+    """
+    Known cameras and their resolutions, cached on disk per device.
+    cameras() answers from the cache right away. refresh() probes in the background, on Linux only when the
+    set of video devices changed since the cache was written, elsewhere always, as the devices can not be
+    listed without opening them. Problems of the last refresh are kept in errors.
+    """
+
+    cache_path: Path
+    errors: list[str]
+
+    def __init__(self, cache_path: Path = CACHE_PATH):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._cameras: list[CameraInfo] = []
+        self._device_keys: Optional[list[str]] = None
+        self.errors = []
+        self._load_cache()
+
+    def _load_cache(self):
+        try:
+            data = json.loads(self.cache_path.read_text())
+            self._cameras = [CameraInfo.from_dict(camera) for camera in data["cameras"]]
+            self._device_keys = data.get("device_keys")
+        except (OSError, ValueError, KeyError):
+            self._cameras = []
+            self._device_keys = None
+
+    def _save_cache(self):
+        data = {"cameras": [camera.to_dict() for camera in self._cameras], "device_keys": self._device_keys}
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(data))
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            # Without cache the cameras are probed again on the next start
+            self.errors.append(f"Could not write camera cache: {e}")
+
+    def cameras(self) -> list[CameraInfo]:
+        with self._lock:
+            return list(self._cameras)
+
+    def get(self, index: int) -> Optional[CameraInfo]:
+        return next((camera for camera in self.cameras() if camera.index == index), None)
+
+    def needs_probe(self, devices: Optional[dict]) -> bool:
+        if devices is None or self._device_keys is None:
+            return True
+        return sorted(key for key, _ in devices.values()) != self._device_keys
+
+    def refresh(self, *, force: bool = False, callback: Optional[Callable[[list[CameraInfo]], None]] = None) -> Future:
+        """
+        Probe the cameras in a background thread if needed. The returned future resolves to the cameras,
+        callback is called from the background thread.
+        """
+        future = Future()
+        devices = list_devices()
+        if not force and not self.needs_probe(devices):
+            future.set_result(self.cameras())
+            return future
+
+        if devices is None:
+            devices_to_probe = {index: (f"index|{index}", None) for index in range(MAX_CAMERAS)}
+            kept = []
+        else:
+            # Cameras that are still present keep their cached capabilities, only new devices are probed
+            known = {} if force else {camera.key: camera for camera in self.cameras()}
+            devices_to_probe = {index: (key, name) for index, (key, name) in devices.items() if key not in known}
+            # A renumbered camera is opened under its current index
+            kept = [
+                CameraInfo(index, key, name, known[key].resolutions)
+                for index, (key, name) in devices.items()
+                if key in known
+            ]
+
+        def run():
+            errors = []
+            try:
+                probed = sorted(kept + probe_cameras(devices_to_probe, errors=errors), key=lambda camera: camera.index)
+                with self._lock:
+                    self.errors = errors
+                    self._cameras = probed
+                    self._device_keys = sorted(key for key, _ in devices.values()) if devices is not None else None
+                    self._save_cache()
+                if callback is not None:
+                    callback(probed)
+                future.set_result(probed)
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="camera-refresh", daemon=True).start()
+        return future
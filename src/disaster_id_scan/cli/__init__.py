@@ -1,26 +1,335 @@
 # SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
 #
 # SPDX-License-Identifier: EUPL-1.2
+import csv
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
 import click
 
+from disaster_id_scan import profiling
 from disaster_id_scan.__about__ import __version__
-from disaster_id_scan.id_scanner import id_scanner
-from disaster_id_scan.ui import start_gui
+from disaster_id_scan.duplicates import MIN_DUPLICATE_SCORE
+from disaster_id_scan.ocr import DEFAULT_LANGUAGES, RECOGNIZERS
+from disaster_id_scan.preprocessing import PREPROCESS_STEPS, Preprocessing
+from disaster_id_scan.store import DEFAULT_DATA_PATH, STORE_BACKENDS, create_registrants
+
+# Modules depending on OpenCV, the OCR models or Tk are imported by the commands that need them, so the CLI
+# starts fast
 
 
 @click.group(context_settings={"help_option_names": ["-h", "--help"]}, invoke_without_command=True)
 @click.version_option(version=__version__, prog_name="Disaster ID Scan")
-def disaster_id_scan():
-    start_gui()
+@click.option(
+    "--lang",
+    "-l",
+    "languages",
+    multiple=True,
+    default=DEFAULT_LANGUAGES,
+    show_default=True,
+    help="Language of the OCR models, can be given multiple times",
+)
+@click.option(
+    "--recognizer",
+    type=click.Choice(RECOGNIZERS),
+    default="easyocr",
+    show_default=True,
+    help="Recognizer of the MRZ, grid reads the character grid in milliseconds and falls back to easyocr",
+)
+@click.option(
+    "--store",
+    type=click.Choice(STORE_BACKENDS),
+    default="json",
+    show_default=True,
+    help="Storage of the registrants, an existing autosave file is migrated to sqlite on first use",
+)
+@click.option(
+    "--preview-fps",
+    type=click.FloatRange(1, 60),
+    default=15,
+    show_default=True,
+    help="Frames per second of the camera preview, lower values leave more CPU to the OCR",
+)
+@click.option(
+    "--skip-preprocess",
+    "skip_steps",
+    multiple=True,
+    type=click.Choice(PREPROCESS_STEPS),
+    help="Preprocessing step to leave out before the OCR, can be given multiple times",
+)
+@click.option(
+    "--sync-folder",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Shared folder to exchange the registrations with other stations",
+)
+@click.option(
+    "--peer",
+    "peers",
+    multiple=True,
+    help="URL of another station to fetch its registrations from, can be given multiple times",
+)
+@click.option(
+    "--listen",
+    default=None,
+    help="[HOST:]PORT to serve the registrations of this station on, without HOST only this computer can connect",
+)
+@click.option(
+    "--sync-token",
+    envvar="DISASTER_ID_SCAN_SYNC_TOKEN",
+    default=None,
+    help="Secret shared by all stations, needed for --peer and --listen",
+)
+@click.option("--profile", is_flag=True, help="Time the stages of the intake and print p50/p95 at exit")
+@click.option(
+    "--profile-output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Write the timings as JSON to this file at exit, implies --profile",
+)
+@click.pass_context
+def disaster_id_scan(
+    ctx,
+    *,
+    languages,
+    recognizer,
+    store,
+    preview_fps,
+    skip_steps,
+    sync_folder,
+    peers,
+    listen,
+    sync_token,
+    profile,
+    profile_output,
+):
+    ctx.ensure_object(dict)
+    if profile or profile_output is not None:
+        profiling.enable()
+        ctx.call_on_close(lambda: report_profile(profile_output))
+    ctx.obj["languages"] = languages
+    ctx.obj["recognizer"] = recognizer
+    ctx.obj["store"] = store
+    ctx.obj["preprocessing"] = Preprocessing(skip_steps)
+    sync_options = None
+    if sync_folder is not None or peers or listen is not None:
+        if (peers or listen is not None) and not sync_token:
+            message = "Give --sync-token to sync with --peer or --listen"
+            raise click.UsageError(message)
+        sync_options = {"folder": sync_folder, "peers": peers, "listen": listen, "token": sync_token}
+    ctx.obj["sync"] = sync_options
+    # Only start the GUI if no subcommand is given
+    if ctx.invoked_subcommand is None:
+        from disaster_id_scan.ui import start_gui
+
+        start_gui(
+            languages,
+            store,
+            preview_fps=preview_fps,
+            sync_options=sync_options,
+            preprocessing=ctx.obj["preprocessing"],
+            recognizer=recognizer,
+        )
+
+
+def report_profile(output: Optional[Path]):
+    click.echo(profiling.PROFILER.report(), err=True)
+    if output is not None:
+        profiling.PROFILER.dump(output)
 
 
 # Command to start id scanner as cli application
 @click.command()
-@click.option('--cam', '-c', default=0, help='Camera ID to use, default 0')
-def scan(cam):
-    """Starts ID scanner"""
-    id_scanner(cam)
+@click.option("--cam", "-c", default=0, help="Camera ID to use, default 0")
+@click.option(
+    "--mode",
+    "-m",
+    type=click.Choice(["trigger", "continuous"]),
+    default="trigger",
+    show_default=True,
+    help="Scan a document on every enter, or scan continuously",
+)
+@click.option(
+    "--data",
+    "-d",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Data folder to add the scanned persons to, default only print them",
+)
+@click.option(
+    "--cooldown",
+    type=click.FloatRange(0),
+    default=10.0,
+    show_default=True,
+    help="Seconds the same document is not reported again in continuous mode",
+)
+@click.pass_context
+def scan(ctx, cam, mode, data, cooldown):
+    """Scans documents without GUI and prints them as JSON lines"""
+    from disaster_id_scan.cameras import CameraRegistry
+    from disaster_id_scan.id_scanner import id_scanner
+
+    camera = CameraRegistry().get(cam)
+    resolution = camera.best_resolution() if camera is not None else None
+    store = None
+    if data is not None:
+        data.mkdir(parents=True, exist_ok=True)
+        store = create_registrants(ctx.obj["store"])
+        store.set_path(data)
+    try:
+        stats = id_scanner(
+            cam,
+            ctx.obj["languages"],
+            mode,
+            store,
+            resolution=resolution,
+            cooldown=cooldown,
+            preprocessing=ctx.obj["preprocessing"],
+            recognizer=ctx.obj["recognizer"],
+        )
+    finally:
+        if store is not None:
+            store.close()
+    click.echo(str(stats), err=True)
+
+
+# Command to import a folder of ID photos
+@click.command()
+@click.argument("directory", type=click.Path(exists=True, file_okay=False, path_type=Path))
+@click.option(
+    "--data",
+    "-d",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=DEFAULT_DATA_PATH,
+    show_default=True,
+    help="Data folder to store the registrants in",
+)
+@click.option("--workers", "-w", type=int, default=None, help="Number of worker processes, default number of CPUs")
+@click.option("--retry-failed", is_flag=True, help="Process images again that failed in an earlier run")
+@click.pass_context
+def batch(ctx, directory, data, workers, retry_failed):
+    """Recognizes all ID photos in DIRECTORY and adds the persons"""
+    from disaster_id_scan.batch import run_batch
+
+    data.mkdir(parents=True, exist_ok=True)
+    store = create_registrants(ctx.obj["store"])
+    store.set_path(data)
+
+    def progress(item):
+        status = "ok" if item.person is not None else item.error
+        click.echo(f"{item.path}: {status} ({item.seconds:.2f}s)")
+
+    try:
+        summary = run_batch(
+            directory,
+            store,
+            workers=workers,
+            languages=ctx.obj["languages"],
+            retry_failed=retry_failed,
+            progress=progress,
+            preprocessing=ctx.obj["preprocessing"],
+            recognizer=ctx.obj["recognizer"],
+        )
+    finally:
+        store.close()
+    click.echo(str(summary))
+
+
+# Command to report likely duplicate registrations
+@click.command()
+@click.argument("data", type=click.Path(exists=True, path_type=Path))
+@click.option(
+    "--min-score",
+    type=click.FloatRange(0, 1),
+    default=MIN_DUPLICATE_SCORE,
+    show_default=True,
+    help="Minimum similarity of two registrations to be reported",
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="CSV file to write the report to, default stdout",
+)
+@click.pass_context
+def dedupe(ctx, data, min_score, output):
+    """Reports likely duplicates in DATA (data folder or its autosave file)"""
+    store = create_registrants(ctx.obj["store"])
+    if data.is_file():
+        # Only the files of a data folder can be read, together with the rest of the folder
+        names = {store.json_filename, getattr(store, "db_filename", store.json_filename)}
+        if data.name not in names:
+            message = f"Give a data folder or one of its files: {', '.join(sorted(names))}"
+            raise click.BadParameter(message, param_hint="DATA")
+        data = data.parent
+    # The data folder is only read
+    store.load(data)
+    pairs = store.find_all_duplicates(min_score)
+    fields = ["Aehnlichkeit"]
+    for number in (1, 2):
+        fields += [f"ID {number}", f"Name {number}", f"Vorname {number}", f"geb {number}", f"Unterkunft {number}"]
+    out = open(output, "w", newline="") if output is not None else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(fields)
+        for first_id, second_id, score in pairs:
+            row = [f"{score:.2f}"]
+            for person_id in (first_id, second_id):
+                person = store.get_person_by_id(person_id)
+                row += [
+                    person_id,
+                    person.last_name,
+                    person.first_name,
+                    person.date_of_birth.strftime("%d.%m.%Y") if person.date_of_birth is not None else None,
+                    person.place_of_shelter,
+                ]
+            writer.writerow(row)
+    finally:
+        if output is not None:
+            out.close()
+        store.close()
+    click.echo(f"{len(pairs)} possible duplicates", err=True)
+
+
+# Command to keep a data folder in sync with other stations
+@click.command()
+@click.argument("data", type=click.Path(file_okay=False, path_type=Path))
+@click.option(
+    "--interval", type=click.FloatRange(0.1), default=5.0, show_default=True, help="Seconds between two syncs"
+)
+@click.option("--once", is_flag=True, help="Sync once and exit")
+@click.pass_context
+def sync(ctx, data, interval, once):
+    """Exchanges the registrations in DATA with other stations"""
+    from disaster_id_scan.sync import SyncSession
+
+    options = ctx.obj["sync"]
+    if options is None:
+        message = "Give --sync-folder, --peer or --listen before the command"
+        raise click.UsageError(message)
+    data.mkdir(parents=True, exist_ok=True)
+    store = create_registrants(ctx.obj["store"])
+    store.set_path(data)
+    session = SyncSession(store, **options)
+    try:
+        click.echo(f"Station {session.manager.station}: {session.manager.sync()}", err=True)
+        while not once:
+            time.sleep(interval)
+            result = session.manager.sync()
+            if result.sent or result.received or result.errors:
+                click.echo(str(result), err=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.close()
+        store.close()
 
 
 # Register commands
 disaster_id_scan.add_command(scan)
+disaster_id_scan.add_command(batch)
+disaster_id_scan.add_command(dedupe)
+disaster_id_scan.add_command(sync)
@@ -0,0 +1,192 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+from typing import Optional
+
+import cv2
+import numpy as np
+
+# Width the frame is scaled to before searching the MRZ, detection does not need full resolution
+DETECTION_WIDTH = 800
+
+# Size of a character cell in the rectified crop
+CHAR_WIDTH = 20
+LINE_HEIGHT = 36
+# Blank border around the characters in the rectified crop
+CROP_MARGIN = 12
+
+# Characters per line and number of lines of the document formats
+MRZ_FORMATS = {
+    "TD1": (30, 3),
+    "TD2": (36, 2),
+    "TD3": (44, 2),
+}
+# Two lines of 44 characters are wider in relation to their height than two lines of 36 characters, the
+# band of a TD2 is narrower than this
+MAX_TD2_ASPECT = 11
+# A MRZ band is long and flat
+MIN_BAND_ASPECT = 4
+MAX_BAND_ASPECT = 25
+
+
+class MRZRegion:
+    """
+    Location of a machine readable zone in an image.
+    The bounding box is given in coordinates of the original image, the crop is rotated to be horizontal
+    and scaled to the character grid of the guessed document format.
+    """
+
+    bbox: tuple[int, int, int, int]
+    corners: np.ndarray
+    crop: np.ndarray
+    document_format: str
+
+    def __init__(self, bbox: tuple[int, int, int, int], corners: np.ndarray, crop: np.ndarray, document_format: str):
+        self.bbox = bbox
+        self.corners = corners
+        self.crop = crop
+        self.document_format = document_format
+
+    def __repr__(self):
+        crop_h, crop_w = self.crop.shape[:2]
+        return f"MRZRegion(bbox={self.bbox}, format={self.document_format}, crop={crop_w}x{crop_h})"
+
+
+def guess_format(line_count: int, aspect_ratio: float) -> str:
+    """
+    Guess the document format from the number of text lines and the aspect ratio (width / height) of the band.
+    TD1 has three lines of 30 characters, TD2 and TD3 have two lines of 36 or 44 characters.
+    """
+    if line_count >= MRZ_FORMATS["TD1"][1]:
+        return "TD1"
+    if aspect_ratio < MAX_TD2_ASPECT:
+        return "TD2"
+    return "TD3"
+
+
+def count_lines(strip: np.ndarray) -> int:
+    """
+    Count the text lines of a horizontal grayscale strip with dark text using a horizontal projection.
+    """
+    _, binary = cv2.threshold(strip, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    profile = binary.sum(axis=1)
+    filled = profile > 0.25 * profile.max() if profile.max() > 0 else profile > 0
+    # Count runs of filled rows that are high enough to be a line of text
+    min_height = max(2, strip.shape[0] // 12)
+    lines = 0
+    run = 0
+    for row in filled:
+        if row:
+            run += 1
+        else:
+            if run >= min_height:
+                lines += 1
+            run = 0
+    if run >= min_height:
+        lines += 1
+    return lines
+
+
+def to_grayscale(image: np.ndarray) -> np.ndarray:
+    # Color images have a channel axis
+    if image.ndim == 3:  # noqa: PLR2004
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def order_corners(points: np.ndarray) -> np.ndarray:
+    # Order as top left, top right, bottom right, bottom left
+    s = points.sum(axis=1)
+    d = np.diff(points, axis=1).ravel()
+    return np.array(
+        [points[np.argmin(s)], points[np.argmin(d)], points[np.argmax(s)], points[np.argmax(d)]], dtype=np.float32
+    )
+
+
+def warp_strip(image: np.ndarray, corners: np.ndarray, width: int, height: int) -> np.ndarray:
+    """
+    Warp the quadrilateral given by corners (top left, top right, bottom right, bottom left) to a
+    horizontal grayscale strip of the given size.
+    """
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(corners.astype(np.float32), target)
+    return cv2.warpPerspective(
+        to_grayscale(image), matrix, (width, height), flags=cv2.INTER_AREA, borderMode=cv2.BORDER_REPLICATE
+    )
+
+
+def grid_size(document_format: str) -> tuple[int, int]:
+    """
+    Size (width, height) of the rectified crop for the character grid of the document format.
+    """
+    chars, lines = MRZ_FORMATS[document_format]
+    return chars * CHAR_WIDTH + 2 * CROP_MARGIN, lines * LINE_HEIGHT + 2 * CROP_MARGIN
+
+
+def locate_mrz(image: np.ndarray) -> Optional[MRZRegion]:
+    """
+    Search the machine readable zone in the image.
+    Dark text on light background is emphasized with a morphological blackhat, characters are joined to
+    lines with a horizontal gradient and closing, then the widest band with the shape of a MRZ is chosen.
+    Returns None if no MRZ like band is found.
+    """
+    gray = to_grayscale(image)
+    height, width = gray.shape[:2]
+    scale = min(1.0, DETECTION_WIDTH / width)
+    if scale < 1.0:
+        small = cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    else:
+        small = gray
+    small_w = small.shape[1]
+
+    # Kernel sizes relative to the image width, tuned for an 800px wide frame
+    unit = max(1, small_w // 200)
+    rect_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (13 * unit, 5 * unit))
+    square_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (21 * unit, 21 * unit))
+
+    small = cv2.GaussianBlur(small, (3, 3), 0)
+    blackhat = cv2.morphologyEx(small, cv2.MORPH_BLACKHAT, rect_kernel)
+    gradient = np.absolute(cv2.Sobel(blackhat, ddepth=cv2.CV_32F, dx=1, dy=0, ksize=-1))
+    gradient = cv2.normalize(gradient, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    # Join characters to lines, then lines to the band
+    gradient = cv2.morphologyEx(gradient, cv2.MORPH_CLOSE, rect_kernel)
+    _, thresh = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, square_kernel)
+    thresh = cv2.erode(thresh, None, iterations=2)
+
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    best = None
+    best_width = 0.0
+    for contour in contours:
+        (cx, cy), (w, h), angle = cv2.minAreaRect(contour)
+        # minAreaRect may return the box standing upright
+        if h > w:
+            w, h = h, w
+            angle += 90
+        if h == 0:
+            continue
+        aspect_ratio = w / h
+        # A MRZ band is long and flat, and takes a noticeable part of the frame
+        if aspect_ratio < MIN_BAND_ASPECT or aspect_ratio > MAX_BAND_ASPECT or w < 0.2 * small_w:
+            continue
+        if w > best_width:
+            best_width = w
+            best = ((cx, cy), (w, h), angle)
+    if best is None:
+        return None
+
+    (cx, cy), (w, h), angle = best
+    # Add a margin, the erosion above shrinks the band
+    box = ((cx, cy), (w + 2 * unit * 4, h + 2 * unit * 4), angle)
+    corners = order_corners(cv2.boxPoints(box) / scale)
+    x, y, bw, bh = cv2.boundingRect(corners.astype(np.int32))
+    x, y = max(0, x), max(0, y)
+    bbox = (x, y, min(bw, width - x), min(bh, height - y))
+
+    # Warp once with the natural aspect ratio to count the lines, then scale to the character grid
+    band_w, band_h = box[1]
+    probe_height = 3 * LINE_HEIGHT
+    probe = warp_strip(image, corners, max(1, int(probe_height * band_w / band_h)), probe_height)
+    document_format = guess_format(count_lines(probe), band_w / band_h)
+    crop = cv2.resize(probe, grid_size(document_format), interpolation=cv2.INTER_AREA)
+    return MRZRegion(bbox, corners, crop, document_format)
@@ -0,0 +1,216 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+from datetime import date
+from difflib import SequenceMatcher
+from typing import Optional
+
+from disaster_id_scan.names import normalize_name
+
+# Persons with at least this similarity are reported as likely duplicates
+MIN_DUPLICATE_SCORE = 0.85
+
+# Weights of last name, first name and date of birth in the similarity
+LAST_NAME_WEIGHT = 0.45
+FIRST_NAME_WEIGHT = 0.25
+DATE_OF_BIRTH_WEIGHT = 0.3
+# Similarity of names that differ in spelling but sound alike
+PHONETIC_SIMILARITY = 0.9
+
+
+def cologne_phonetics(name: Optional[str]) -> str:
+    """
+    Phonetic code of a name after the Cologne phonetics ("Koelner Phonetik"), made for German names.
+    Names that sound alike, like "Meyer", "Maier" and "Mayr", get the same code.
+    """
+    letters = [char for char in normalize_name(name) if "A" <= char <= "Z"]
+    codes = []
+    for i, char in enumerate(letters):
+        previous = letters[i - 1] if i > 0 else ""
+        following = letters[i + 1] if i + 1 < len(letters) else ""
+        if char in "AEIJOUY":
+            code = "0"
+        elif char == "H":
+            continue
+        elif char == "B":
+            code = "1"
+        elif char == "P":
+            code = "3" if following == "H" else "1"
+        elif char in "DT":
+            code = "8" if following in ("C", "S", "Z") else "2"
+        elif char in "FVW":
+            code = "3"
+        elif char in "GKQ":
+            code = "4"
+        elif char == "C":
+            if i == 0:
+                code = "4" if following in ("A", "H", "K", "L", "O", "Q", "R", "U", "X") else "8"
+            elif previous in ("S", "Z"):
+                code = "8"
+            else:
+                code = "4" if following in ("A", "H", "K", "O", "Q", "U", "X") else "8"
+        elif char == "X":
+            code = "8" if previous in ("C", "K", "Q") else "48"
+        elif char == "L":
+            code = "5"
+        elif char in "MN":
+            code = "6"
+        elif char == "R":
+            code = "7"
+        else:
+            # S and Z
+            code = "8"
+        codes.append(code)
+    # Drop repeated codes, then all vowels except at the start
+    collapsed = ""
+    for digit in "".join(codes):
+        if not collapsed or collapsed[-1] != digit:
+            collapsed += digit
+    return collapsed[:1] + collapsed[1:].replace("0", "")
+
+
+class NameSignature:
+    """
+    The values of a person that are compared to find duplicates.
+    """
+
+    last_name: str
+    first_name: str
+    date_of_birth: Optional[date]
+
+    def __init__(self, last_name: Optional[str], first_name: Optional[str], date_of_birth: Optional[date]):
+        self.last_name = normalize_name(last_name)
+        self.first_name = normalize_name(first_name)
+        self.date_of_birth = date_of_birth
+
+    def blocking_keys(self) -> list[str]:
+        """
+        Keys of the blocks the person is sorted into, only persons sharing a block are compared.
+        """
+        keys = []
+        if self.last_name and self.date_of_birth is not None:
+            keys.append(f"name:{self.last_name}|{self.date_of_birth.isoformat()}")
+        # Catches typos in the names and a wrong or missing date of birth
+        phonetic = cologne_phonetics(self.last_name) + "|" + cologne_phonetics(self.first_name)
+        if phonetic != "|":
+            keys.append(f"phonetic:{phonetic}")
+        return keys
+
+
+def _date_similarity(a: date, b: date) -> float:
+    if a == b:
+        return 1.0
+    # Typical typos: day and month swapped, or one of day, month and year wrong
+    if (a.day, a.month, a.year) == (b.month, b.day, b.year):
+        return 0.7
+    if [a.day == b.day, a.month == b.month, a.year == b.year].count(False) == 1:
+        return 0.7
+    return 0.0
+
+
+def _name_similarity(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.5
+    ratio = SequenceMatcher(None, a, b).ratio()
+    # Names that sound alike are likely spelling variants
+    if ratio < PHONETIC_SIMILARITY and cologne_phonetics(a) == cologne_phonetics(b):
+        return PHONETIC_SIMILARITY
+    return ratio
+
+
+def similarity(a: NameSignature, b: NameSignature) -> float:
+    """
+    Similarity between 0 and 1 of two persons, 1 for equal normalized names and date of birth.
+    If a date of birth is missing, only the names are compared.
+    """
+    names = LAST_NAME_WEIGHT * _name_similarity(a.last_name, b.last_name) + FIRST_NAME_WEIGHT * _name_similarity(
+        a.first_name, b.first_name
+    )
+    if a.date_of_birth is None or b.date_of_birth is None:
+        return names / (LAST_NAME_WEIGHT + FIRST_NAME_WEIGHT)
+    return names + DATE_OF_BIRTH_WEIGHT * _date_similarity(a.date_of_birth, b.date_of_birth)
+
+
+class DuplicateIndex:
+    """
+    Blocking index to find likely duplicate registrations.
+    Every person is put into small blocks by its blocking keys, a new person is only compared fuzzily with
+    the persons in its blocks instead of with all registrants. The index is updated per person.
+    """
+
+    def __init__(self):
+        self._signatures: dict[int, NameSignature] = {}
+        self._blocks: dict[str, set[int]] = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def clear(self):
+        self._signatures = {}
+        self._blocks = {}
+
+    def add(self, person_id: int, last_name: Optional[str], first_name: Optional[str], date_of_birth: Optional[date]):
+        signature = NameSignature(last_name, first_name, date_of_birth)
+        self._signatures[person_id] = signature
+        for key in signature.blocking_keys():
+            self._blocks.setdefault(key, set()).add(person_id)
+
+    def remove(self, person_id: int):
+        signature = self._signatures.pop(person_id, None)
+        if signature is None:
+            return
+        for key in signature.blocking_keys():
+            ids = self._blocks[key]
+            ids.discard(person_id)
+            if not ids:
+                del self._blocks[key]
+
+    def update(
+        self, person_id: int, last_name: Optional[str], first_name: Optional[str], date_of_birth: Optional[date]
+    ):
+        self.remove(person_id)
+        self.add(person_id, last_name, first_name, date_of_birth)
+
+    def find(
+        self,
+        last_name: Optional[str],
+        first_name: Optional[str],
+        date_of_birth: Optional[date],
+        min_score: float = MIN_DUPLICATE_SCORE,
+        exclude_id: Optional[int] = None,
+    ) -> list[tuple[int, float]]:
+        """
+        Return (id, similarity) of the likely duplicates of a person, most similar first.
+        """
+        signature = NameSignature(last_name, first_name, date_of_birth)
+        candidates = set()
+        for key in signature.blocking_keys():
+            candidates.update(self._blocks.get(key, ()))
+        candidates.discard(exclude_id)
+        matches = []
+        for person_id in candidates:
+            score = similarity(signature, self._signatures[person_id])
+            if score >= min_score:
+                matches.append((person_id, score))
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return matches
+
+    def find_all(self, min_score: float = MIN_DUPLICATE_SCORE) -> list[tuple[int, int, float]]:
+        """
+        Return (id, id, similarity) of all pairs of likely duplicates in the index, the lower id first.
+        """
+        pairs = {}
+        for ids in self._blocks.values():
+            ordered = sorted(ids)
+            for i, first_id in enumerate(ordered):
+                for second_id in ordered[i + 1 :]:
+                    if (first_id, second_id) not in pairs:
+                        pairs[(first_id, second_id)] = similarity(
+                            self._signatures[first_id], self._signatures[second_id]
+                        )
+        return sorted(
+            ((first_id, second_id, score) for (first_id, second_id), score in pairs.items() if score >= min_score),
+            key=lambda pair: (-pair[2], pair[0], pair[1]),
+        )
@@ -0,0 +1,205 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import csv
+import io
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from disaster_id_scan.profiling import span
+from disaster_id_scan.store import Person
+
+# Export to csv (Xenios-Format? Whatever...)
+# Name, Vorname, geb, Alter(ca.), Nationalitaet, Staat, Unterkunft,
+EXPORT_FIELDS = [
+    "Name",
+    "Vorname",
+    "geb",
+    "Alter(ca.)",
+    "Nationalitaet",
+    "Staat",
+    "Unterkunft",
+    "Katastrophenort",
+    "Katastrophentag",
+    "Registrierungszeit",
+]
+
+
+def _format_date(value, date_format: str = "%d.%m.%Y") -> Optional[str]:
+    return value.strftime(date_format) if value is not None else None
+
+
+def format_row(person: Person, year: int) -> str:
+    """
+    Format a person as one CSV line, the approximate age is calculated for the given year.
+    """
+    # Calculate approximate age
+    age = year - person.date_of_birth.year if person.date_of_birth is not None else None
+    line = io.StringIO()
+    csv.writer(line).writerow(
+        [
+            person.last_name,
+            person.first_name,
+            _format_date(person.date_of_birth),
+            age,
+            person.nationality,
+            person.residence,
+            person.place_of_shelter,
+            person.place_of_catastrophe,
+            _format_date(person.date_of_catastrophe),
+            _format_date(person.time_of_registration, "%d.%m.%Y %H:%M:%S"),
+        ]
+    )
+    return line.getvalue()
+
+
+def header_row() -> str:
+    line = io.StringIO()
+    csv.writer(line).writerow(EXPORT_FIELDS)
+    return line.getvalue()
+
+
+class CSVExporter:
+    """
+    Keeps the CSV export up to date in a background thread.
+    Changes are written once no further change came for delay seconds, so a burst of edits leads to one write,
+    but at the latest max_delay seconds after the first change. Added persons are appended to the file with a
+    single write, after updates or deletes the file is regenerated from all persons into a temporary file that
+    replaces the export, so readers never see a half written file.
+    Formatted rows are cached per person id and version, unchanged persons are not formatted again. The version
+    of a person is counted up by changed(person_id), stores may return new Person objects for every get_all.
+    get_all is called with lock held, the store has to hold the same lock while it reports changes, so no
+    change is missed or written twice.
+    """
+
+    path: Path
+    delay: float
+    max_delay: float
+
+    def __init__(
+        self,
+        path: Path,
+        get_all: Callable[[], list[Person]],
+        lock: Optional[threading.RLock] = None,
+        delay: float = 1.0,
+        max_delay: float = 10.0,
+    ):
+        self.path = path
+        self.delay = delay
+        self.max_delay = max_delay
+        self._get_all = get_all
+        self._lock = lock if lock is not None else threading.RLock()
+        self._pending: list[Person] = []
+        self._regenerate = False
+        self._last_change = 0.0
+        # person_id -> version, only of persons that were changed
+        self._versions: dict[int, int] = {}
+        # person_id -> (version, row)
+        self._rows: dict[int, tuple[int, str]] = {}
+        self._rows_year = datetime.now().astimezone().year
+        self._condition = threading.Condition()
+        self._closed = False
+        self._write_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="csv-export", daemon=True)
+        self._thread.start()
+
+    def added(self, persons: Iterable[Person]):
+        with self._condition:
+            self._pending.extend(persons)
+            self._last_change = time.monotonic()
+            self._condition.notify()
+
+    def changed(self, person_id: Optional[int] = None):
+        """
+        Regenerate the whole export, needed after updates and deletes of the person with the id.
+        """
+        with self._condition:
+            if person_id is not None:
+                self._versions[person_id] = self._versions.get(person_id, 0) + 1
+            self._regenerate = True
+            self._pending = []
+            self._last_change = time.monotonic()
+            self._condition.notify()
+
+    def _row(self, person: Person, year: int, versions: dict[int, int]) -> str:
+        version = versions.get(person.person_id, 0)
+        cached = self._rows.get(person.person_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        row = format_row(person, year)
+        self._rows[person.person_id] = (version, row)
+        return row
+
+    def _take(self) -> tuple[Optional[list[Person]], list[Person], dict[int, int]]:
+        # Returns all persons if the export has to be regenerated, else the persons to append. The versions are
+        # taken together with the persons, a row formatted from an older person must not get a newer version.
+        with self._lock, self._condition:
+            regenerate, pending = self._regenerate, self._pending
+            self._regenerate, self._pending = False, []
+            year = datetime.now().astimezone().year
+            if year != self._rows_year:
+                # The approximate ages changed
+                self._rows = {}
+                self._rows_year = year
+                regenerate = True
+            if regenerate or (pending and not self.path.exists()):
+                return self._get_all(), [], dict(self._versions)
+            return None, pending, dict(self._versions)
+
+    def _write(self, persons: Optional[list[Person]], pending: list[Person], versions: dict[int, int]):
+        year = self._rows_year
+        if persons is not None:
+            rows = [self._row(person, year, versions) for person in persons]
+            # Forget rows of deleted persons
+            self._rows = {
+                person.person_id: (versions.get(person.person_id, 0), row) for person, row in zip(persons, rows)
+            }
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", newline="") as f:
+                f.write(header_row())
+                f.write("".join(rows))
+            os.replace(tmp_path, self.path)
+        elif pending:
+            with open(self.path, "a", newline="") as f:
+                # One write of complete lines, so no partial line is visible
+                f.write("".join(self._row(person, year, versions) for person in pending))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and not self._regenerate and not self._pending:
+                    self._condition.wait()
+                # Wait until no change came for delay seconds, so a burst of edits is written at once. Every
+                # change notifies the condition, the remaining time is computed again after each wake up.
+                deadline = time.monotonic() + self.max_delay
+                while not self._closed:
+                    remaining = min(self._last_change + self.delay, deadline) - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._closed:
+                    return
+            self.flush()
+
+    def flush(self):
+        """
+        Write outstanding changes now in the calling thread.
+        """
+        # Only one write at a time, the background thread may be writing as well
+        with self._write_lock:
+            persons, pending, versions = self._take()
+            if persons is None and not pending:
+                return
+            with span("export"):
+                self._write(persons, pending, versions)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
@@ -0,0 +1,156 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import threading
+import time
+from collections import deque
+from typing import Iterator, Optional
+
+import cv2
+import numpy as np
+
+from disaster_id_scan.autoscan import FrameQuality, frame_quality
+from disaster_id_scan.profiling import record
+
+# Frames kept per camera, at 30 fps about the last quarter of a second
+RING_SIZE = 8
+
+
+class Frame:
+    """
+    A frame of a camera with the time it was captured (time.monotonic()) and its number since the start.
+    The image is read-only and shared by all consumers without copying, copy it before changing it.
+    """
+
+    __slots__ = ("_quality", "image", "sequence", "timestamp")
+
+    def __init__(self, image: np.ndarray, timestamp: float, sequence: int):
+        image.flags.writeable = False
+        self.image = image
+        self.timestamp = timestamp
+        self.sequence = sequence
+        self._quality = None
+
+    def quality(self) -> FrameQuality:
+        # Computed once, several consumers may ask for it
+        if self._quality is None:
+            self._quality = frame_quality(self.image)
+        return self._quality
+
+    def age(self) -> float:
+        return time.monotonic() - self.timestamp
+
+    def __repr__(self):
+        return f"Frame(#{self.sequence}, {self.image.shape[1]}x{self.image.shape[0]}, {self.age() * 1000:.0f}ms old)"
+
+
+class FrameSubscription:
+    """
+    Stream of the frames of a grabber. Every get() returns a frame newer than the last one returned, frames
+    that were captured while the consumer was busy are skipped, so the consumer never falls behind.
+    """
+
+    def __init__(self, grabber: "FrameGrabber"):
+        self.grabber = grabber
+        self.last_sequence = -1
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Frame]:
+        """
+        Wait for the next frame, None on timeout or once the grabber is stopped.
+        """
+        frame = self.grabber.wait_for(self.last_sequence, timeout)
+        if frame is not None:
+            self.last_sequence = frame.sequence
+        return frame
+
+    def __iter__(self) -> Iterator[Frame]:
+        while self.grabber.is_running:
+            frame = self.get(timeout=1)
+            if frame is not None:
+                yield frame
+
+
+class FrameGrabber:
+    """
+    Reads a camera in its own thread into a ring buffer of the last frames.
+    It is the only reader of the capture, so consumers (preview, recognition, auto scan) do not compete for
+    it and always get recent frames: the latest one, the sharpest of the last few or a subscription.
+    """
+
+    size: int
+    frames_captured: int
+    read_errors: int
+
+    def __init__(self, cap: cv2.VideoCapture, size: int = RING_SIZE):
+        self.cap = cap
+        self.size = size
+        self.is_running = False
+        self.frames_captured = 0
+        self.read_errors = 0
+        self._frames: deque[Frame] = deque(maxlen=size)
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.is_running = True
+        self._thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self.is_running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self):
+        while self.is_running:
+            start = time.perf_counter()
+            ok, image = self.cap.read()
+            # Includes waiting for the camera, so it shows the frame interval of the camera
+            record("capture", time.perf_counter() - start)
+            if not ok:
+                self.read_errors += 1
+                time.sleep(0.05)
+                continue
+            with self._condition:
+                frame = Frame(image, time.monotonic(), self.frames_captured)
+                self.frames_captured += 1
+                self._frames.append(frame)
+                self._condition.notify_all()
+
+    def latest(self) -> Optional[Frame]:
+        with self._condition:
+            return self._frames[-1] if self._frames else None
+
+    def recent(self, count: int = RING_SIZE) -> list[Frame]:
+        """
+        The last count frames, oldest first.
+        """
+        with self._condition:
+            return list(self._frames)[-count:]
+
+    def sharpest(self, count: int = RING_SIZE) -> Optional[Frame]:
+        """
+        The sharpest of the last count frames, e.g. to avoid a frame with motion blur for a single scan.
+        """
+        frames = self.recent(count)
+        if not frames:
+            return None
+        return max(frames, key=lambda frame: frame.quality().sharpness)
+
+    def wait_for(self, after_sequence: int = -1, timeout: Optional[float] = None) -> Optional[Frame]:
+        """
+        Wait for a frame newer than after_sequence and return the latest one, None on timeout or stop.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: not self.is_running or (self._frames and self._frames[-1].sequence > after_sequence), timeout
+            )
+            if self._frames and self._frames[-1].sequence > after_sequence:
+                return self._frames[-1]
+            return None
+
+    def subscribe(self) -> FrameSubscription:
+        return FrameSubscription(self)
@@ -0,0 +1,451 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Fast recognizer for the machine readable zone. A MRZ is printed in a fixed grid (2x44, 2x36 or 3x30 characters
+of a 37 character alphabet), so the band is cut into its text lines and character cells and every cell is
+classified by correlation with templates of the characters. This takes milliseconds instead of the seconds of
+easyocr, readings that are not certain are passed on to easyocr.
+The templates are rendered with the font of disaster_id_scan.synthetic. Real documents are printed in OCR-B,
+the glyphs of MRZs read by easyocr are added as templates, so the recognizer learns the font while running.
+"""
+
+import threading
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from disaster_id_scan.detect import to_grayscale
+from disaster_id_scan.mrz import detect_document_type, mrz_checksum, normalize_mrz, parse_mrz_checked
+from disaster_id_scan.ocr import MRZ_ALLOWLIST, OCREngine, OCRStats
+from disaster_id_scan.preprocess import GLYPH_HEIGHT
+from disaster_id_scan.profiling import record
+from disaster_id_scan.synthetic import CHAR_PITCH, draw_text
+
+# Characters per line of the formats with two and three lines
+LINE_LENGTHS = {2: (36, 44), 3: (30,)}
+# Ink in horizontal runs longer than this share of the width or vertical runs longer than this share of the
+# height is the edge of the document or background, not text
+MAX_RUN_WIDTH = 0.25
+MAX_RUN_HEIGHT = 0.5
+# Text lines of fewer rows are noise
+MIN_LINE_HEIGHT = 4
+# Size (width, height) of a normalized glyph
+GLYPH_SIZE = (16, 24)
+# Pixels a glyph may be displaced in its normalized cell
+MAX_SHIFT = 2
+# Correlation a glyph needs with its character, and by which it has to beat every other character. Glyphs
+# below are ambiguous, which is only accepted in fields covered by a check digit.
+MIN_SCORE = 0.5
+MIN_MARGIN = 0.02
+# Ambiguous glyphs a reading may contain, a check digit does not catch every combination of errors
+MAX_AMBIGUOUS = 2
+# Resolutions (pixels per mm) and blurs the templates are rendered with
+TEMPLATE_RESOLUTIONS = (4.0, 5.0, 6.0, 7.0, 8.0, 10.0, 12.0, 14.0)
+TEMPLATE_BLURS = (0.0, 0.7, 1.4, 2.1)
+# Learned templates kept per character, the oldest is replaced first
+MAX_LEARNED = 8
+# Share of the characters of a fallback reading the grid has to agree with before its glyphs are learned
+MIN_LEARN_AGREEMENT = 0.5
+
+# What every character adds to a check digit at weight 1, characters with the same value can be mistaken for
+# each other without a check digit noticing
+CHECK_VALUES = np.array([mrz_checksum(char) for char in MRZ_ALLOWLIST])
+
+
+class GridReading:
+    """
+    Characters read from a MRZ grid with the correlation (-1 to 1) of every glyph with every character of
+    MRZ_ALLOWLIST. A glyph is ambiguous if its best character has a low correlation or does not beat the next
+    best one by MIN_MARGIN.
+    """
+
+    correlations: np.ndarray
+    chars: int
+    lines: list[str]
+    scores: np.ndarray
+    margins: np.ndarray
+
+    def __init__(self, correlations: np.ndarray, chars: int):
+        self.correlations = correlations
+        self.chars = chars
+        second, first = np.sort(correlations, axis=1)[:, -2:].T
+        self.scores = first
+        self.margins = first - second
+        text = "".join(MRZ_ALLOWLIST[index] for index in correlations.argmax(axis=1))
+        self.lines = [text[i : i + chars] for i in range(0, len(text), chars)]
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.lines)
+
+    def constrained(self, numeric: set[int], alpha: set[int]) -> "GridReading":
+        """
+        The reading with only digits at the numeric and only letters at the alpha indexes (fillers at both),
+        e.g. a glyph between O and 0 is not ambiguous in a name.
+        """
+        correlations = self.correlations.copy()
+        digits = [i for i, char in enumerate(MRZ_ALLOWLIST) if char.isdigit()]
+        letters = [i for i, char in enumerate(MRZ_ALLOWLIST) if char.isalpha()]
+        for positions, excluded in ((numeric, letters), (alpha, digits)):
+            indexes = [index for index in positions if index < len(correlations)]
+            correlations[np.ix_(indexes, excluded)] = -1.0
+        return GridReading(correlations, self.chars)
+
+    def ambiguous(self) -> set[int]:
+        """
+        Indexes of the ambiguous glyphs, in the MRZ with the lines joined.
+        """
+        return set(np.flatnonzero((self.scores < MIN_SCORE) | (self.margins < MIN_MARGIN)).tolist())
+
+    def unverified(self, checked: set[int]) -> set[int]:
+        """
+        Indexes of the ambiguous glyphs the check digits can not decide: glyphs outside of the checked indexes
+        and glyphs whose alternatives add the same to the check digit, e.g. G and Q.
+        """
+        best = self.correlations.argmax(axis=1)
+        close = self.correlations >= (self.scores - MIN_MARGIN)[:, None]
+        close[np.arange(len(best)), best] = False
+        same_value = close & (CHECK_VALUES[None, :] == CHECK_VALUES[best][:, None])
+        unchecked = np.ones(len(best), bool)
+        unchecked[[index for index in checked if index < len(best)]] = False
+        return set(
+            np.flatnonzero(
+                (self.scores < MIN_SCORE) | same_value.any(axis=1) | (unchecked & close.any(axis=1))
+            ).tolist()
+        )
+
+    def __repr__(self):
+        return f"GridReading({self.text!r}, min score {self.scores.min():.2f}, {len(self.ambiguous())} ambiguous)"
+
+
+def _runs(filled: np.ndarray) -> list[tuple[int, int]]:
+    # Start and end (exclusive) of the runs of True
+    changes = np.flatnonzero(np.diff(np.concatenate(([0], filled.astype(np.int8), [0]))))
+    return list(zip(changes[::2], changes[1::2]))
+
+
+def find_lines(ink: np.ndarray) -> list[tuple[int, int]]:
+    """
+    Rows (top, bottom) of the text lines in the binary image, lines much lower than the highest are dropped.
+    """
+    profile = ink.sum(axis=1)
+    if profile.max() == 0:
+        return []
+    lines = [(top, bottom) for top, bottom in _runs(profile > 0.25 * profile.max()) if bottom - top >= MIN_LINE_HEIGHT]
+    if not lines:
+        return []
+    height = max(bottom - top for top, bottom in lines)
+    return [(top, bottom) for top, bottom in lines if bottom - top >= 0.5 * height]
+
+
+def fit_grid(profile: np.ndarray, chars: int) -> Optional[tuple[float, float, float]]:
+    """
+    Fit a grid of chars cells to the ink profile of a line, returns the left edge and pitch of the cells and
+    the mean ink on their borders. The cells enclose all ink and their borders run through columns with as
+    little ink as possible.
+    """
+    columns = np.flatnonzero(profile)
+    if len(columns) < chars:
+        return None
+    left, right = columns[0], columns[-1] + 1
+    estimate = (right - left) / (chars - 0.3)
+    pitches = estimate * np.linspace(0.92, 1.08, 33)
+    offsets = np.linspace(-0.4, 0.1, 11)
+    # Candidate grids as (pitch, offset), offsets relative to the pitch
+    starts = left + offsets[None, :] * pitches[:, None]
+    borders = starts[:, :, None] + np.arange(chars + 1)[None, None, :] * pitches[:, None, None]
+    padded = np.concatenate((profile, [0]))
+    indexes = np.clip(np.round(borders).astype(int), 0, len(profile))
+    cost = padded[indexes].mean(axis=2)
+    # Ink outside of the grid is not allowed
+    cost[(borders[:, :, -1] < right - 1) | (borders[:, :, 0] > left)] = np.inf
+    best = np.unravel_index(np.argmin(cost), cost.shape)
+    if not np.isfinite(cost[best]):
+        return None
+    return float(starts[best]), float(pitches[best[0]]), float(cost[best])
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = vectors - vectors.mean(axis=-1, keepdims=True)
+    norm = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norm, 1e-6)
+
+
+def cut_glyphs(
+    gray: np.ndarray, top: int, bottom: int, *, start: float, pitch: float, chars: int, shift: int = MAX_SHIFT
+) -> np.ndarray:
+    """
+    Cut the cells of a line and scale them to GLYPH_SIZE. Returns an array of (chars, shifts, pixels) with the
+    normalized glyph for every displacement of up to shift pixels, dark ink is positive.
+    """
+    glyph_w, glyph_h = GLYPH_SIZE
+    # Glyphs like "<" are lower than the line, the cell includes a margin above and below
+    margin = 0.15 * (bottom - top)
+    scale_x, scale_y = glyph_w / pitch, glyph_h / (bottom - top + 2 * margin)
+    matrix = np.float32([[scale_x, 0, shift - start * scale_x], [0, scale_y, shift - (top - margin) * scale_y]])
+    size = (chars * glyph_w + 2 * shift, glyph_h + 2 * shift)
+    line = cv2.warpAffine(gray, matrix, size, flags=cv2.INTER_AREA, borderMode=cv2.BORDER_REPLICATE)
+    line = 255 - line.astype(np.float32)
+    windows = np.lib.stride_tricks.sliding_window_view(line, (glyph_h, glyph_w))
+    glyphs = []
+    for dy in range(2 * shift + 1):
+        for dx in range(2 * shift + 1):
+            cells = windows[dy, np.arange(chars) * glyph_w + dx]
+            glyphs.append(cells.reshape(chars, -1))
+    return _normalize(np.stack(glyphs, axis=1))
+
+
+def remove_background(ink: np.ndarray) -> np.ndarray:
+    """
+    Clear the edges of the document and the background around it in the binary image, they are made of ink
+    runs longer than any glyph.
+    """
+    height, width = ink.shape
+    horizontal = cv2.getStructuringElement(cv2.MORPH_RECT, (max(1, int(width * MAX_RUN_WIDTH)), 1))
+    vertical = cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(1, int(height * MAX_RUN_HEIGHT))))
+    background = cv2.morphologyEx(ink, cv2.MORPH_OPEN, horizontal) | cv2.morphologyEx(ink, cv2.MORPH_OPEN, vertical)
+    # The blurred border of an edge is thinner than the edge itself
+    background = cv2.dilate(background, cv2.getStructuringElement(cv2.MORPH_RECT, (7, 7)))
+    return ink & (1 - background)
+
+
+def segment(image: np.ndarray, shift: int = MAX_SHIFT) -> list[list[np.ndarray]]:
+    """
+    Find the MRZ grid in the image (e.g. the MRZ crop of disaster_id_scan.detect) and cut it into glyphs, see
+    cut_glyphs. The lines of a MRZ are aligned, one grid is fitted to all of them. Returns a candidate for
+    every line length the number of lines allows, each with one array per line. The list is empty if the
+    image does not contain two or three text lines.
+    """
+    gray = to_grayscale(image)
+    _, ink = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    ink = remove_background(ink)
+    lines = find_lines(ink)
+    if len(lines) not in LINE_LENGTHS:
+        return []
+    profile = sum(ink[top:bottom].sum(axis=0) for top, bottom in lines)
+    candidates = []
+    for chars in LINE_LENGTHS[len(lines)]:
+        grid = fit_grid(profile, chars)
+        if grid is not None:
+            start, pitch, _ = grid
+            candidates.append(
+                [
+                    cut_glyphs(gray, top, bottom, start=start, pitch=pitch, chars=chars, shift=shift)
+                    for top, bottom in lines
+                ]
+            )
+    return candidates
+
+
+def render_templates() -> tuple[np.ndarray, np.ndarray]:
+    """
+    Render the MRZ characters in all TEMPLATE_RESOLUTIONS and TEMPLATE_BLURS and cut them like a MRZ.
+    Returns the normalized glyphs and the index of their character in MRZ_ALLOWLIST.
+    """
+    glyphs = []
+    labels = []
+    for px_per_mm in TEMPLATE_RESOLUTIONS:
+        height = GLYPH_HEIGHT * px_per_mm
+        pitch = CHAR_PITCH * px_per_mm
+        image = np.full((int(3 * height), int((len(MRZ_ALLOWLIST) + 2) * pitch)), 235, np.uint8)
+        draw_text(image, MRZ_ALLOWLIST, pitch, 2 * height, pitch=pitch, height=height)
+        for blur in TEMPLATE_BLURS:
+            blurred = cv2.GaussianBlur(image, (0, 0), blur) if blur else image
+            _, ink = cv2.threshold(blurred, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+            ((top, bottom),) = find_lines(ink)
+            start, pitch, _ = fit_grid(ink[top:bottom].sum(axis=0), len(MRZ_ALLOWLIST))
+            glyphs.append(
+                cut_glyphs(blurred, top, bottom, start=start, pitch=pitch, chars=len(MRZ_ALLOWLIST), shift=0)[:, 0]
+            )
+            labels.append(np.arange(len(MRZ_ALLOWLIST)))
+    return np.concatenate(glyphs), np.concatenate(labels)
+
+
+class GridRecognizer:
+    """
+    Classifies the glyphs of a MRZ grid with the rendered and learned templates.
+    """
+
+    def __init__(self):
+        self._rendered = render_templates()
+        # Templates, their labels and the mean template of every character are replaced together, classifications
+        # running meanwhile use the old ones
+        self._templates = self._with_means(*self._rendered)
+        self._learned: dict[int, list[np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _with_means(templates: np.ndarray, labels: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        means = np.stack([templates[labels == label].mean(axis=0) for label in range(len(MRZ_ALLOWLIST))])
+        return templates, labels, _normalize(means)
+
+    def classify(self, glyphs: np.ndarray) -> np.ndarray:
+        """
+        Correlation of every glyph of cut_glyphs with every character, with the best template of the character.
+        """
+        templates, labels, means = self._templates
+        # The displacement of every glyph is found with the mean templates, only that one is compared with
+        # all templates
+        shifts = (glyphs @ means.T).max(axis=2).argmax(axis=1)
+        scores = glyphs[np.arange(len(glyphs)), shifts] @ templates.T
+        correlations = np.full((len(glyphs), len(MRZ_ALLOWLIST)), -1.0, np.float32)
+        np.maximum.at(correlations, (slice(None), labels), scores)
+        return correlations
+
+    def read(self, image: np.ndarray) -> Optional[GridReading]:
+        """
+        Read the MRZ grid in the image, None if no grid is found. If the number of lines allows several line
+        lengths, the one read with the higher correlation is returned.
+        """
+        best = None
+        for lines in segment(image):
+            reading = GridReading(self.classify(np.concatenate(lines)), len(lines[0]))
+            if best is None or reading.scores.mean() > best.scores.mean():
+                best = reading
+        return best
+
+    def learn(self, image: np.ndarray, mrz: str) -> int:
+        """
+        Add the glyphs of the image as templates of the characters of mrz (lines joined), if the grid matches
+        the MRZ and was read mostly right. Only the glyphs that were read wrong or ambiguous are added.
+        Returns the number of added templates.
+        """
+        candidates = [lines for lines in segment(image, shift=0) if sum(len(line) for line in lines) == len(mrz)]
+        if not candidates:
+            return 0
+        glyphs = np.concatenate(candidates[0])
+        reading = GridReading(self.classify(glyphs), len(candidates[0][0]))
+        best = reading.correlations.argmax(axis=1)
+        expected = np.array([MRZ_ALLOWLIST.find(char) for char in mrz])
+        # A grid that is off by a cell reads most characters wrong, its glyphs would spoil the templates
+        if (best == expected).mean() < MIN_LEARN_AGREEMENT:
+            return 0
+        uncertain = best != expected
+        uncertain[list(reading.ambiguous())] = True
+        added = 0
+        with self._lock:
+            for index in np.flatnonzero(uncertain & (expected >= 0)):
+                learned = self._learned.setdefault(int(expected[index]), [])
+                learned.append(glyphs[index, 0])
+                del learned[:-MAX_LEARNED]
+                added += 1
+            if added:
+                rendered, rendered_labels = self._rendered
+                learned = [(label, glyph) for label, glyphs in self._learned.items() for glyph in glyphs]
+                self._templates = self._with_means(
+                    np.concatenate([rendered, np.array([glyph for _, glyph in learned])]),
+                    np.concatenate([rendered_labels, np.array([label for label, _ in learned])]),
+                )
+        return added
+
+
+class GridStats(OCRStats):
+    """
+    Timing information of a GridOCREngine, load_time is the time to render the templates. fallbacks counts the
+    images passed on to easyocr.
+    """
+
+    fallbacks: int
+
+    def __init__(self):
+        super().__init__()
+        self.fallbacks = 0
+
+    def __str__(self):
+        load = f"{self.load_time * 1000:.0f}ms" if self.load_time is not None else "not loaded"
+        mean = self.mean_call_time()
+        last = f"{self.last_call_time * 1000:.1f}ms" if self.last_call_time is not None else "-"
+        mean = f"{mean * 1000:.1f}ms" if mean is not None else "-"
+        return f"Grid OCR load: {load}, calls: {self.calls}, last: {last}, mean: {mean}, fallbacks: {self.fallbacks}"
+
+
+class GridOCREngine:
+    """
+    OCR engine that reads the MRZ with a GridRecognizer, with the interface of OCREngine.
+    A reading is only returned if its check digits match and its ambiguous glyphs are covered by check digits,
+    otherwise the image is read by the fallback engine. MRZs the fallback reads valid without corrections teach
+    the recognizer their font.
+    """
+
+    fallback: OCREngine
+    stats: GridStats
+
+    def __init__(self, fallback: OCREngine):
+        self.fallback = fallback
+        self.stats = GridStats()
+        self._recognizer: Optional[GridRecognizer] = None
+        self._load_lock = threading.Lock()
+
+    def load(self) -> GridRecognizer:
+        """
+        Render the templates if that did not happen yet, returns the recognizer.
+        """
+        with self._load_lock:
+            if self._recognizer is None:
+                start = time.perf_counter()
+                self._recognizer = GridRecognizer()
+                self.stats.load_time = time.perf_counter() - start
+        return self._recognizer
+
+    @property
+    def recognizer(self) -> GridRecognizer:
+        return self.load()
+
+    def warm_up(self) -> threading.Thread:
+        """
+        Render the templates and start loading the fallback models in the background, returns the thread.
+        """
+        self.load()
+        return self.fallback.warm_up()
+
+    def is_ready(self) -> bool:
+        # The fallback is loaded when it is first needed
+        return self._recognizer is not None
+
+    @property
+    def reader(self):
+        self.load()
+        return self.fallback.reader
+
+    def read_grid(self, image) -> Optional[str]:
+        """
+        Read the MRZ grid in the image, None if it can not be read with certainty.
+        """
+        start = time.perf_counter()
+        reading = self.recognizer.read(image)
+        document = detect_document_type(normalize_mrz(reading.text)) if reading is not None else None
+        parsed = None
+        if document is not None:
+            reading = reading.constrained(document.numeric_indexes(), document.alpha_indexes())
+            parsed = parse_mrz_checked(reading.text)
+        duration = time.perf_counter() - start
+        self.stats.record_call(duration)
+        record("ocr.grid", duration)
+        # A correction of the check digits may pick a character the glyph does not look like at all
+        if parsed is None or not parsed.valid or parsed.corrections:
+            return None
+        if len(reading.ambiguous()) > MAX_AMBIGUOUS or reading.unverified(parsed.document.checked_indexes()):
+            return None
+        return reading.text
+
+    def readtext(self, image, **kwargs) -> list:
+        """
+        Read the MRZ in the image, as readtext of easyocr with paragraph=True.
+        """
+        text = self.read_grid(image)
+        if text is not None:
+            height, width = image.shape[:2]
+            return [([[0, 0], [width, 0], [width, height], [0, height]], text)]
+        self.stats.fallbacks += 1
+        result = self.fallback.readtext(image, **kwargs)
+        for element in result:
+            parsed = parse_mrz_checked(element[1].upper()) if "<" in element[1] else None
+            # Only MRZs read valid without corrections are learned, a wrong correction would become a template
+            # under the wrong character for the rest of the session
+            if parsed is not None and parsed.valid and not parsed.corrections:
+                self.recognizer.learn(image, parsed.mrz)
+                break
+        return result
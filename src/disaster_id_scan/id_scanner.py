@@ -1,44 +1,232 @@
 # SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
 #
 # SPDX-License-Identifier: EUPL-1.2
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Optional, Sequence, TextIO
 
 import cv2
-import easyocr
-from PIL import Image
-
-
-def id_scanner(cam: int = 0):
-    reader = easyocr.Reader(['de'])
-    # Loop endlessly until q or ESC is pressed
-    while True:
-        # Wait for keypress
-        k = input("Press enter to take image, press q and enter to quit")
-        # if space bar is pressed take image and use with easyocr
-        if k == '':
-            # Read frame, open cam with HD
-            cam = cv2.VideoCapture(2)
-
-            cam.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-            cam.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-
-            ret, frame = cam.read()
-            cam.release()
-            print("Image taken, calculating...")
-            # Display image
-            # cv2.imshow('image', frame)
-            # load into easyocr
-            result = reader.readtext(frame, paragraph=True)
-            # print result
-            print(result)
-            print("")
-            # Loop through results, display line by line
-            for i in range(len(result)):
-                print(result[i][1])
-            # Load image in PIL
-            img = Image.fromarray(frame)
-            # Display image
-            img.show()
-        # if q or ESC is pressed exit
-        elif k == "q":
-            break
-    # Release the camera
+
+from disaster_id_scan import profiling
+from disaster_id_scan.autoscan import AutoScanner
+from disaster_id_scan.frames import FrameGrabber
+from disaster_id_scan.mrz import ParsedMRZ
+from disaster_id_scan.ocr import DEFAULT_LANGUAGES, get_engine
+from disaster_id_scan.preprocessing import DEFAULT_PREPROCESSING, Preprocessing
+from disaster_id_scan.recognition import RecognitionQueue
+from disaster_id_scan.recognition_cache import CacheStats, RecognitionCache
+from disaster_id_scan.store import Registrants, person_to_dict
+
+# Seconds a scan looks for a MRZ after it was triggered
+SCAN_TIMEOUT = 15.0
+# Seconds the same document is not reported again in continuous mode, it usually stays in front of the camera
+COOLDOWN = 10.0
+# Seconds to wait for a new frame of the camera
+FRAME_TIMEOUT = 0.05
+
+SCAN_MODES = ("trigger", "continuous")
+
+
+class ScanStats:
+    """
+    Counts of a scan session, scans are the reported documents. cache are the counters of the recognition cache
+    of the session.
+    """
+
+    started: float
+    scans: int
+    failures: int
+    cache: Optional[CacheStats]
+
+    def __init__(self, cache: Optional[CacheStats] = None):
+        self.started = time.monotonic()
+        self.scans = 0
+        self.failures = 0
+        self.cache = cache
+
+    def scans_per_minute(self) -> float:
+        return self.scans * 60 / max(time.monotonic() - self.started, 1e-9)
+
+    def __str__(self):
+        text = f"{self.scans} scans, {self.failures} failed, {self.scans_per_minute():.1f} scans per minute"
+        if self.cache is not None and self.cache.hit_rate() is not None:
+            text += f"\n{self.cache}"
+        return text
+
+
+class ScanSession:
+    """
+    Headless scanner without any GUI dependency.
+    The camera is opened once and read by a frame grabber, the OCR engine is loaded once and stays warm for
+    the whole session. Every scanned document is written as a JSON line to output, only MRZs with valid check
+    digits are reported. If a store is given, the persons are added to it as well.
+    """
+
+    cam: int
+    resolution: Optional[tuple[int, int]]
+    store: Optional[Registrants]
+    cooldown: float
+    stats: ScanStats
+
+    def __init__(
+        self,
+        cam: int = 0,
+        languages: Sequence[str] = DEFAULT_LANGUAGES,
+        resolution: Optional[tuple[int, int]] = None,
+        store: Optional[Registrants] = None,
+        *,
+        output: TextIO = sys.stdout,
+        cooldown: float = COOLDOWN,
+        preprocessing: Preprocessing = DEFAULT_PREPROCESSING,
+        recognizer: str = "easyocr",
+    ):
+        self.cam = cam
+        self.resolution = resolution
+        self.store = store
+        self.output = output
+        self.cooldown = cooldown
+        self.engine = get_engine(languages, recognizer=recognizer)
+        # Frames of a document lying still are only read once
+        self.cache = RecognitionCache()
+        self.stats = ScanStats(self.cache.stats)
+        self.scanner = AutoScanner(RecognitionQueue(self.engine, preprocessing=preprocessing, cache=self.cache))
+        self.cap = None
+        self.grabber = None
+
+    def open(self):
+        # Load the models while the camera starts
+        self.engine.warm_up()
+        self.cap = cv2.VideoCapture(self.cam)
+        if not self.cap.isOpened():
+            message = f"Camera {self.cam} can not be opened"
+            raise RuntimeError(message)
+        if self.resolution is not None:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.grabber = FrameGrabber(self.cap)
+        self.grabber.start()
+        self.stats = ScanStats(self.cache.stats)
+
+    def close(self):
+        self.scanner.shutdown()
+        if self.grabber is not None:
+            self.grabber.stop()
+        if self.cap is not None:
+            self.cap.release()
+
+    def __enter__(self) -> "ScanSession":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def scan(self, timeout: Optional[float] = None) -> Optional[ParsedMRZ]:
+        """
+        Read frames until a MRZ with valid check digits is found, None after timeout or if the camera stopped.
+        Raises RuntimeError if the recognition fails again and again.
+        """
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        subscription = self.grabber.subscribe()
+        while self.grabber.is_running:
+            if deadline is not None and time.monotonic() > deadline:
+                self.scanner.reset()
+                return None
+            frame = subscription.get(timeout=FRAME_TIMEOUT)
+            if frame is not None:
+                self.scanner.offer_frame(frame.image, frame.quality())
+            parsed = self.scanner.collect_mrz()
+            if self.scanner.stopped:
+                error = self.scanner.last_error
+                self.scanner.reset()
+                message = f"Recognition failed repeatedly: {error}"
+                raise RuntimeError(message) from error
+            if parsed is not None:
+                # Time from the start of the scan until the document was read
+                profiling.record("scan", time.monotonic() - start)
+                return parsed
+        return None
+
+    def _write(self, record: dict):
+        self.output.write(json.dumps(record) + "\n")
+        self.output.flush()
+
+    def emit(self, parsed: ParsedMRZ) -> dict:
+        person = parsed.get_person()
+        if self.store is not None:
+            self.store.add(person)
+        record = {
+            "time": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "document": type(parsed.document).__name__,
+            "mrz": parsed.mrz,
+            "confidence": round(parsed.confidence, 3),
+            "corrections": len(parsed.corrections),
+            "person": person_to_dict(person),
+        }
+        self._write(record)
+        self.stats.scans += 1
+        return record
+
+    def run_trigger(self, triggers: TextIO = sys.stdin):
+        """
+        Scan one document per line read from triggers (enter on the terminal), until q or the end of input.
+        """
+        # The prompt is for the terminal, the records go to output
+        print("Press enter to scan, q and enter to quit", file=sys.stderr)  # noqa: T201
+        for line in triggers:
+            if line.strip().lower() == "q":
+                break
+            parsed = self.scan(SCAN_TIMEOUT)
+            if parsed is None:
+                self.stats.failures += 1
+                self._write(
+                    {"time": datetime.now().astimezone().isoformat(timespec="seconds"), "error": "no MRZ found"}
+                )
+            else:
+                self.emit(parsed)
+
+    def run_continuous(self):
+        """
+        Scan documents until the camera stops or the process is interrupted.
+        """
+        last_mrz = None
+        last_seen = 0.0
+        while True:
+            parsed = self.scan()
+            if parsed is None:
+                break
+            now = time.monotonic()
+            if parsed.mrz == last_mrz and now - last_seen < self.cooldown:
+                last_seen = now
+                continue
+            last_mrz, last_seen = parsed.mrz, now
+            self.emit(parsed)
+
+
+def id_scanner(
+    cam: int = 0,
+    languages: Sequence[str] = DEFAULT_LANGUAGES,
+    mode: str = "trigger",
+    store: Optional[Registrants] = None,
+    *,
+    resolution: Optional[tuple[int, int]] = None,
+    cooldown: float = COOLDOWN,
+    preprocessing: Preprocessing = DEFAULT_PREPROCESSING,
+    recognizer: str = "easyocr",
+) -> ScanStats:
+    session = ScanSession(
+        cam, languages, resolution, store, cooldown=cooldown, preprocessing=preprocessing, recognizer=recognizer
+    )
+    with session:
+        try:
+            if mode == "continuous":
+                session.run_continuous()
+            else:
+                session.run_trigger()
+        except KeyboardInterrupt:
+            pass
+    return session.stats
@@ -1,9 +1,10 @@
-from enum import Enum
+import itertools
+import math
 from datetime import date, datetime
-from typing import Union
-
-import easyocr
+from typing import Iterable, Optional, Sequence, Union
 
+from disaster_id_scan.ocr import OCREngine
+from disaster_id_scan.profiling import span
 from disaster_id_scan.store import Person
 
 
@@ -14,11 +15,13 @@ class DocumentType:
     row_count: int
 
     # Fields: (row, start_position, end_position)
-    issuer_country_pos: (int, int, int)
-    names_pos: (int, int, int)
-    birthdate_pos: (int, int, int)
-    birthdate_checkdigit_pos: (int, int, int)
-    nationality_pos: (int, int, int)
+    issuer_country_pos: tuple[int, int, int]
+    names_pos: tuple[int, int, int]
+    birthdate_pos: tuple[int, int, int]
+    birthdate_checkdigit_pos: tuple[int, int, int]
+    nationality_pos: tuple[int, int, int]
+    # Check digits: name -> (list of fields covered by the check digit, position of the check digit)
+    check_digits: dict[str, tuple[list[tuple[int, int, int]], tuple[int, int, int]]]
 
     # Dict with country codes according to ISO 3166-1 alpha-3
     # With exceptions, e.g. "D" for Germany instead of "DEU"
@@ -84,15 +87,18 @@ class DocumentType:
         "UKR": "Ukraine",
     }
 
-    def __init__(self,
-                 mrz: str,
-                 row_length: int,
-                 row_count: int,
-                 issuer_country_pos: (int, int, int),
-                 names_pos: (int, int, int),
-                 birthdate_pos: (int, int, int),
-                 birthdate_checkdigit_pos: (int, int, int),
-                 nationality_pos: (int, int, int)):
+    def __init__(
+        self,
+        mrz: str,
+        row_length: int,
+        row_count: int,
+        issuer_country_pos: tuple[int, int, int],
+        names_pos: tuple[int, int, int],
+        birthdate_pos: tuple[int, int, int],
+        birthdate_checkdigit_pos: tuple[int, int, int],
+        nationality_pos: tuple[int, int, int],
+        check_digits: dict[str, tuple[list[tuple[int, int, int]], tuple[int, int, int]]],
+    ):
         self.mrz = mrz
         self.row_length = row_length
         self.row_count = row_count
@@ -101,6 +107,7 @@ class DocumentType:
         self.birthdate_pos = birthdate_pos
         self.birthdate_checkdigit_pos = birthdate_checkdigit_pos
         self.nationality_pos = nationality_pos
+        self.check_digits = check_digits
 
     def country_code_to_name(self, code: str) -> str:
         code = code.upper().replace("<", "")
@@ -109,11 +116,48 @@ class DocumentType:
         else:
             return code
 
-    def get_field(self, pos: (int, int, int)) -> str:
+    def get_field(self, pos: tuple[int, int, int]) -> str:
         # Position offset:
         # 1 is the first position in the first row
         pos_offset = (pos[0] - 1) * self.row_length
-        return self.mrz[pos_offset + pos[1] - 1:pos_offset + pos[2]]
+        return self.mrz[pos_offset + pos[1] - 1 : pos_offset + pos[2]]
+
+    def field_indexes(self, pos: tuple[int, int, int]) -> range:
+        # Indexes of a field in the MRZ string, starting at 0
+        pos_offset = (pos[0] - 1) * self.row_length
+        return range(pos_offset + pos[1] - 1, pos_offset + pos[2])
+
+    def numeric_indexes(self) -> set[int]:
+        """
+        Indexes that may only contain digits: dates and check digits.
+        """
+        indexes = set(self.field_indexes(self.birthdate_pos))
+        for name, (fields, digit_pos) in self.check_digits.items():
+            indexes.update(self.field_indexes(digit_pos))
+            if name == "expiry":
+                for field in fields:
+                    indexes.update(self.field_indexes(field))
+        return indexes
+
+    def alpha_indexes(self) -> set[int]:
+        """
+        Indexes that may not contain digits: names and country codes.
+        """
+        indexes = set()
+        for pos in (self.issuer_country_pos, self.names_pos, self.nationality_pos):
+            indexes.update(self.field_indexes(pos))
+        return indexes
+
+    def checked_indexes(self) -> set[int]:
+        """
+        Indexes covered by a check digit, including the check digits. Names are not covered.
+        """
+        indexes = set()
+        for fields, digit_pos in self.check_digits.values():
+            indexes.update(self.field_indexes(digit_pos))
+            for field in fields:
+                indexes.update(self.field_indexes(field))
+        return indexes
 
     def get_issuer_country(self) -> str:
         country = self.get_field(self.issuer_country_pos)
@@ -135,6 +179,9 @@ class DocumentType:
             birthdate = datetime.strptime(self.get_field(self.birthdate_pos), "%y%m%d").date()
         except ValueError:
             return date(1, 1, 1)
+        # The year has two digits, strptime puts 00-68 into this century, a birthdate can not be in the future
+        if birthdate > datetime.now().astimezone().date():
+            birthdate = birthdate.replace(year=birthdate.year - 100)
         return birthdate
 
     def get_birthdate_checkdigit(self) -> int:
@@ -148,6 +195,32 @@ class DocumentType:
         country = self.get_field(self.nationality_pos)
         return self.country_code_to_name(country)
 
+    def get_check_digit(self, pos: tuple[int, int, int]) -> int:
+        digit = self.get_field(pos)
+        # A filler in place of the check digit counts as 0, e.g. for an empty personal number
+        if digit == "<":
+            return 0
+        try:
+            return int(digit)
+        except ValueError:
+            return -1
+
+    def failed_checks(self) -> list[str]:
+        """
+        Return the names of all check digits that do not match, ["length"] if the MRZ has the wrong length.
+        """
+        if len(self.mrz) != self.row_length * self.row_count:
+            return ["length"]
+        failed = []
+        for name, (fields, digit_pos) in self.check_digits.items():
+            data = "".join(self.get_field(field) for field in fields)
+            if mrz_checksum(data) != self.get_check_digit(digit_pos):
+                failed.append(name)
+        return failed
+
+    def is_valid(self) -> bool:
+        return not self.failed_checks()
+
     def get_person(self) -> Person:
         p = Person()
         p.first_name = self.get_first_name()
@@ -160,7 +233,7 @@ class DocumentType:
 
 class TD1(DocumentType):
     def __init__(self, mrz: str = ""):
-        super(TD1, self).__init__(
+        super().__init__(
             mrz=mrz,
             row_length=30,
             row_count=3,
@@ -169,12 +242,18 @@ class TD1(DocumentType):
             birthdate_pos=(2, 1, 6),
             birthdate_checkdigit_pos=(2, 7, 7),
             nationality_pos=(2, 16, 18),
+            check_digits={
+                "document_number": ([(1, 6, 14)], (1, 15, 15)),
+                "birthdate": ([(2, 1, 6)], (2, 7, 7)),
+                "expiry": ([(2, 9, 14)], (2, 15, 15)),
+                "composite": ([(1, 6, 30), (2, 1, 7), (2, 9, 15), (2, 19, 29)], (2, 30, 30)),
+            },
         )
 
 
 class TD2(DocumentType):
     def __init__(self, mrz: str = ""):
-        super(TD2, self).__init__(
+        super().__init__(
             mrz=mrz,
             row_length=36,
             row_count=2,
@@ -183,12 +262,18 @@ class TD2(DocumentType):
             birthdate_pos=(2, 14, 19),
             birthdate_checkdigit_pos=(2, 20, 20),
             nationality_pos=(2, 11, 13),
+            check_digits={
+                "document_number": ([(2, 1, 9)], (2, 10, 10)),
+                "birthdate": ([(2, 14, 19)], (2, 20, 20)),
+                "expiry": ([(2, 22, 27)], (2, 28, 28)),
+                "composite": ([(2, 1, 10), (2, 14, 20), (2, 22, 35)], (2, 36, 36)),
+            },
         )
 
 
 class TD3(DocumentType):
     def __init__(self, mrz: str = ""):
-        super(TD3, self).__init__(
+        super().__init__(
             mrz=mrz,
             row_length=44,
             row_count=2,
@@ -197,23 +282,49 @@ class TD3(DocumentType):
             birthdate_pos=(2, 14, 19),
             birthdate_checkdigit_pos=(2, 20, 20),
             nationality_pos=(2, 11, 13),
+            check_digits={
+                "document_number": ([(2, 1, 9)], (2, 10, 10)),
+                "birthdate": ([(2, 14, 19)], (2, 20, 20)),
+                "expiry": ([(2, 22, 27)], (2, 28, 28)),
+                "personal_number": ([(2, 29, 42)], (2, 43, 43)),
+                "composite": ([(2, 1, 10), (2, 14, 20), (2, 22, 43)], (2, 44, 44)),
+            },
         )
 
 
-def extract_mrz_from_image(image):
-    reader = easyocr.Reader(['en'])
-    result = reader.readtext(image)
-    pass
+def extract_mrz_from_image(image, engine: Optional[OCREngine] = None, *, locate: bool = True) -> Optional[str]:
+    """
+    Find and read the MRZ in the image, returns the MRZ text or None if there is none.
+    The shared OCR engine is used unless an engine is given.
+    """
+    # Imported here, the recognition pipeline itself depends on this module
+    from disaster_id_scan.recognition import recognize_frame
 
+    return recognize_frame(image, engine, locate=locate).mrz
 
-def mrz_checksum(text: str, start_position: int = 0) -> int:
-    # Assign values to characters 7, 3, 1, 7, 3, 1, ...
-    # https://en.wikipedia.org/wiki/Machine-readable_passport
-    values = [7, 3, 1]
+
+# Character values for the check digit calculation, indexed by ASCII code:
+# 0-9 -> 0-9, A-Z and a-z -> 10-35, everything else (e.g. the filler <) -> 0
+_CHAR_VALUES = bytes(
+    int(chr(code)) if chr(code).isdigit() else ord(chr(code).upper()) - 55 if chr(code).isalpha() else 0
+    for code in range(128)
+) + bytes(128)
+# Weights 7, 3, 1 rotated by start_position
+_WEIGHTS: dict[int, tuple[int, int, int]] = {}
+
+
+def _weights(start_position: int) -> tuple[int, int, int]:
+    weights = _WEIGHTS.get(start_position)
+    if weights is None:
+        values = [7, 3, 1]
+        weights = _WEIGHTS[start_position] = tuple(values[start_position:] + values[:start_position])
+    return weights
+
+
+def _mrz_checksum_unicode(text: str, start_position: int = 0) -> int:
+    # Character by character calculation, only used for text with non ASCII characters
+    values = _weights(start_position)
     text = text.upper()
-    # Reorder by start_position
-    values = values[start_position:] + values[:start_position]
-    # Calculate checksum
     checksum = 0
     for i, char in enumerate(text):
         # A-Z -> 10-35
@@ -225,22 +336,317 @@ def mrz_checksum(text: str, start_position: int = 0) -> int:
     return checksum % 10
 
 
-def parse_mrz(mrz: str) -> Union[Person, None]:
-    '''Parse MRZ'''
+def mrz_checksum(text: str, start_position: int = 0) -> int:
+    # Assign values to characters 7, 3, 1, 7, 3, 1, ...
+    # https://en.wikipedia.org/wiki/Machine-readable_passport
+    if not text.isascii():
+        return _mrz_checksum_unicode(text, start_position)
+    # Map every character to its value with one table lookup, then sum each weight class at once
+    values = text.encode("ascii").translate(_CHAR_VALUES)
+    w0, w1, w2 = _weights(start_position)
+    return (sum(values[0::3]) * w0 + sum(values[1::3]) * w1 + sum(values[2::3]) * w2) % 10
+
+
+# From this number of texts on, mrz_checksums uses the vectorised calculation
+_BATCH_THRESHOLD = 32
+
+
+def mrz_checksums(texts: Iterable[str], start_position: int = 0) -> list[int]:
+    """
+    Calculate the check digits of many texts, same results as mrz_checksum for each text.
+    """
+    texts = list(texts)
+    if len(texts) >= _BATCH_THRESHOLD and all(text.isascii() for text in texts):
+        return mrz_checksum_array(encode_mrz_array(texts), start_position).tolist()
+    return [mrz_checksum(text, start_position) for text in texts]
+
+
+def encode_mrz_array(texts: Sequence[str], width: Optional[int] = None):
+    """
+    Encode ASCII texts as a (len(texts), width) uint8 array of character values for mrz_checksum_array.
+    Shorter texts are padded with the value of the filler <, which does not change the check digit.
+    """
+    # numpy is only needed for the batch calculation, so it is not imported with the module
+    import numpy as np
+
+    if width is None:
+        width = max((len(text) for text in texts), default=0)
+    encoded = b"".join(text.encode("ascii").ljust(width, b"<") for text in texts)
+    table = np.frombuffer(_CHAR_VALUES, dtype=np.uint8)
+    return table[np.frombuffer(encoded, dtype=np.uint8).reshape(len(texts), width)]
+
+
+def mrz_checksum_array(values, start_position: int = 0):
+    """
+    Calculate check digits for a 2D array of character values (see encode_mrz_array), one per row.
+    """
+    import numpy as np
+
+    weights = np.resize(np.array(_weights(start_position), dtype=np.int64), values.shape[1])
+    return (values @ weights) % 10
+
+
+def validate_check_digits(texts: Sequence[str], check_digits: Sequence[str]):
+    """
+    Validate many fields at once, returns a boolean array which is True where the check digit matches.
+    A filler < as check digit counts as 0.
+    """
+    import numpy as np
+
+    expected = np.array([0 if digit == "<" else int(digit) if digit.isdigit() else -1 for digit in check_digits])
+    return np.array(mrz_checksums(texts)) == expected
+
+
+def normalize_mrz(mrz: str) -> str:
     # Remove all whitespaces
-    mrz = mrz.replace(" ", "")
+    mrz = "".join(mrz.split())
     # Everything in MRZ is uppercase
-    mrz = mrz.upper()
+    return mrz.upper()
+
+
+def detect_document_type(mrz: str) -> Optional[DocumentType]:
+    """
+    Return the document type matching the normalized MRZ, None if it does not look like a MRZ.
+    """
+    if not mrz:
+        return None
     # Check if TD1, TD2 or TD3
     # TD3 is a Passport, must start with P
     if mrz[0] == "P":
-        document = TD3(mrz)
+        return TD3(mrz)
     # If A for Aircrew or ~72char+-2, must be TD2
     elif mrz[0] == "A" or len(mrz) in range(70, 74):
-        document = TD2(mrz)
+        return TD2(mrz)
     # If length is 90+-2 -> TD1
     elif len(mrz) in range(88, 92):
-        document = TD1(mrz)
-    else:
+        return TD1(mrz)
+    return None
+
+
+def validate_mrz(mrz: str) -> bool:
+    """
+    Check that the MRZ has the length of its document type and that all check digits match.
+    """
+    document = detect_document_type(normalize_mrz(mrz))
+    return document is not None and document.is_valid()
+
+
+# Characters OCR commonly confuses with each other, the first alternative is the most likely one
+CONFUSIONS = {
+    "0": "OD",
+    "O": "0Q",
+    "Q": "O0",
+    "D": "0O",
+    "1": "IL",
+    "I": "1L",
+    "L": "1I",
+    "8": "B",
+    "B": "8",
+    "5": "S",
+    "S": "5",
+    "2": "Z",
+    "Z": "2",
+    "6": "G",
+    "G": "6",
+    "7": "T",
+    "T": "7",
+    "4": "A",
+    "A": "4",
+    "K": "<",
+}
+# Cost of replacing a character that is not allowed at its position, e.g. a letter in a date
+TYPE_REPAIR_COST = 0.1
+# Cost of assuming a confusion, the cost of each further alternative grows by half of it
+CONFUSION_COST = 1.0
+# Maximum number of changed characters per check digit field
+MAX_FIELD_EDITS = 2
+# Number of candidates per field that are combined for the composite check digit
+MAX_FIELD_CANDIDATES = 4
+# A correction is only accepted if every other correction costs at least this much more. A check digit only
+# tells which of ten classes the field is in, two confusions can often be explained by one as well.
+AMBIGUITY_MARGIN = CONFUSION_COST
+
+
+def _is_allowed(char: str, *, numeric: bool, alpha: bool) -> bool:
+    if numeric:
+        return char.isdigit() or char == "<"
+    if alpha:
+        return not char.isdigit()
+    return True
+
+
+def _alternatives(char: str, *, numeric: bool, alpha: bool) -> list[tuple[str, float]]:
+    # Allowed replacements of a character with their cost
+    alternatives = []
+    for i, alternative in enumerate(CONFUSIONS.get(char, "")):
+        if _is_allowed(alternative, numeric=numeric, alpha=alpha):
+            alternatives.append((alternative, CONFUSION_COST * (1 + 0.5 * i)))
+    return alternatives
+
+
+class ParsedMRZ:
+    """
+    Result of parsing a MRZ with check digit correction.
+    mrz is the corrected MRZ, corrections lists (index, read character, corrected character) for every
+    changed position. valid is True if all check digits match after the correction, confidence is 1.0 for a
+    MRZ that was valid as read and drops with the number and unlikeliness of the corrections.
+    If no correction makes the MRZ valid, or several do about equally well, mrz is the MRZ as read.
+    """
+
+    original: str
+    mrz: str
+    document: DocumentType
+    valid: bool
+    confidence: float
+    corrections: list[tuple[int, str, str]]
+    failed_checks: list[str]
+
+    def __init__(
+        self, original: str, document: DocumentType, confidence: float, corrections: list[tuple[int, str, str]]
+    ):
+        self.original = original
+        self.mrz = document.mrz
+        self.document = document
+        self.failed_checks = document.failed_checks()
+        self.valid = not self.failed_checks
+        self.confidence = confidence if self.valid else 0.0
+        self.corrections = corrections
+
+    def get_person(self) -> Person:
+        return self.document.get_person()
+
+
+def _check(chars: list[str], fields: list[range], digit_index: int) -> bool:
+    data = "".join(chars[i] for field in fields for i in field)
+    digit = chars[digit_index]
+    return mrz_checksum(data) == (0 if digit == "<" else int(digit) if digit.isdigit() else -1)
+
+
+def _field_candidates(
+    chars: list[str], fields: list[range], digit_index: int, numeric: set[int], alpha: set[int]
+) -> list[tuple[float, dict[int, str]]]:
+    """
+    Search the cheapest sets of changes, that make the check digit of the field match.
+    Sets with more changes are searched as well, a cheap set of few changes may not be the only one.
+    """
+    if _check(chars, fields, digit_index):
+        return [(0.0, {})]
+    options = []
+    for index in itertools.chain(*fields, [digit_index]):
+        for alternative, cost in _alternatives(chars[index], numeric=index in numeric, alpha=index in alpha):
+            options.append((index, alternative, cost))
+    indexes = list(itertools.chain(*fields))
+    candidates = []
+    for edits in range(1, MAX_FIELD_EDITS + 1):
+        # Skip combinations with two alternatives for the same position
+        combinations = [
+            combination
+            for combination in itertools.combinations(options, edits)
+            if len({index for index, _, _ in combination}) == edits
+        ]
+        if not combinations:
+            continue
+        # Validate all combinations with the same number of changes in one batch
+        texts = []
+        digits = []
+        for combination in combinations:
+            changed = chars.copy()
+            for index, alternative, _ in combination:
+                changed[index] = alternative
+            texts.append("".join(changed[index] for index in indexes))
+            digits.append(changed[digit_index])
+        for combination, valid in zip(combinations, validate_check_digits(texts, digits)):
+            if valid:
+                changes = {index: alternative for index, alternative, _ in combination}
+                candidates.append((sum(cost for _, _, cost in combination), changes))
+    candidates.sort(key=lambda candidate: candidate[0])
+    return candidates[:MAX_FIELD_CANDIDATES]
+
+
+def correct_mrz(document: DocumentType) -> ParsedMRZ:
+    """
+    Correct OCR errors in the MRZ of the document using its check digits.
+    Characters that are not allowed at their position are replaced first, e.g. O by 0 in dates. Then the
+    cheapest combination of common confusions (O/0, I/1, B/8, S/5, Z/2, ...) is searched, that makes all
+    field check digits and the composite check digit match. The search is bounded by MAX_FIELD_EDITS per
+    field and MAX_FIELD_CANDIDATES per field for the composite check. The correction is only accepted if no
+    other one costs less than AMBIGUITY_MARGIN more, otherwise the document keeps the MRZ as read.
+    """
+    original = document.mrz
+    if len(original) != document.row_length * document.row_count:
+        return ParsedMRZ(original, document, 0.0, [])
+    numeric = document.numeric_indexes()
+    alpha = document.alpha_indexes()
+    chars = list(original)
+    cost = 0.0
+
+    # Replace characters that are not allowed at their position
+    for index, char in enumerate(chars):
+        if not _is_allowed(char, numeric=index in numeric, alpha=index in alpha):
+            alternatives = _alternatives(char, numeric=index in numeric, alpha=index in alpha)
+            if alternatives:
+                chars[index] = alternatives[0][0]
+                cost += TYPE_REPAIR_COST
+
+    checks = {
+        name: ([document.field_indexes(field) for field in fields], document.field_indexes(digit_pos)[0])
+        for name, (fields, digit_pos) in document.check_digits.items()
+    }
+    composite = checks.pop("composite", None)
+    field_candidates = []
+    for fields, digit_index in checks.values():
+        candidates = _field_candidates(chars, fields, digit_index, numeric, alpha)
+        # A field that can not be corrected is left as it is, the result will be invalid
+        field_candidates.append(candidates if candidates else [(0.0, {})])
+
+    # Combine the candidates of all fields, the composite check digit decides between them.
+    # Valid corrected MRZ -> cost of the changes
+    solutions: dict[str, float] = {}
+    for combination in itertools.product(*field_candidates):
+        changed = chars.copy()
+        changes_cost = 0.0
+        for candidate_cost, changes in combination:
+            changes_cost += candidate_cost
+            for index, alternative in changes.items():
+                changed[index] = alternative
+        composite_candidates = [(0.0, {})]
+        if composite is not None:
+            composite_candidates = _field_candidates(changed, composite[0], composite[1], numeric, alpha)
+        for composite_cost, changes in composite_candidates:
+            solution = changed.copy()
+            for index, alternative in changes.items():
+                solution[index] = alternative
+            # Changes for the composite check digit must not break the check digit of a field
+            if all(_check(solution, fields, digit_index) for fields, digit_index in checks.values()):
+                text = "".join(solution)
+                solutions[text] = min(solutions.get(text, math.inf), changes_cost + composite_cost)
+
+    ranked = sorted(solutions.items(), key=lambda solution: solution[1])
+    if not ranked or (len(ranked) > 1 and ranked[1][1] - ranked[0][1] < AMBIGUITY_MARGIN):
+        # No correction, or no clearly most likely one: the MRZ is left as read
+        return ParsedMRZ(original, document, 0.0, [])
+    text, changes_cost = ranked[0]
+    corrections = [
+        (index, read, corrected) for index, (read, corrected) in enumerate(zip(original, text)) if read != corrected
+    ]
+    document.mrz = text
+    return ParsedMRZ(original, document, 1.0 / (1.0 + cost + changes_cost), corrections)
+
+
+def parse_mrz_checked(mrz: str) -> Optional[ParsedMRZ]:
+    """
+    Parse the MRZ and correct OCR errors with the check digits, None if it does not look like a MRZ.
+    """
+    with span("mrz.parse"):
+        document = detect_document_type(normalize_mrz(mrz))
+        if document is None:
+            return None
+        return correct_mrz(document)
+
+
+def parse_mrz(mrz: str) -> Union[Person, None]:
+    """Parse MRZ, OCR errors are corrected using the check digits where possible"""
+    parsed = parse_mrz_checked(mrz)
+    if parsed is None:
         return None
-    return document.get_person()
\ No newline at end of file
+    return parsed.get_person()
@@ -0,0 +1,23 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import unicodedata
+from typing import Optional
+
+# Transliteration of umlauts as used in machine readable zones
+_TRANSLITERATION = str.maketrans({"Ä": "AE", "Ö": "OE", "Ü": "UE", "ß": "SS", "Æ": "AE", "Ø": "OE", "Å": "AA"})
+# Letters that keep no plain form when their accents are removed
+_PLAIN = str.maketrans({"ß": "SS", "Æ": "AE", "Ø": "O"})
+
+
+def normalize_name(name: Optional[str], *, transliterate: bool = True) -> str:
+    """
+    Normalize a name for comparisons: uppercase, umlauts transliterated like in a MRZ, other accents removed,
+    everything but letters and digits replaced by single spaces.
+    Without transliterate, umlauts only lose their dots (Müller -> MULLER), as people type them without umlauts.
+    """
+    if not name:
+        return ""
+    name = name.upper().translate(_TRANSLITERATION if transliterate else _PLAIN)
+    name = "".join(char for char in unicodedata.normalize("NFKD", name) if not unicodedata.combining(char))
+    return " ".join("".join(char if char.isalnum() else " " for char in name).split())
@@ -0,0 +1,164 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import threading
+import time
+from typing import Optional, Sequence
+
+from disaster_id_scan.profiling import record
+
+# Characters that can appear in a machine readable zone
+MRZ_ALLOWLIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789<"
+
+DEFAULT_LANGUAGES = ("de",)
+
+# Recognizers of the MRZ: easyocr reads any text, grid reads the MRZ character grid in milliseconds and passes
+# what it can not read with certainty to easyocr (see disaster_id_scan.grid_ocr)
+RECOGNIZERS = ("easyocr", "grid")
+
+
+class OCRStats:
+    """
+    Timing information of an OCR engine.
+    Model loading and recognition calls are tracked separately, all times in seconds.
+    """
+
+    load_time: Optional[float]
+    calls: int
+    total_call_time: float
+    last_call_time: Optional[float]
+
+    def __init__(self):
+        self.load_time = None
+        self.calls = 0
+        self.total_call_time = 0.0
+        self.last_call_time = None
+
+    def record_call(self, duration: float):
+        self.calls += 1
+        self.total_call_time += duration
+        self.last_call_time = duration
+
+    def mean_call_time(self) -> Optional[float]:
+        if self.calls == 0:
+            return None
+        return self.total_call_time / self.calls
+
+    def __str__(self):
+        load = f"{self.load_time:.2f}s" if self.load_time is not None else "not loaded"
+        mean = self.mean_call_time()
+        last = f"{self.last_call_time:.2f}s" if self.last_call_time is not None else "-"
+        mean = f"{mean:.2f}s" if mean is not None else "-"
+        return f"OCR load: {load}, calls: {self.calls}, last: {last}, mean: {mean}"
+
+
+class OCREngine:
+    """
+    Wrapper around an easyocr reader that loads the models only once.
+    The models can be loaded in the background with warm_up(), the first call to readtext() waits for
+    the loading to finish if it has not happened yet. If loading failed, the error is raised once and the next
+    call loads again, the failure may have been temporary.
+    """
+
+    languages: tuple
+    allowlist: Optional[str]
+    stats: OCRStats
+
+    def __init__(self, languages: Sequence[str] = DEFAULT_LANGUAGES, allowlist: Optional[str] = MRZ_ALLOWLIST):
+        self.languages = tuple(languages)
+        self.allowlist = allowlist
+        self.stats = OCRStats()
+        self._reader = None
+        self._load_error: Optional[BaseException] = None
+        self._load_lock = threading.Lock()
+        self._warm_up_thread: Optional[threading.Thread] = None
+
+    def _load(self):
+        with self._load_lock:
+            if self._reader is not None:
+                return
+            # Import here, loading easyocr pulls in torch which is slow
+            import easyocr
+            import numpy as np
+
+            start = time.perf_counter()
+            reader = easyocr.Reader(list(self.languages))
+            # Run a tiny recognition once, so the first real call does not pay for lazy initialisation
+            reader.readtext(np.zeros((32, 32, 3), dtype=np.uint8))
+            self.stats.load_time = time.perf_counter() - start
+            record("ocr.load", self.stats.load_time)
+            self._reader = reader
+
+    def _warm_up(self):
+        try:
+            self._load()
+        except Exception as e:
+            # Remember the error, it is raised on the next use, which then tries to load again
+            self._load_error = e
+            self._warm_up_thread = None
+
+    def warm_up(self) -> threading.Thread:
+        """
+        Start loading the models in a background thread, returns the thread.
+        Calling this multiple times only starts loading once.
+        """
+        thread = self._warm_up_thread
+        if thread is None:
+            # The thread forgets itself if loading fails, so a later warm up tries again
+            thread = self._warm_up_thread = threading.Thread(target=self._warm_up, name="ocr-warm-up", daemon=True)
+            thread.start()
+        return thread
+
+    def is_ready(self) -> bool:
+        return self._reader is not None
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            error, self._load_error = self._load_error, None
+            if error is not None:
+                raise error
+            self._load()
+        return self._reader
+
+    def readtext(self, image, **kwargs) -> list:
+        """
+        Run easyocr's readtext on the image, the allowlist of the engine is used unless given explicitly.
+        """
+        reader = self.reader
+        if self.allowlist is not None:
+            kwargs.setdefault("allowlist", self.allowlist)
+        start = time.perf_counter()
+        result = reader.readtext(image, **kwargs)
+        duration = time.perf_counter() - start
+        self.stats.record_call(duration)
+        record("ocr", duration)
+        return result
+
+
+_engines: dict = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(
+    languages: Sequence[str] = DEFAULT_LANGUAGES, allowlist: Optional[str] = MRZ_ALLOWLIST, recognizer: str = "easyocr"
+) -> OCREngine:
+    """
+    Return the process wide OCR engine for the given configuration, creating it if necessary.
+    A grid engine uses the easyocr engine of the same configuration as fallback.
+    """
+    if recognizer not in RECOGNIZERS:
+        message = f"Unknown recognizer: {recognizer}"
+        raise ValueError(message)
+    key = (tuple(languages), allowlist)
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = OCREngine(languages, allowlist)
+        if recognizer == "easyocr":
+            return _engines[key]
+        if (*key, recognizer) not in _engines:
+            # Import here, the grid recognizer needs OpenCV
+            from disaster_id_scan.grid_ocr import GridOCREngine
+
+            _engines[(*key, recognizer)] = GridOCREngine(_engines[key])
+        return _engines[(*key, recognizer)]
@@ -0,0 +1,255 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Preparation of camera frames for the OCR: the document is cut out of the frame and its perspective corrected,
+the image is converted to grayscale, its contrast normalized and it is scaled so the MRZ glyphs have the
+height the OCR models read best. Every step is timed as span "preprocess.<step>" and can be skipped, see
+disaster_id_scan.preprocessing.
+"""
+
+import math
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from disaster_id_scan.detect import order_corners, to_grayscale
+from disaster_id_scan.preprocessing import DEFAULT_PREPROCESSING, OCR_GLYPH_HEIGHT, Preprocessing
+from disaster_id_scan.profiling import span
+
+# Size of the documents in mm (ISO/IEC 7810) and glyph height of the MRZ in mm (ICAO 9303 part 3)
+DOCUMENT_SIZES = {
+    "TD1": (85.6, 54.0),
+    "TD2": (105.0, 74.0),
+    "TD3": (125.0, 88.0),
+}
+GLYPH_HEIGHT = 2.3
+
+# Images are only resampled if their glyphs are off by more than this factor
+RESAMPLE_TOLERANCE = 1.2
+# Width the frame is scaled to before searching the card outline
+CARD_DETECTION_WIDTH = 640
+# Share of the frame the card has to cover at least
+MIN_CARD_AREA = 0.15
+# Aspect ratios of a document seen at an angle, ID documents have 1.42 (TD2, TD3) to 1.59 (TD1)
+MIN_CARD_ASPECT = 1.2
+MAX_CARD_ASPECT = 1.9
+# Documents with a larger aspect ratio are taken for TD1
+MIN_TD1_ASPECT = 1.5
+# Margin kept around the rectified document, relative to its width
+CARD_MARGIN = 0.1
+# Text lines of fewer rows are noise
+MIN_LINE_HEIGHT = 2
+
+
+class PreparedFrame:
+    """
+    A frame prepared for locating the MRZ.
+    card holds the corners of the document in the frame (top left, top right, bottom right, bottom left),
+    document_format the format guessed from its shape and document_height its height in pixels in image. They
+    are None if no document outline was found, image is then the frame itself.
+    """
+
+    image: object
+    card: Optional[object]
+    document_format: Optional[str]
+    document_height: Optional[int]
+
+    def __init__(self, image, card=None, document_format: Optional[str] = None, document_height: Optional[int] = None):
+        self.image = image
+        self.card = card
+        self.document_format = document_format
+        self.document_height = document_height
+
+    def glyph_height(self) -> Optional[float]:
+        """
+        Expected height of the MRZ glyphs in pixels, None if it is not known.
+        """
+        if self.document_format is None:
+            return None
+        return self.document_height * GLYPH_HEIGHT / DOCUMENT_SIZES[self.document_format][1]
+
+
+def find_card(image):
+    """
+    Find the outline of a document in the frame, returns its corners (top left, top right, bottom right,
+    bottom left) as float32 array or None. The largest convex quadrilateral with the aspect ratio of an ID
+    document is chosen.
+    """
+
+    gray = to_grayscale(image)
+    height, width = gray.shape[:2]
+    scale = min(1.0, CARD_DETECTION_WIDTH / width)
+    if scale < 1.0:
+        gray = cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    edges = cv2.Canny(gray, 30, 100)
+    # Close small gaps in the outline, e.g. where a finger holds the card
+    edges = cv2.dilate(edges, cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5)))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    frame_area = gray.shape[0] * gray.shape[1]
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True):
+        area = cv2.contourArea(contour)
+        if area < MIN_CARD_AREA * frame_area:
+            break
+        outline = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        # Only a convex quadrilateral can be the card
+        if len(outline) != 4 or not cv2.isContourConvex(outline):  # noqa: PLR2004
+            continue
+        corners = order_corners(outline.reshape(4, 2).astype(np.float32))
+        card_width, card_height = _edge_lengths(corners)
+        aspect_ratio = max(card_width, card_height) / max(1.0, min(card_width, card_height))
+        if MIN_CARD_ASPECT <= aspect_ratio <= MAX_CARD_ASPECT:
+            return corners / scale
+    return None
+
+
+def _edge_lengths(corners) -> tuple[float, float]:
+    top_left, top_right, bottom_right, bottom_left = corners
+    width = max(math.dist(top_left, top_right), math.dist(bottom_left, bottom_right))
+    height = max(math.dist(top_left, bottom_left), math.dist(top_right, bottom_right))
+    return width, height
+
+
+def card_format(aspect_ratio: float) -> str:
+    """
+    Guess the document format from the aspect ratio of the document. TD2 and TD3 have almost the same shape,
+    TD3 is assumed as the more common one.
+    """
+    return "TD1" if aspect_ratio > MIN_TD1_ASPECT else "TD3"
+
+
+def rectify_card(image, corners) -> PreparedFrame:
+    """
+    Warp the document to an upright rectangle with the aspect ratio of its format, at the resolution it has in
+    the frame. A document held upright is turned to landscape. A margin of the frame is kept around the
+    document, the MRZ is printed close to its edge and is not found if it touches the border of the image.
+    """
+
+    width, height = _edge_lengths(corners)
+    if height > width:
+        # Start at the bottom left corner, the long edge becomes the top
+        corners = np.roll(corners, 1, axis=0)
+        width, height = height, width
+    document_format = card_format(width / height)
+    size_w, size_h = DOCUMENT_SIZES[document_format]
+    target_w, target_h = round(width), round(width * size_h / size_w)
+    margin = round(CARD_MARGIN * target_w)
+    left, top, right, bottom = margin, margin, margin + target_w - 1, margin + target_h - 1
+    target = np.array([[left, top], [right, top], [right, bottom], [left, bottom]], np.float32)
+    matrix = cv2.getPerspectiveTransform(corners.astype(np.float32), target)
+    rectified = cv2.warpPerspective(
+        image,
+        matrix,
+        (target_w + 2 * margin, target_h + 2 * margin),
+        flags=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_REPLICATE,
+    )
+    return PreparedFrame(rectified, corners, document_format, target_h)
+
+
+def normalize_contrast(image):
+    """
+    Equalize the contrast locally (CLAHE), so glare and shadows on the document do not hide characters.
+    Color images are equalized on their lightness.
+    """
+
+    height, width = image.shape[:2]
+    # Tiles of about 64 pixels, a MRZ crop of two lines is equalized in horizontal stripes
+    tiles = (max(1, min(8, width // 64)), max(1, min(8, height // 64)))
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=tiles)
+    # Grayscale images have no channel axis
+    if image.ndim == 2:  # noqa: PLR2004
+        return clahe.apply(image)
+    lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+    lab[:, :, 0] = clahe.apply(lab[:, :, 0])
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+
+
+def estimate_glyph_height(strip) -> Optional[float]:
+    """
+    Height of the text lines of a horizontal grayscale strip with dark text (e.g. the MRZ crop) in pixels,
+    from the rows that contain ink. None if no text line is found.
+    """
+
+    _, binary = cv2.threshold(strip, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    profile = binary.sum(axis=1)
+    if profile.max() == 0:
+        return None
+    filled = np.concatenate(([False], profile > 0.25 * profile.max(), [False]))
+    changes = np.flatnonzero(filled[1:] != filled[:-1])
+    runs = changes[1::2] - changes[::2]
+    runs = runs[runs >= MIN_LINE_HEIGHT]
+    return float(np.median(runs)) if len(runs) else None
+
+
+def resample(image, glyph_height: Optional[float], target: float = OCR_GLYPH_HEIGHT):
+    """
+    Scale the image so glyphs of glyph_height pixels get the target height. Images whose glyphs are within
+    RESAMPLE_TOLERANCE of the target, or whose glyph height is not known, are returned as they are.
+    """
+
+    if not glyph_height:
+        return image
+    factor = target / glyph_height
+    if 1 / RESAMPLE_TOLERANCE <= factor <= RESAMPLE_TOLERANCE:
+        return image
+    height, width = image.shape[:2]
+    size = (max(1, round(width * factor)), max(1, round(height * factor)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA if factor < 1 else cv2.INTER_CUBIC)
+
+
+def prepare_frame(frame, preprocessing: Preprocessing = DEFAULT_PREPROCESSING) -> PreparedFrame:
+    """
+    Cut the document out of the frame and convert it to grayscale, as enabled, before the MRZ is located.
+    """
+
+    prepared = PreparedFrame(frame)
+    if preprocessing.enabled("card"):
+        with span("preprocess.card"):
+            corners = find_card(frame)
+            if corners is not None:
+                prepared = rectify_card(frame, corners)
+    if preprocessing.enabled("grayscale"):
+        with span("preprocess.grayscale"):
+            prepared.image = to_grayscale(prepared.image)
+    return prepared
+
+
+def prepare_crop(crop, *, upside_down: bool = False, preprocessing: Preprocessing = DEFAULT_PREPROCESSING):
+    """
+    Prepare the rectified MRZ crop for the OCR. upside_down is set if the MRZ was found in the upper half of
+    the rectified document, MRZs are printed at the bottom.
+    """
+
+    if upside_down and preprocessing.enabled("orient"):
+        with span("preprocess.orient"):
+            crop = cv2.rotate(crop, cv2.ROTATE_180)
+    if preprocessing.enabled("contrast"):
+        with span("preprocess.contrast"):
+            crop = normalize_contrast(crop)
+    if preprocessing.enabled("resample"):
+        with span("preprocess.resample"):
+            crop = resample(crop, estimate_glyph_height(crop), preprocessing.glyph_height)
+    return crop
+
+
+def prepare_full_frame(
+    prepared: PreparedFrame, *, upside_down: bool = False, preprocessing: Preprocessing = DEFAULT_PREPROCESSING
+):
+    """
+    Prepare the whole (rectified) frame for the OCR, used when the MRZ could not be read from its crop.
+    """
+
+    image = prepared.image
+    if upside_down and preprocessing.enabled("orient"):
+        with span("preprocess.orient"):
+            image = cv2.rotate(image, cv2.ROTATE_180)
+    if preprocessing.enabled("contrast"):
+        with span("preprocess.contrast"):
+            image = normalize_contrast(image)
+    if preprocessing.enabled("resample"):
+        with span("preprocess.resample"):
+            image = resample(image, prepared.glyph_height(), preprocessing.glyph_height)
+    return image
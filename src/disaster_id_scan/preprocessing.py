@@ -0,0 +1,45 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Which preprocessing steps run before the OCR, see disaster_id_scan.preprocess for the steps themselves.
+Kept apart from them, so the command line can offer the step names without loading OpenCV.
+"""
+
+from typing import Iterable
+
+# Steps in the order they are applied
+PREPROCESS_STEPS = ("card", "orient", "grayscale", "contrast", "resample")
+
+# Glyph height in pixels the OCR is given, the rectified MRZ crop of detect has about this height. Larger
+# glyphs make the OCR slower without reading better.
+OCR_GLYPH_HEIGHT = 20
+
+
+class Preprocessing:
+    """
+    Which preprocessing steps are applied (see PREPROCESS_STEPS) and the glyph height to resample to.
+    """
+
+    steps: frozenset
+    glyph_height: int
+
+    def __init__(self, skip: Iterable[str] = (), glyph_height: int = OCR_GLYPH_HEIGHT):
+        skip = set(skip)
+        unknown = skip.difference(PREPROCESS_STEPS)
+        if unknown:
+            message = f"Unknown preprocessing steps: {', '.join(sorted(unknown))}"
+            raise ValueError(message)
+        self.steps = frozenset(PREPROCESS_STEPS).difference(skip)
+        self.glyph_height = glyph_height
+
+    def enabled(self, step: str) -> bool:
+        return step in self.steps
+
+    def __repr__(self):
+        return f"Preprocessing({', '.join(step for step in PREPROCESS_STEPS if step in self.steps)})"
+
+
+DEFAULT_PREPROCESSING = Preprocessing()
+# Frames are passed to the OCR as the camera delivers them
+NO_PREPROCESSING = Preprocessing(PREPROCESS_STEPS)
@@ -0,0 +1,192 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import threading
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+from disaster_id_scan.frames import FrameGrabber
+from disaster_id_scan.profiling import record, span
+
+# Frames per second shown in the preview
+PREVIEW_FPS = 15
+# Frames wider than this are scaled down for the preview
+PREVIEW_WIDTH = 1000
+
+
+def preview_size(width: int, height: int, max_width: int = PREVIEW_WIDTH) -> tuple[int, int]:
+    if width <= max_width:
+        return width, height
+    return max_width, int(height * max_width / width)
+
+
+class PreviewStats:
+    """
+    Frame rate, latency and CPU usage of a preview, all times in seconds.
+    latency is the time from the capture of a frame until it is shown. The CPU time of the preview thread and
+    the time spent in the Tk thread to show frames are counted separately, as each is written by its thread.
+    """
+
+    started: float
+    frames_prepared: int
+    frames_shown: int
+    frames_dropped: int
+    total_latency: float
+    last_latency: Optional[float]
+    prepare_cpu_time: float
+    show_time: float
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.frames_prepared = 0
+        self.frames_shown = 0
+        self.frames_dropped = 0
+        self.total_latency = 0.0
+        self.last_latency = None
+        self.prepare_cpu_time = 0.0
+        self.show_time = 0.0
+
+    def record_shown(self, latency: float, duration: float):
+        self.frames_shown += 1
+        self.total_latency += latency
+        self.last_latency = latency
+        self.show_time += duration
+
+    def fps(self) -> float:
+        return self.frames_shown / max(time.monotonic() - self.started, 1e-9)
+
+    def mean_latency(self) -> Optional[float]:
+        if self.frames_shown == 0:
+            return None
+        return self.total_latency / self.frames_shown
+
+    def cpu_usage(self) -> float:
+        # Share of one core
+        return (self.prepare_cpu_time + self.show_time) / max(time.monotonic() - self.started, 1e-9)
+
+    def __str__(self):
+        latency = self.mean_latency()
+        latency = f"{latency * 1000:.0f}ms" if latency is not None else "-"
+        return (
+            f"Preview: {self.fps():.1f} fps, prepared: {self.frames_prepared}, shown: {self.frames_shown}, "
+            f"dropped: {self.frames_dropped}, latency: {latency}, CPU: {self.cpu_usage():.0%}"
+        )
+
+
+class PreviewPipeline:
+    """
+    Live preview of a camera in a Tk label.
+    A background thread takes the newest frame of the grabber whenever one is due at the preview frame rate and
+    scales it with a single cv2.resize into one of three reused RGB buffers. The Tk thread only pastes the newest
+    prepared frame into the same PhotoImage, frames that were not shown before the next one was ready are dropped.
+    """
+
+    fps: float
+    stats: PreviewStats
+
+    def __init__(self, grabber: FrameGrabber, image_label, fps: float = PREVIEW_FPS, max_width: int = PREVIEW_WIDTH):
+        self.grabber = grabber
+        self.image_label = image_label
+        self.fps = fps
+        self.max_width = max_width
+        self.stats = PreviewStats()
+        self.is_running = False
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._buffers: list[np.ndarray] = []
+        self._scaled: Optional[np.ndarray] = None
+        # Buffer index and capture time of the newest prepared frame, and the index of the shown buffer
+        self._ready: Optional[tuple[int, float]] = None
+        self._showing: Optional[int] = None
+        self._photo: Optional[ImageTk.PhotoImage] = None
+        self._last_shown: Optional[float] = None
+
+    def start(self):
+        self.is_running = True
+        self.stats = PreviewStats()
+        self._thread = threading.Thread(target=self._run, name="preview", daemon=True)
+        self._thread.start()
+        self._show()
+
+    def stop(self):
+        self.is_running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _prepare(self, frame: np.ndarray) -> int:
+        height, width = frame.shape[:2]
+        size = preview_size(width, height, self.max_width)
+        if not self._buffers or self._buffers[0].shape[:2] != (size[1], size[0]):
+            self._buffers = [np.empty((size[1], size[0], 3), np.uint8) for _ in range(3)]
+            self._scaled = np.empty((size[1], size[0], 3), np.uint8)
+        with self._lock:
+            busy = {self._showing, self._ready[0] if self._ready is not None else None}
+        index = next(index for index in range(3) if index not in busy)
+        if size == (width, height):
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._buffers[index])
+        else:
+            cv2.resize(frame, size, dst=self._scaled, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(self._scaled, cv2.COLOR_BGR2RGB, dst=self._buffers[index])
+        return index
+
+    def _run(self):
+        interval = 1 / self.fps
+        due = time.monotonic()
+        cpu_start = time.thread_time()
+        # Frames between two due times are skipped by the subscription and never converted
+        subscription = self.grabber.subscribe()
+        while self.is_running:
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            frame = subscription.get(timeout=0.5)
+            if frame is None:
+                continue
+            due = max(due + interval, time.monotonic())
+            with span("preview.prepare"):
+                index = self._prepare(frame.image)
+            self.stats.frames_prepared += 1
+            with self._lock:
+                if self._ready is not None:
+                    self.stats.frames_dropped += 1
+                self._ready = (index, frame.timestamp)
+            cpu_now = time.thread_time()
+            self.stats.prepare_cpu_time += cpu_now - cpu_start
+            cpu_start = cpu_now
+
+    def _show(self):
+        if not self.is_running:
+            return
+        start = time.perf_counter()
+        with self._lock:
+            ready, self._ready = self._ready, None
+            if ready is not None:
+                self._showing = ready[0]
+        if ready is not None:
+            index, captured = ready
+            buffer = self._buffers[index]
+            height, width = buffer.shape[:2]
+            # Wraps the buffer without a copy, paste() copies it into the existing Tk image
+            image = Image.frombuffer("RGB", (width, height), buffer, "raw", "RGB", 0, 1)
+            if self._photo is None or (self._photo.width(), self._photo.height()) != (width, height):
+                self._photo = ImageTk.PhotoImage(image=image)
+                self.image_label.imgtk = self._photo
+                self.image_label.configure(image=self._photo, width=width, height=height)
+            else:
+                self._photo.paste(image)
+            with self._lock:
+                self._showing = None
+            latency = time.monotonic() - captured
+            self.stats.record_shown(latency, time.perf_counter() - start)
+            record("preview.show", time.perf_counter() - start)
+            record("preview.latency", latency)
+            if self._last_shown is not None:
+                # The reciprocal of the frame interval is the preview frame rate
+                record("preview.interval", start - self._last_shown)
+            self._last_shown = start
+        self.image_label.after(max(int(1000 / self.fps), 1), self._show)
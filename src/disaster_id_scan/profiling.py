@@ -0,0 +1,161 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Timing of the stages of the intake (capture, preprocessing, OCR, MRZ parsing, saving, export, preview).
+Profiling is off by default, a span then costs one attribute lookup and a function call. Turn it on with
+enable() or the --profile option of the CLI.
+
+    with span("ocr"):
+        engine.readtext(image)
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+# Durations kept per stage for the percentiles
+WINDOW = 1000
+
+
+class StageStats:
+    """
+    Durations of a stage in seconds: count and total since the start, percentiles over the last WINDOW ones.
+    """
+
+    name: str
+    count: int
+    total: float
+
+    def __init__(self, name: str, window: int = WINDOW):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self._recent: deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self._recent.append(seconds)
+
+    def percentile(self, share: float) -> Optional[float]:
+        recent = sorted(self._recent)
+        if not recent:
+            return None
+        return recent[min(len(recent) - 1, int(share * len(recent)))]
+
+    def p50(self) -> Optional[float]:
+        return self.percentile(0.5)
+
+    def p95(self) -> Optional[float]:
+        return self.percentile(0.95)
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "total": self.total, "p50": self.p50(), "p95": self.p95()}
+
+    def __str__(self):
+        p50, p95 = self.p50(), self.p95()
+        if p50 is None:
+            return f"{self.name:22} no samples"
+        return f"{self.name:22} n={self.count:<7} p50 {p50 * 1000:9.2f} ms   p95 {p95 * 1000:9.2f} ms"
+
+
+class _Span:
+    __slots__ = ("name", "profiler", "start")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Profiler:
+    """
+    Collects the durations of named spans from all threads.
+    """
+
+    enabled: bool
+
+    def __init__(self, *, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stages: dict[str, StageStats] = {}
+
+    def span(self, name: str):
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    def record(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = StageStats(name)
+            stage.add(seconds)
+
+    def get(self, name: str) -> Optional[StageStats]:
+        with self._lock:
+            return self._stages.get(name)
+
+    def stages(self) -> list[StageStats]:
+        with self._lock:
+            return sorted(self._stages.values(), key=lambda stage: stage.name)
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+    def report(self) -> str:
+        stages = self.stages()
+        if not stages:
+            return "No timings recorded"
+        return "\n".join(str(stage) for stage in stages)
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump({stage.name: stage.to_dict() for stage in self.stages()}, f, indent=2)
+
+
+PROFILER = Profiler()
+
+
+def enable(*, enabled: bool = True):
+    PROFILER.enabled = enabled
+
+
+def is_enabled() -> bool:
+    return PROFILER.enabled
+
+
+def span(name: str):
+    """
+    Context manager timing the enclosed block as stage name, does nothing while profiling is off.
+    """
+    return PROFILER.span(name)
+
+
+def record(name: str, seconds: float):
+    PROFILER.record(name, seconds)
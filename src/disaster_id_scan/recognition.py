@@ -0,0 +1,291 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import itertools
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from disaster_id_scan.detect import MRZRegion, locate_mrz
+from disaster_id_scan.mrz import ParsedMRZ, parse_mrz_checked
+from disaster_id_scan.ocr import OCREngine, get_engine
+from disaster_id_scan.preprocess import prepare_crop, prepare_frame, prepare_full_frame
+from disaster_id_scan.preprocessing import DEFAULT_PREPROCESSING, Preprocessing
+from disaster_id_scan.profiling import span
+from disaster_id_scan.recognition_cache import Fingerprint, RecognitionCache
+from disaster_id_scan.store import Person
+
+
+class RecognitionResult:
+    """
+    Result of recognizing a MRZ in a frame.
+    person, mrz and parsed are None if no MRZ could be parsed, mrz is the MRZ after check digit correction.
+    full_frame is True if the whole frame had to be read because no MRZ region was found or the cropped
+    region could not be parsed. The region is given in coordinates of the rectified document if card is set,
+    card holds the corners of the document in the frame. cached is True if the result was taken from a
+    RecognitionCache instead of running the OCR.
+    """
+
+    person: Optional[Person]
+    mrz: Optional[str]
+    parsed: Optional[ParsedMRZ]
+    region: Optional[MRZRegion]
+    card: Optional[np.ndarray]
+    full_frame: bool
+    cached: bool
+    texts: list[str]
+
+    def __init__(self):
+        self.person = None
+        self.mrz = None
+        self.parsed = None
+        self.region = None
+        self.card = None
+        self.full_frame = False
+        self.cached = False
+        self.texts = []
+
+
+class RecognitionJob:
+    """
+    A recognition submitted to a RecognitionQueue.
+    stage describes what the job is currently doing, it can be shown as progress.
+    A cancelled job stops at the next stage and its result is discarded.
+    """
+
+    job_id: int
+    stage: str
+    future: Optional[Future]
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.stage = "queued"
+        self.future = None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.future is not None:
+            # Only succeeds if the job has not started yet, a running OCR call can not be interrupted
+            self.future.cancel()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def set_stage(self, stage: str):
+        self.stage = stage
+
+
+class JobCancelledError(Exception):
+    pass
+
+
+def read_mrz(image: np.ndarray, engine: OCREngine, result: RecognitionResult) -> bool:
+    """
+    Run OCR on the image and parse the first text block that looks like a MRZ into the result.
+    Returns True if a MRZ was parsed.
+    """
+    for element in engine.readtext(image, paragraph=True):
+        text = element[1].upper()
+        result.texts.append(text)
+        if "<" in text:
+            # Assume that it could be the MRZ, try to parse it
+            parsed = parse_mrz_checked(text)
+            if parsed is not None:
+                result.parsed = parsed
+                result.person = parsed.get_person()
+                result.mrz = parsed.mrz
+                return True
+    return False
+
+
+def _enter_stage(job: Optional[RecognitionJob], stage: str):
+    if job is None:
+        return
+    if job.is_cancelled():
+        raise JobCancelledError
+    job.set_stage(stage)
+
+
+def recognize_frame(
+    frame: np.ndarray,
+    engine: Optional[OCREngine] = None,
+    *,
+    locate: bool = True,
+    job: Optional[RecognitionJob] = None,
+    fallback: bool = True,
+    preprocessing: Preprocessing = DEFAULT_PREPROCESSING,
+    cache: Optional[RecognitionCache] = None,
+) -> RecognitionResult:
+    """
+    Find the MRZ in the frame and read it.
+    The frame is preprocessed first (see disaster_id_scan.preprocess). Only the cropped MRZ region is passed
+    to OCR, the full frame is read as fallback if no region is found or the region does not contain a
+    readable MRZ. Set locate to False to always read the full frame, set fallback to False to never read it.
+    If a job is given, its stage is updated and JobCancelledError is raised once it is cancelled.
+    With a cache, the result of a near identical earlier frame is returned without running the OCR.
+    """
+    if engine is None:
+        engine = get_engine()
+    if cache is None:
+        return _recognize(frame, engine, locate=locate, job=job, fallback=fallback, preprocessing=preprocessing)
+    # A parsed MRZ is the answer to any options, a failed reading only to the options it was made with
+    variant = (locate, fallback, preprocessing.steps)
+    with span("cache.lookup"):
+        fingerprint = Fingerprint(frame)
+        cached = cache.get(fingerprint, variant)
+    if cached is not None:
+        return _copy_result(cached)
+    result = _recognize(frame, engine, locate=locate, job=job, fallback=fallback, preprocessing=preprocessing)
+    cache.put(fingerprint, result, None if result.parsed is not None else variant)
+    return result
+
+
+def _copy_result(cached: RecognitionResult) -> RecognitionResult:
+    result = RecognitionResult()
+    result.parsed = cached.parsed
+    result.mrz = cached.mrz
+    # Every result gets its own person, the store assigns the id to it
+    result.person = cached.parsed.get_person() if cached.parsed is not None else None
+    result.region = cached.region
+    result.card = cached.card
+    result.full_frame = cached.full_frame
+    result.texts = list(cached.texts)
+    result.cached = True
+    return result
+
+
+def _recognize(
+    frame: np.ndarray,
+    engine: OCREngine,
+    *,
+    locate: bool,
+    job: Optional[RecognitionJob],
+    fallback: bool,
+    preprocessing: Preprocessing,
+) -> RecognitionResult:
+    result = RecognitionResult()
+    _enter_stage(job, "preparing image")
+    prepared = prepare_frame(frame, preprocessing)
+    result.card = prepared.card
+    upside_down = False
+    if locate:
+        _enter_stage(job, "locating MRZ")
+        with span("preprocess"):
+            result.region = locate_mrz(prepared.image)
+        if result.region is not None:
+            _, y, _, h = result.region.bbox
+            # The MRZ is at the bottom of a document, found in the upper half the document is upside down
+            upside_down = prepared.card is not None and y + h / 2 < prepared.image.shape[0] / 2
+            _enter_stage(job, "reading MRZ")
+            if read_mrz(
+                prepare_crop(result.region.crop, upside_down=upside_down, preprocessing=preprocessing), engine, result
+            ):
+                return result
+        if not fallback:
+            return result
+    _enter_stage(job, "reading full frame")
+    result.full_frame = True
+    read_mrz(prepare_full_frame(prepared, upside_down=upside_down, preprocessing=preprocessing), engine, result)
+    return result
+
+
+class RecognitionQueue:
+    """
+    Runs recognitions in a pool of worker threads, so the caller (e.g. the Tk event loop) is never blocked.
+    Finished jobs are collected in a queue and fetched with poll(). Submitting a new frame supersedes all
+    jobs that are still queued or running, their results are dropped. Queues can share a RecognitionCache.
+    """
+
+    engine: OCREngine
+
+    def __init__(
+        self,
+        engine: Optional[OCREngine] = None,
+        workers: int = 1,
+        preprocessing: Preprocessing = DEFAULT_PREPROCESSING,
+        cache: Optional[RecognitionCache] = None,
+    ):
+        self.engine = engine if engine is not None else get_engine()
+        self.preprocessing = preprocessing
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recognition")
+        self._results = queue.Queue()
+        self._job_ids = itertools.count(1)
+        self._active: dict[int, RecognitionJob] = {}
+        self._lock = threading.Lock()
+
+    def _run(self, job: RecognitionJob, frame: np.ndarray, *, locate: bool, fallback: bool):
+        try:
+            result = recognize_frame(
+                frame,
+                self.engine,
+                locate=locate,
+                job=job,
+                fallback=fallback,
+                preprocessing=self.preprocessing,
+                cache=self.cache,
+            )
+            error = None
+        except JobCancelledError:
+            return
+        except Exception as e:
+            result = None
+            error = e
+        self._results.put((job, result, error))
+
+    def submit(self, frame: np.ndarray, *, locate: bool = True, fallback: bool = True) -> RecognitionJob:
+        """
+        Queue a frame for recognition, cancelling older jobs.
+        """
+        with self._lock:
+            self._cancel_active()
+            job = RecognitionJob(next(self._job_ids))
+            self._active[job.job_id] = job
+            job.future = self._executor.submit(self._run, job, frame, locate=locate, fallback=fallback)
+        return job
+
+    def _cancel_active(self):
+        for job in self._active.values():
+            job.cancel()
+        self._active.clear()
+
+    def cancel(self):
+        """
+        Cancel all queued and running jobs.
+        """
+        with self._lock:
+            self._cancel_active()
+
+    def current_job(self) -> Optional[RecognitionJob]:
+        """
+        Return the job that is still being processed, None if the queue is idle.
+        """
+        with self._lock:
+            for job in self._active.values():
+                return job
+        return None
+
+    def poll(self) -> list:
+        """
+        Return the finished jobs as (job, result, error) without blocking, superseded jobs are skipped.
+        """
+        finished = []
+        while True:
+            try:
+                job, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                if self._active.pop(job.job_id, None) is None:
+                    # Cancelled or superseded in the meantime
+                    continue
+            finished.append((job, result, error))
+        return finished
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
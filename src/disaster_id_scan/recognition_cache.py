@@ -0,0 +1,177 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Cache of recognition results for near identical frames, e.g. of a document lying still under the camera.
+A frame is looked up by a perceptual hash, candidates are then compared with the frame aligned to them, block
+by block. A document that differs in a single character of the MRZ is not a hit, the cache must never return
+the person of another document.
+The whole frame is compared and not the MRZ crop: the crop of the same document differs from frame to frame
+by a few pixels in size and position, more than the crops of two documents differ.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+import cv2
+import numpy as np
+
+from disaster_id_scan.detect import to_grayscale
+
+# Width of the thumbnails the frames are compared on
+THUMBNAIL_WIDTH = 800
+# Size of the blocks whose mean difference is compared, about a MRZ character in the thumbnail
+BLOCK_SIZE = (8, 8)
+# Pixels at the border of the aligned thumbnails that are not compared
+ALIGN_MARGIN = 3
+
+
+class Fingerprint:
+    """
+    Perceptual hash and thumbnail of a frame.
+    The hash is a 64 bit difference hash of the blurred frame, the thumbnail a blurred grayscale copy at most
+    THUMBNAIL_WIDTH wide.
+    """
+
+    __slots__ = ("hash", "shape", "thumbnail")
+
+    hash: int
+    shape: tuple
+    thumbnail: np.ndarray
+
+    def __init__(self, image: np.ndarray):
+        gray = to_grayscale(image)
+        self.shape = gray.shape
+        scale = min(1.0, THUMBNAIL_WIDTH / gray.shape[1])
+        thumbnail = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+        self.thumbnail = cv2.GaussianBlur(thumbnail.astype(np.float32), (3, 3), 0)
+        small = cv2.resize(self.thumbnail, (9, 8), interpolation=cv2.INTER_AREA)
+        bits = (small[:, 1:] > small[:, :-1]).ravel()
+        self.hash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+    def hash_distance(self, other: "Fingerprint") -> int:
+        return bin(self.hash ^ other.hash).count("1")
+
+    def difference(self, other: "Fingerprint") -> float:
+        """
+        Largest mean difference of a block (0 to 1) after aligning the thumbnails, which tolerates a document
+        moved by a few pixels.
+        """
+        height, width = self.thumbnail.shape
+        (dx, dy), _ = cv2.phaseCorrelate(self.thumbnail, other.thumbnail)
+        shifted = cv2.warpAffine(
+            self.thumbnail, np.float32([[1, 0, dx], [0, 1, dy]]), (width, height), borderMode=cv2.BORDER_REPLICATE
+        )
+        margin = ALIGN_MARGIN + int(max(abs(dx), abs(dy)))
+        diff = np.abs(shifted - other.thumbnail)[margin : height - margin, margin : width - margin]
+        if diff.size == 0:
+            return 1.0
+        return float(cv2.boxFilter(diff, -1, BLOCK_SIZE).max()) / 255
+
+
+class CacheEntry:
+    __slots__ = ("created", "fingerprint", "value", "variant")
+
+    def __init__(self, fingerprint: Fingerprint, value, variant: Optional[Hashable]):
+        self.fingerprint = fingerprint
+        self.value = value
+        self.variant = variant
+        self.created = time.monotonic()
+
+
+class CacheStats:
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hit_rate(self) -> Optional[float]:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+    def __str__(self):
+        rate = self.hit_rate()
+        rate = f"{rate:.0%}" if rate is not None else "-"
+        return f"Recognition cache hits: {self.hits}, misses: {self.misses} ({rate}), evictions: {self.evictions}"
+
+
+class RecognitionCache:
+    """
+    Bounded LRU cache of recognition results, keyed by the perceptual hash of the frame.
+    An entry is a hit if its hash differs in at most max_hash_distance bits and no block of the aligned frames
+    differs by more than max_difference. Entries expire ttl seconds after they were added, the document may have
+    been replaced by a similar looking one in the meantime.
+    A variant can be stored with a value, e.g. the options it was computed with, get() only returns values of
+    the same variant or of variant None.
+    """
+
+    max_entries: int
+    ttl: float
+    max_difference: float
+    max_hash_distance: int
+    stats: CacheStats
+
+    def __init__(
+        self, max_entries: int = 16, ttl: float = 30.0, max_difference: float = 0.15, max_hash_distance: int = 16
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_difference = max_difference
+        self.max_hash_distance = max_hash_distance
+        self.stats = CacheStats()
+        self._entries: OrderedDict[int, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, fingerprint: Fingerprint, variant: Optional[Hashable] = None):
+        """
+        Return the value of the most similar frame, None if no frame is similar enough.
+        """
+        with self._lock:
+            self._expire()
+            best = None
+            best_difference = self.max_difference
+            for key, entry in self._entries.items():
+                if entry.variant is not None and entry.variant != variant:
+                    continue
+                if entry.fingerprint.shape != fingerprint.shape:
+                    continue
+                if entry.fingerprint.hash_distance(fingerprint) > self.max_hash_distance:
+                    continue
+                difference = entry.fingerprint.difference(fingerprint)
+                if difference <= best_difference:
+                    best, best_difference = key, difference
+            if best is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            self._entries.move_to_end(best)
+            return self._entries[best].value
+
+    def put(self, fingerprint: Fingerprint, value, variant: Optional[Hashable] = None):
+        with self._lock:
+            # A frame with the same hash replaces the older entry
+            self._entries.pop(fingerprint.hash, None)
+            self._entries[fingerprint.hash] = CacheEntry(fingerprint, value, variant)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def _expire(self):
+        deadline = time.monotonic() - self.ttl
+        # Entries are ordered by use, not by age, all have to be checked
+        for key in [key for key, entry in self._entries.items() if entry.created < deadline]:
+            del self._entries[key]
+            self.stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,146 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import heapq
+from collections import Counter
+from typing import Optional
+
+from disaster_id_scan.names import normalize_name
+
+# Share of the trigrams of a query word that have to occur in a name, for the name to match with typos
+MIN_TRIGRAM_SCORE = 0.5
+# Shorter words are only matched as prefix, their trigrams occur in too many names
+MIN_TRIGRAM_WORD = 3
+
+
+def trigrams(word: str) -> set[str]:
+    # Padded like in pg_trgm, so the start of a word weighs more and short words have trigrams
+    padded = f"  {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def name_tokens(last_name: Optional[str], first_name: Optional[str]) -> list[str]:
+    # Names with umlauts are indexed transliterated (MUELLER) and without dots (MULLER)
+    tokens = []
+    for name in (last_name, first_name):
+        tokens.extend(normalize_name(name).split())
+        tokens.extend(normalize_name(name, transliterate=False).split())
+    return list(dict.fromkeys(tokens))
+
+
+def query_words(query: str) -> list[tuple[str, ...]]:
+    # The forms of every word of the query, transliterating does not change the number of words
+    return [
+        tuple(dict.fromkeys(forms))
+        for forms in zip(normalize_name(query).split(), normalize_name(query, transliterate=False).split())
+    ]
+
+
+def prefixes(tokens: list[str]) -> set[str]:
+    return {token[:end] for token in tokens for end in range(1, len(token) + 1)}
+
+
+class NameIndex:
+    """
+    In-memory index over the normalized names of the registrants, for search as you type.
+    Names are normalized like MRZ spellings (umlauts transliterated, accents removed) and also with umlauts
+    without dots, so "Müller", "Mueller" and "MULLER" are found alike, and so is "Mull" while typing. A query
+    word matches names with a word starting with it, or with typos when enough of its trigrams occur in the
+    name. The index is updated per person, in time proportional to the length of the names.
+    """
+
+    def __init__(self):
+        self._tokens: dict[int, list[str]] = {}
+        # Every prefix of a name word -> person ids, for prefix searches
+        self._prefixes: dict[str, set[int]] = {}
+        self._trigrams: dict[str, set[int]] = {}
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def clear(self):
+        self._tokens = {}
+        self._prefixes = {}
+        self._trigrams = {}
+
+    def add(self, person_id: int, last_name: Optional[str], first_name: Optional[str]):
+        tokens = name_tokens(last_name, first_name)
+        self._tokens[person_id] = tokens
+        for prefix in prefixes(tokens):
+            self._prefixes.setdefault(prefix, set()).add(person_id)
+        for trigram in set().union(*(trigrams(token) for token in tokens)):
+            self._trigrams.setdefault(trigram, set()).add(person_id)
+
+    def add_many(self, names: list[tuple[int, Optional[str], Optional[str]]]):
+        """
+        Add (id, last name, first name) of many persons.
+        """
+        for person_id, last_name, first_name in names:
+            self.add(person_id, last_name, first_name)
+
+    def remove(self, person_id: int):
+        tokens = self._tokens.pop(person_id, None)
+        if tokens is None:
+            return
+        for index, keys in (
+            (self._prefixes, prefixes(tokens)),
+            (self._trigrams, set().union(*(trigrams(token) for token in tokens))),
+        ):
+            for key in keys:
+                ids = index[key]
+                ids.discard(person_id)
+                if not ids:
+                    del index[key]
+
+    def update(self, person_id: int, last_name: Optional[str], first_name: Optional[str]):
+        self.remove(person_id)
+        self.add(person_id, last_name, first_name)
+
+    def _prefix_matches(self, forms: tuple[str, ...]) -> set[int]:
+        # Persons with a name word starting with any form of the query word
+        return set().union(*(self._prefixes.get(form, ()) for form in forms))
+
+    def _trigram_scores(self, word: str) -> dict[int, float]:
+        word_trigrams = trigrams(word)
+        counts = Counter()
+        for trigram in word_trigrams:
+            counts.update(self._trigrams.get(trigram, ()))
+        return {
+            person_id: count / len(word_trigrams)
+            for person_id, count in counts.items()
+            if count / len(word_trigrams) >= MIN_TRIGRAM_SCORE
+        }
+
+    def search(self, query: str, limit: int = 20) -> list[int]:
+        """
+        Return the ids of the best matching persons, best first.
+        Every word of the query has to match a name word by prefix (score 1) or by trigrams. The trigrams are
+        only searched if there are not enough prefix matches, exact input stays fast with many registrants.
+        """
+        words = query_words(query)
+        if not words:
+            return []
+        prefix_ids = set.intersection(*(self._prefix_matches(forms) for forms in words))
+        if len(prefix_ids) >= limit:
+            return heapq.nsmallest(limit, prefix_ids)
+        scores = None
+        for forms in words:
+            word_scores = {}
+            for word in forms:
+                if len(word) >= MIN_TRIGRAM_WORD:
+                    for person_id, score in self._trigram_scores(word).items():
+                        word_scores[person_id] = max(score, word_scores.get(person_id, 0.0))
+            for person_id in self._prefix_matches(forms):
+                word_scores[person_id] = 1.0
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {
+                    person_id: score + word_scores[person_id]
+                    for person_id, score in scores.items()
+                    if person_id in word_scores
+                }
+            if not scores:
+                return []
+        # Best score first, then in order of registration
+        return heapq.nsmallest(limit, scores, key=lambda person_id: (-scores[person_id], person_id))
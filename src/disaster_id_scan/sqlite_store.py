@@ -0,0 +1,273 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import sqlite3
+from datetime import date, datetime
+from pathlib import Path
+from typing import Iterable, Optional
+
+from disaster_id_scan.profiling import span
+from disaster_id_scan.store import Person, Registrants, normalize_name
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS registrants (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name TEXT,
+    last_name TEXT,
+    date_of_birth TEXT,
+    nationality TEXT,
+    residence TEXT,
+    place_of_catastrophe TEXT,
+    place_of_shelter TEXT,
+    date_of_catastrophe TEXT,
+    time_of_registration TEXT,
+    first_name_norm TEXT,
+    last_name_norm TEXT
+);
+CREATE INDEX IF NOT EXISTS registrants_last_name ON registrants (last_name_norm);
+CREATE INDEX IF NOT EXISTS registrants_first_name ON registrants (first_name_norm);
+CREATE INDEX IF NOT EXISTS registrants_date_of_birth ON registrants (date_of_birth);
+CREATE INDEX IF NOT EXISTS registrants_place_of_shelter ON registrants (place_of_shelter);
+"""
+
+COLUMNS = [
+    "first_name",
+    "last_name",
+    "date_of_birth",
+    "nationality",
+    "residence",
+    "place_of_catastrophe",
+    "place_of_shelter",
+    "date_of_catastrophe",
+    "time_of_registration",
+    "first_name_norm",
+    "last_name_norm",
+]
+
+
+def _to_iso(value) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def person_to_row(person: Person) -> tuple:
+    return (
+        person.first_name,
+        person.last_name,
+        _to_iso(person.date_of_birth),
+        person.nationality,
+        person.residence,
+        person.place_of_catastrophe,
+        person.place_of_shelter,
+        _to_iso(person.date_of_catastrophe),
+        _to_iso(person.time_of_registration),
+        normalize_name(person.first_name),
+        normalize_name(person.last_name),
+    )
+
+
+def row_to_person(row: sqlite3.Row) -> Person:
+    person = Person()
+    person.person_id = row["id"]
+    person.first_name = row["first_name"]
+    person.last_name = row["last_name"]
+    person.date_of_birth = date.fromisoformat(row["date_of_birth"]) if row["date_of_birth"] else None
+    person.nationality = row["nationality"]
+    person.residence = row["residence"]
+    person.place_of_catastrophe = row["place_of_catastrophe"]
+    person.place_of_shelter = row["place_of_shelter"]
+    person.date_of_catastrophe = date.fromisoformat(row["date_of_catastrophe"]) if row["date_of_catastrophe"] else None
+    person.time_of_registration = (
+        datetime.fromisoformat(row["time_of_registration"]) if row["time_of_registration"] else None
+    )
+    return person
+
+
+class SQLiteRegistrants(Registrants):
+    """
+    Registrants stored in an indexed SQLite database in the data folder.
+    Offers the same interface as Registrants, person ids are the row ids, which AUTOINCREMENT never reuses.
+    An existing autosave file is migrated into the database the first time a data folder is opened.
+    """
+
+    db_filename: str = "disaster-id-scan.sqlite3"
+
+    def __init__(self):
+        super().__init__()
+        self._db: Optional[sqlite3.Connection] = None
+
+    def get_db_path(self) -> Path:
+        return self.save_path.joinpath(SQLiteRegistrants.db_filename)
+
+    def set_path(self, path: Path):
+        self.close()
+        with self._lock:
+            self.save_path = path
+            migrate = not self.get_db_path().exists() and self.get_savepoint_path().exists()
+            # The connection is shared with the background export, access is serialized by the lock
+            self._db = sqlite3.connect(self.get_db_path(), check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # With WAL, NORMAL is safe against corruption and only syncs on checkpoints
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            if migrate:
+                self.migrate_autosave()
+            self._reset_indexes()
+            self._open_exporter()
+
+    def load(self, path: Path):
+        """
+        Open the database of a data folder read only, for reports.
+        A folder without database, e.g. of the JSON backend, is read into a database in memory, the folder
+        is not written to.
+        """
+        self.close()
+        with self._lock:
+            self.save_path = path
+            if self.get_db_path().exists():
+                self._db = sqlite3.connect(f"{self.get_db_path().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+                self._db.row_factory = sqlite3.Row
+            else:
+                self._db = sqlite3.connect(":memory:", check_same_thread=False)
+                self._db.row_factory = sqlite3.Row
+                self._db.executescript(SCHEMA)
+                self.migrate_autosave()
+            self._reset_indexes()
+
+    def migrate_autosave(self):
+        """
+        Import the registrants of the autosave file (and its journal) in one transaction.
+        The files are left untouched as backup.
+        """
+        legacy = Registrants()
+        legacy.load(self.save_path)
+        with self._db:
+            # Keep the person ids, and do not hand out ids of deleted persons again
+            self._db.executemany(
+                self._insert_sql(["id"]),
+                [(person_id, *person_to_row(person)) for person_id, person in legacy.registrants.items()],
+            )
+            self._db.execute("DELETE FROM sqlite_sequence WHERE name = 'registrants'")
+            self._db.execute(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES ('registrants', ?)", (legacy._next_id - 1,)
+            )
+
+    def _insert_sql(self, extra_columns: Optional[list[str]] = None) -> str:
+        columns = (extra_columns or []) + COLUMNS
+        # The column names are constants, the values are bound as parameters
+        return (
+            f"INSERT INTO registrants ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"  # noqa: S608
+        )
+
+    def add(self, person: Person) -> int:
+        """
+        Add a person to the list of registrants, return the id of the person.
+        """
+        return self.add_many([person])[0]
+
+    def add_many(self, persons: Iterable[Person]) -> list[int]:
+        """
+        Add several persons in one transaction, returns their ids.
+        """
+        persons = list(persons)
+        rows = [person_to_row(person) for person in persons]
+        with self._lock:
+            with self._db:
+                for person, row in zip(persons, rows):
+                    person.person_id = self._db.execute(self._insert_sql(), row).lastrowid
+            self._added(persons)
+            return [person.person_id for person in persons]
+
+    def update(self, person_id: int, person: Person):
+        with self._lock:
+            assignments = ", ".join(f"{column} = ?" for column in COLUMNS)
+            with self._db:
+                # The column names are constants, the values are bound as parameters
+                cursor = self._db.execute(
+                    f"UPDATE registrants SET {assignments} WHERE id = ?",  # noqa: S608
+                    (*person_to_row(person), person_id),
+                )
+            if cursor.rowcount == 0:
+                raise KeyError(person_id)
+            person.person_id = person_id
+            self._updated(person)
+
+    def delete(self, person_id: int):
+        with self._lock:
+            with self._db:
+                cursor = self._db.execute("DELETE FROM registrants WHERE id = ?", (person_id,))
+            if cursor.rowcount == 0:
+                raise KeyError(person_id)
+            self._deleted(person_id)
+
+    def get_person_by_id(self, person_id: int) -> Person:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM registrants WHERE id = ?", (person_id,)).fetchone()
+        if row is None:
+            raise KeyError(person_id)
+        return row_to_person(row)
+
+    def get_recent(self, limit: int = 20) -> list[tuple[int, Person]]:
+        if self._db is None:
+            return []
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM registrants ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [(row["id"], row_to_person(row)) for row in rows]
+
+    def get_name_entries(self) -> list[tuple[int, str]]:
+        if self._db is None:
+            return []
+        with self._lock:
+            rows = self._db.execute("SELECT id, last_name, first_name FROM registrants ORDER BY id").fetchall()
+        return [(person_id, f"{last_name}, {first_name} #{person_id}") for person_id, last_name, first_name in rows]
+
+    def get_all(self) -> list[Person]:
+        with self._lock:
+            return [row_to_person(row) for row in self._db.execute("SELECT * FROM registrants ORDER BY id")]
+
+    def find(
+        self,
+        last_name: Optional[str] = None,
+        first_name: Optional[str] = None,
+        date_of_birth: Optional[date] = None,
+        place_of_shelter: Optional[str] = None,
+    ) -> list[tuple[int, Person]]:
+        """
+        Return (id, person) of all registrants matching all given values, names are compared normalized.
+        """
+        conditions = []
+        values = []
+        if last_name is not None:
+            conditions.append("last_name_norm = ?")
+            values.append(normalize_name(last_name))
+        if first_name is not None:
+            conditions.append("first_name_norm = ?")
+            values.append(normalize_name(first_name))
+        if date_of_birth is not None:
+            conditions.append("date_of_birth = ?")
+            values.append(date_of_birth.isoformat())
+        if place_of_shelter is not None:
+            conditions.append("place_of_shelter = ?")
+            values.append(place_of_shelter)
+        where = " AND ".join(conditions) if conditions else "1"
+        with self._lock:
+            # The conditions are fixed strings, the values are bound as parameters
+            query = f"SELECT * FROM registrants WHERE {where} ORDER BY id"  # noqa: S608
+            rows = self._db.execute(query, values).fetchall()
+        return [(row["id"], row_to_person(row)) for row in rows]
+
+    def compact(self):
+        # Changes are committed right away, there is no journal to compact
+        pass
+
+    def save(self):
+        with span("store.save"):
+            if self.exporter is not None:
+                self.exporter.flush()
+
+    def close(self):
+        self._close_exporter()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -1,18 +1,44 @@
 # SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
 #
 # SPDX-License-Identifier: EUPL-1.2
-from csv import DictWriter
+import itertools
+import json
+import os
+import threading
+import time
+import traceback
 from datetime import date, datetime
 from pathlib import Path
+from typing import Iterable, Optional
 
-import jsonpickle
+from disaster_id_scan.duplicates import MIN_DUPLICATE_SCORE, DuplicateIndex
+from disaster_id_scan.names import normalize_name
+from disaster_id_scan.profiling import span
+from disaster_id_scan.search import NameIndex
 
 
 class Person:
-    '''
+    """
     Class to hold a person's data.
     It has to be assumed that the data is not complete.
-    '''
+    person_id is assigned by the registrants store when the person is added, it is never reused.
+    The attributes are slots, assigning a misspelled attribute fails instead of losing the value.
+    """
+
+    __slots__ = (
+        "date_of_birth",
+        "date_of_catastrophe",
+        "first_name",
+        "last_name",
+        "nationality",
+        "person_id",
+        "place_of_catastrophe",
+        "place_of_shelter",
+        "residence",
+        "time_of_registration",
+    )
+
+    person_id: Optional[int]
     first_name: str
     last_name: str
     date_of_birth: date
@@ -20,11 +46,12 @@ class Person:
     residence: str
     place_of_catastrophe: str
     place_of_shelter: str
-    date_of_catastrope: date
+    date_of_catastrophe: date
     time_of_registration: datetime
 
     def __init__(self):
         # Set all values to None
+        self.person_id = None
         self.first_name = None
         self.last_name = None
         self.date_of_birth = None
@@ -32,10 +59,19 @@ class Person:
         self.residence = None
         self.place_of_catastrophe = None
         self.place_of_shelter = None
-        self.date_of_catastrope = None
+        self.date_of_catastrophe = None
         # Set time of registration to now
         self.time_of_registration = datetime.now()
 
+    # Misspelled name of date_of_catastrophe in older versions, also used by their autosave files
+    @property
+    def date_of_catastrope(self) -> date:
+        return self.date_of_catastrophe
+
+    @date_of_catastrope.setter
+    def date_of_catastrope(self, value: date):
+        self.date_of_catastrophe = value
+
     def __str__(self):
         return f"""-- Person --
 Name: {self.last_name}
@@ -43,85 +79,588 @@ First Name: {self.first_name}
 Date of Birth: {self.date_of_birth}"""
 
 
+# Data folder of the commands that are not given one
+DEFAULT_DATA_PATH = Path(os.environ.get("XDG_DATA_HOME", Path.home().joinpath(".local", "share"))).joinpath(
+    "disaster-id-scan"
+)
+
+
+def person_label(person: Person) -> str:
+    return f"{person.last_name}, {person.first_name} #{person.person_id}"
+
+
+# Autosave format: a header line with the format name, version and field names, then one JSON array of
+# the field values per person. Dates are ISO strings. Version 1 was a jsonpickle dump of the Person objects.
+FORMAT_NAME = "disaster-id-scan"
+FORMAT_VERSION = 2
+
+# Stored fields of a person and their types
+PERSON_SCHEMA = {
+    "person_id": int,
+    "first_name": str,
+    "last_name": str,
+    "date_of_birth": date,
+    "nationality": str,
+    "residence": str,
+    "place_of_catastrophe": str,
+    "place_of_shelter": str,
+    "date_of_catastrophe": date,
+    "time_of_registration": datetime,
+}
+PERSON_FIELDS = list(PERSON_SCHEMA)
+
+_DECODERS = {int: None, str: None, date: date.fromisoformat, datetime: datetime.fromisoformat}
+
+
+def person_to_record(person: Person) -> list:
+    """
+    Values of a person in the order of PERSON_FIELDS, dates as ISO strings.
+    """
+    return [
+        value.isoformat() if isinstance(value, date) else value
+        for value in (getattr(person, field) for field in PERSON_FIELDS)
+    ]
+
+
+def _decoders(fields: list[str]) -> list[tuple[str, Optional[callable]]]:
+    # Fields unknown to this version are skipped
+    return [(field, _DECODERS[PERSON_SCHEMA[field]]) if field in PERSON_SCHEMA else (None, None) for field in fields]
+
+
+def _new_person() -> Person:
+    # Without __init__, the time of registration is read from the record
+    person = Person.__new__(Person)
+    for field in PERSON_FIELDS:
+        setattr(person, field, None)
+    return person
+
+
+def person_from_record(record: list, decoders: list[tuple[str, Optional[callable]]]) -> Person:
+    person = _new_person()
+    for (field, decode), value in zip(decoders, record):
+        if field is not None:
+            setattr(person, field, decode(value) if decode is not None and value is not None else value)
+    return person
+
+
+_FIELD_DECODERS = _decoders(PERSON_FIELDS)
+
+
+def person_to_dict(person: Person) -> dict:
+    return dict(zip(PERSON_FIELDS, person_to_record(person)))
+
+
+def person_from_dict(data: dict) -> Person:
+    if "py/object" in data:
+        # Journal record of version 1
+        return _upgrade_legacy_person(_jsonpickle().unpickler.Unpickler().restore(data))
+    return person_from_record([data.get(field) for field in PERSON_FIELDS], _FIELD_DECODERS)
+
+
+def _jsonpickle():
+    # Only needed to read files of older versions
+    import jsonpickle
+
+    return jsonpickle
+
+
+def _upgrade_legacy_person(person: Person) -> Person:
+    # Attributes that did not exist in the version the person was saved with are None
+    for field in PERSON_FIELDS:
+        if not hasattr(person, field):
+            setattr(person, field, None)
+    return person
+
+
 class Registrants:
-    '''
+    """
     Class to hold a list of registrants.
-    '''
-    registrants: list[Person]
+    Every change is appended as one record to a journal file, so saving does not depend on the number of
+    registrants. Persons are kept in a dict by their person_id, in order of registration.
+    The journal is compacted into the snapshot (the autosave file) by one background thread, the CSV
+    export is kept up to date by a CSVExporter thread. When a data folder is opened, the snapshot is loaded
+    and the journal is replayed on top.
+    """
+
+    registrants: dict[int, Person]
 
     save_path: Path
     json_filename: str = "disaster-id-scan_autosave.json"
+    journal_filename: str = "disaster-id-scan_journal.jsonl"
 
     export_filename: str = "disaster-id-scan_export.csv"
 
+    # Seconds between two fsyncs of the journal. Every record is flushed right away, so only a power loss can
+    # lose the records written since the last fsync.
+    fsync_interval: float = 0.2
+    # Seconds without changes until the journal is compacted in the background
+    compact_delay: float = 2.0
+    # Number of journal records after which the journal is compacted even if changes keep coming. With many
+    # registrants, up to half their number of records are collected, so writing snapshots stays amortized O(1)
+    # per change.
+    compact_records: int = 1000
+
     def __init__(self):
-        self.registrants = []
+        self.registrants = {}
+        self.save_path = None
+        # Person ids are counted up and never reused, also not after deletes
+        self._next_id = 0
+        # Sequence number of the last change, the snapshot stores the number it contains changes up to
+        self._seq = 0
+        self._journal = None
+        self._journal_records = 0
+        self._last_fsync = 0.0
+        self._fsync_timer = None
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        # Monotonic time the compaction thread compacts the journal at, None if nothing is to compact
+        self._compact_due: Optional[float] = None
+        self._compact_condition = threading.Condition()
+        self._compact_thread: Optional[threading.Thread] = None
+        self.exporter = None
+        # Built on the first search, opening a data folder does not wait for them
+        self.name_index = NameIndex()
+        self.duplicate_index = DuplicateIndex()
+        self._indexes_built = False
+        # Objects with added(persons), updated(person) and deleted(person_id), e.g. the sync between stations
+        self.listeners = []
 
     def add(self, person: Person) -> int:
-        '''
+        """
         Add a person to the list of registrants, return the id of the person.
-        '''
-        self.registrants.append(person)
-        return len(self.registrants) - 1
+        """
+        with self._lock:
+            person.person_id = self._next_id
+            self._next_id += 1
+            self.registrants[person.person_id] = person
+            self._append({"op": "add", "id": person.person_id, "person": person_to_dict(person)})
+            self._added([person])
+            return person.person_id
+
+    def add_many(self, persons: Iterable[Person]) -> list[int]:
+        """
+        Add several persons, returns their ids.
+        """
+        return [self.add(person) for person in persons]
 
     def get_savepoint_path(self) -> Path:
         return self.save_path.joinpath(Registrants.json_filename)
 
+    def get_journal_path(self) -> Path:
+        return self.save_path.joinpath(Registrants.journal_filename)
+
+    def get_compacting_journal_path(self) -> Path:
+        # The journal is moved here while it is being compacted
+        return self.save_path.joinpath(Registrants.journal_filename + ".compacting")
+
     def get_export_path(self) -> Path:
         return self.save_path.joinpath(Registrants.export_filename)
 
+    def get_name_entries(self) -> list[tuple[int, str]]:
+        """
+        Return (id, label) of all registrants in order of registration.
+        """
+        with self._lock:
+            return [(person_id, person_label(person)) for person_id, person in self.registrants.items()]
+
     def get_name_list(self) -> list[str]:
-        return [f"{person.last_name}, {person.first_name} #{id}" for id, person in enumerate(self.registrants)]
+        return [label for _, label in self.get_name_entries()]
 
-    def get_person_by_list_entry(self, list_entry: str) -> (int, Person):
-        person_id = int(list_entry.split("#")[1])
-        return person_id, self.registrants[person_id]
+    def get_person_by_list_entry(self, list_entry: str) -> tuple[int, Person]:
+        person_id = int(list_entry.rsplit("#", maxsplit=1)[-1])
+        return person_id, self.get_person_by_id(person_id)
 
     def get_person_by_id(self, person_id: int) -> Person:
         return self.registrants[person_id]
 
+    def get_all(self) -> list[Person]:
+        with self._lock:
+            return list(self.registrants.values())
+
+    def get_recent(self, limit: int = 20) -> list[tuple[int, Person]]:
+        """
+        Return (id, person) of the latest registrations, newest first.
+        """
+        with self._lock:
+            return list(itertools.islice(reversed(self.registrants.items()), limit))
+
+    def find(
+        self,
+        last_name: Optional[str] = None,
+        first_name: Optional[str] = None,
+        date_of_birth: Optional[date] = None,
+        place_of_shelter: Optional[str] = None,
+    ) -> list[tuple[int, Person]]:
+        """
+        Return (id, person) of all registrants matching all given values, names are compared normalized.
+        """
+        last_name = normalize_name(last_name) if last_name is not None else None
+        first_name = normalize_name(first_name) if first_name is not None else None
+        return [
+            (person_id, person)
+            for person_id, person in list(self.registrants.items())
+            if (last_name is None or normalize_name(person.last_name) == last_name)
+            and (first_name is None or normalize_name(person.first_name) == first_name)
+            and (date_of_birth is None or person.date_of_birth == date_of_birth)
+            and (place_of_shelter is None or person.place_of_shelter == place_of_shelter)
+        ]
+
     def update(self, person_id: int, person: Person):
-        self.registrants[person_id] = person
-        self.save()
+        with self._lock:
+            if person_id not in self.registrants:
+                raise KeyError(person_id)
+            person.person_id = person_id
+            self.registrants[person_id] = person
+            self._append({"op": "update", "id": person_id, "person": person_to_dict(person)})
+            self._updated(person)
 
     def delete(self, person_id: int):
-        self.registrants.pop(person_id)
-        self.save()
+        with self._lock:
+            del self.registrants[person_id]
+            self._append({"op": "delete", "id": person_id})
+            self._deleted(person_id)
 
-    def set_path(self, path: Path):
-        self.save_path = path
+    def search(self, query: str, limit: int = 20) -> list[tuple[int, Person]]:
+        """
+        Return (id, person) of the persons whose names match the query best, for search as you type.
+        """
+        with self._lock:
+            self._ensure_indexes()
+            person_ids = self.name_index.search(query, limit)
+        return [(person_id, self.get_person_by_id(person_id)) for person_id in person_ids]
+
+    def find_duplicates(
+        self, person: Person, min_score: float = MIN_DUPLICATE_SCORE
+    ) -> list[tuple[int, Person, float]]:
+        """
+        Return (id, person, similarity) of registrants that are likely the same person, most similar first.
+        Call this before adding a person, a person that is already registered is not reported as its own duplicate.
+        """
+        with self._lock:
+            self._ensure_indexes()
+            matches = self.duplicate_index.find(
+                person.last_name, person.first_name, person.date_of_birth, min_score, getattr(person, "person_id", None)
+            )
+        return [(person_id, self.get_person_by_id(person_id), score) for person_id, score in matches]
+
+    def find_all_duplicates(self, min_score: float = MIN_DUPLICATE_SCORE) -> list[tuple[int, int, float]]:
+        """
+        Return (id, id, similarity) of all pairs of likely duplicates, most similar first.
+        """
+        with self._lock:
+            self._ensure_indexes()
+            return self.duplicate_index.find_all(min_score)
+
+    # Keep the indexes and the export up to date, called with the lock held after every change
+
+    def _added(self, persons: list[Person]):
+        if self._indexes_built:
+            for person in persons:
+                self.name_index.add(person.person_id, person.last_name, person.first_name)
+                self.duplicate_index.add(person.person_id, person.last_name, person.first_name, person.date_of_birth)
+        if self.exporter is not None:
+            self.exporter.added(persons)
+        for listener in self.listeners:
+            listener.added(persons)
+
+    def _updated(self, person: Person):
+        if self._indexes_built:
+            self.name_index.update(person.person_id, person.last_name, person.first_name)
+            self.duplicate_index.update(person.person_id, person.last_name, person.first_name, person.date_of_birth)
+        if self.exporter is not None:
+            self.exporter.changed(person.person_id)
+        for listener in self.listeners:
+            listener.updated(person)
+
+    def _deleted(self, person_id: int):
+        if self._indexes_built:
+            self.name_index.remove(person_id)
+            self.duplicate_index.remove(person_id)
+        if self.exporter is not None:
+            self.exporter.changed(person_id)
+        for listener in self.listeners:
+            listener.deleted(person_id)
+
+    def _ensure_indexes(self):
+        if self._indexes_built:
+            return
+        persons = self.get_all()
+        self.name_index.add_many([(person.person_id, person.last_name, person.first_name) for person in persons])
+        for person in persons:
+            self.duplicate_index.add(person.person_id, person.last_name, person.first_name, person.date_of_birth)
+        self._indexes_built = True
+
+    def _reset_indexes(self):
+        # The registrants changed as a whole, the indexes are built again on the next search
+        self.name_index.clear()
+        self.duplicate_index.clear()
+        self._indexes_built = False
+
+    def load(self, path: Path):
+        """
+        Load the registrants of a data folder without writing to it, for reports and migrations.
+        """
+        self.close()
+        with self._lock:
+            self.save_path = path
+            self._reset_indexes()
+            self._load()
+
+    def _open_exporter(self):
+        # Imported here, the export module depends on Person
+        from disaster_id_scan.export import CSVExporter
+
+        self.exporter = CSVExporter(self.get_export_path(), self.get_all, self._lock)
+        # Regenerate the export once in the background, it may be missing or outdated
+        self.exporter.changed()
+
+    def _append(self, record: dict):
+        # Without data folder, changes are only kept in memory
+        if self._journal is None:
+            return
+        self._seq += 1
+        record["seq"] = self._seq
+        self._journal.write(json.dumps(record) + "\n")
+        self._journal.flush()
+        self._journal_records += 1
+        self._sync_journal()
+        self._schedule_compaction()
+
+    def _sync_journal(self):
+        # Group fsyncs: at most one per fsync_interval, a timer syncs the records written in between
+        elapsed = time.monotonic() - self._last_fsync
+        if elapsed >= self.fsync_interval:
+            os.fsync(self._journal.fileno())
+            self._last_fsync = time.monotonic()
+        elif self._fsync_timer is None:
+            self._fsync_timer = threading.Timer(self.fsync_interval - elapsed, self._fsync_pending)
+            self._fsync_timer.daemon = True
+            self._fsync_timer.start()
+
+    def _fsync_pending(self):
+        with self._lock:
+            self._fsync_timer = None
+            if self._journal is not None:
+                os.fsync(self._journal.fileno())
+                self._last_fsync = time.monotonic()
+
+    def _schedule_compaction(self):
+        limit = max(self.compact_records, len(self.registrants) // 2)
+        due = time.monotonic() + (0 if self._journal_records >= limit else self.compact_delay)
+        with self._compact_condition:
+            # The thread only has to wake up early if the compaction is due sooner than it waits for
+            wake = self._compact_due is None or due < self._compact_due
+            self._compact_due = due
+            if wake:
+                self._compact_condition.notify()
+
+    def _start_compaction_thread(self):
+        self._compact_due = None
+        self._compact_thread = threading.Thread(target=self._run_compaction, name="registrants-compaction", daemon=True)
+        self._compact_thread.start()
+
+    def _stop_compaction_thread(self):
+        thread = self._compact_thread
+        if thread is None:
+            return
+        with self._compact_condition:
+            self._compact_thread = None
+            self._compact_condition.notify()
+        thread.join()
+
+    def _run_compaction(self):
+        thread = threading.current_thread()
+        while True:
+            with self._compact_condition:
+                while self._compact_thread is thread:
+                    if self._compact_due is not None:
+                        remaining = self._compact_due - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._compact_condition.wait(remaining)
+                    else:
+                        self._compact_condition.wait()
+                if self._compact_thread is not thread:
+                    return
+                self._compact_due = None
+            try:
+                self.compact()
+            except Exception:
+                # The records stay in the journal, the next change schedules another compaction
+                traceback.print_exc()
+
+    def _apply(self, record: dict, *, positional: bool = False):
+        # Journals of older versions refer to persons by their position in the list
+        person_id = record.get("id")
+        if positional and record["op"] != "add":
+            person_id = list(self.registrants)[person_id]
+        if record["op"] == "add":
+            person = person_from_dict(record["person"])
+            person.person_id = person_id if person_id is not None and not positional else self._next_id
+            self.registrants[person.person_id] = person
+            self._next_id = max(self._next_id, person.person_id + 1)
+        elif record["op"] == "update":
+            person = person_from_dict(record["person"])
+            person.person_id = person_id
+            self.registrants[person_id] = person
+        elif record["op"] == "delete":
+            del self.registrants[person_id]
+
+    def _set_registrants(self, persons: list[Person], next_id: Optional[int]):
+        self.registrants = {}
+        for position, person in enumerate(persons):
+            # Persons of older versions have no id, their position was used instead
+            if next_id is None or getattr(person, "person_id", None) is None:
+                person.person_id = position
+            self.registrants[person.person_id] = person
+        self._next_id = next_id if next_id is not None else len(persons)
+
+    def _load(self):
+        self.registrants = {}
+        self._next_id = 0
+        self._seq = 0
+        positional = True
         # Check if json file exists, if so load it
         if self.get_savepoint_path().exists():
-            with open(self.get_savepoint_path(), "r") as f:
-                self.registrants = jsonpickle.decode(f.read())
-        # Save immediately, to keep export file up to date
-        self.save()
+            with open(self.get_savepoint_path()) as f:
+                header = json.loads(f.readline() or "null")
+                if isinstance(header, dict) and header.get("format") == FORMAT_NAME:
+                    decoders = _decoders(header["fields"])
+                    persons = [person_from_record(json.loads(line), decoders) for line in f if line.strip()]
+                    self._set_registrants(persons, header["next_id"])
+                    self._seq = header["seq"]
+                    positional = False
+                else:
+                    f.seek(0)
+                    positional = self._load_legacy_snapshot(f.read())
+        # Replay changes that did not make it into the snapshot
+        for journal_path in (self.get_compacting_journal_path(), self.get_journal_path()):
+            if not journal_path.exists():
+                continue
+            with open(journal_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Incomplete last record of a crashed write
+                        break
+                    if record["seq"] > self._seq:
+                        self._apply(record, positional=positional)
+                        self._seq = record["seq"]
 
-    def save(self):
-        with open(self.get_savepoint_path(), "w") as f:
-            f.write(jsonpickle.encode(self.registrants))
-        # Export to csv (Xenios-Format? Whatever...)
-        # Name, Vorname, geb, Alter(ca.), Nationalitaet, Staat, Unterkunft,
-
-        with open(self.get_export_path(), "w") as f:
-            writer = DictWriter(f, fieldnames=["Name", "Vorname", "geb", "Alter(ca.)", "Nationalitaet", "Staat",
-                                               "Unterkunft", "Katastrophenort", "Katastrophentag", "Registrierungszeit"])
-            writer.writeheader()
-            for person in self.registrants:
-                # Calculate approximate age
-                if person.date_of_birth is not None:
-                    age = datetime.now().year - person.date_of_birth.year
+    def _load_legacy_snapshot(self, text: str) -> bool:
+        """
+        Load a jsonpickle snapshot of version 1, returns whether its journal uses positions as ids.
+        """
+        data = _jsonpickle().decode(text)
+        # Older versions saved only the list of registrants, or no person ids
+        if isinstance(data, dict):
+            self._set_registrants(
+                [_upgrade_legacy_person(person) for person in data["registrants"]], data.get("next_id")
+            )
+            self._seq = data["seq"]
+            return "next_id" not in data
+        self._set_registrants([_upgrade_legacy_person(person) for person in data], None)
+        return True
+
+    def set_path(self, path: Path):
+        self.close()
+        with self._lock:
+            self.save_path = path
+            self._reset_indexes()
+            self._load()
+            # Save immediately, then start with an empty journal
+            self._write_snapshot(self.get_all(), self._next_id, self._seq)
+            self.get_compacting_journal_path().unlink(missing_ok=True)
+            self._journal = open(self.get_journal_path(), "w")
+            self._journal_records = 0
+            self._start_compaction_thread()
+            self._open_exporter()
+
+    def _write_snapshot(self, registrants: list[Person], next_id: int, seq: int):
+        # Write to a temporary file first, so the snapshot is never half written
+        tmp_path = self.get_savepoint_path().with_suffix(".tmp")
+        header = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "seq": seq,
+            "next_id": next_id,
+            "fields": PERSON_FIELDS,
+        }
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(header) + "\n")
+            f.write("".join(json.dumps(person_to_record(person)) + "\n" for person in registrants))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.get_savepoint_path())
+
+    def compact(self):
+        """
+        Write all changes into the snapshot, then drop the journal records.
+        New changes can be made while the snapshot is written, they go to a new journal.
+        """
+        with self._compact_lock:
+            with self._lock:
+                if self._journal is None or self._journal_records == 0:
+                    return
+                registrants = self.get_all()
+                next_id = self._next_id
+                seq = self._seq
+                # Continue in a fresh journal, the old one is kept until the snapshot is written
+                self._journal.close()
+                if self.get_compacting_journal_path().exists():
+                    # A previous compaction failed, keep its records as well
+                    with open(self.get_compacting_journal_path(), "a") as f:
+                        f.write(self.get_journal_path().read_text())
                 else:
-                    age = None
-                writer.writerow({
-                    "Name": person.last_name,
-                    "Vorname": person.first_name,
-                    "geb": person.date_of_birth.strftime("%d.%m.%Y") if person.date_of_birth is not None else None,
-                    "Alter(ca.)": age,
-                    "Nationalitaet": person.nationality,
-                    "Staat": person.residence,
-                    "Unterkunft": person.place_of_shelter,
-                    "Katastrophenort": person.place_of_catastrophe,
-                    "Katastrophentag": person.date_of_catastrope.strftime("%d.%m.%Y") if person.date_of_catastrope is not None else None,
-                    "Registrierungszeit": person.time_of_registration.strftime("%d.%m.%Y %H:%M:%S") if person.time_of_registration is not None else None
-                })
+                    os.replace(self.get_journal_path(), self.get_compacting_journal_path())
+                self._journal = open(self.get_journal_path(), "w")
+                self._journal_records = 0
+            with span("store.snapshot"):
+                self._write_snapshot(registrants, next_id, seq)
+            self.get_compacting_journal_path().unlink()
+
+    def save(self):
+        """
+        Write the snapshot and the export now.
+        """
+        with span("store.save"):
+            if self._journal is not None:
+                self.compact()
+            if self.exporter is not None:
+                self.exporter.flush()
+
+    def close(self):
+        """
+        Compact the journal and close it, call this before exiting.
+        """
+        self._stop_compaction_thread()
+        self.compact()
+        self._close_exporter()
+        with self._lock:
+            if self._fsync_timer is not None:
+                self._fsync_timer.cancel()
+                self._fsync_timer = None
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def _close_exporter(self):
+        # Writes the outstanding export changes
+        if self.exporter is not None:
+            self.exporter.close()
+            self.exporter = None
+
+
+STORE_BACKENDS = ["json", "sqlite"]
+
+
+def create_registrants(backend: str = "json") -> Registrants:
+    """
+    Create the registrants store for the backend: "json" (autosave file with journal) or "sqlite".
+    """
+    if backend == "sqlite":
+        from disaster_id_scan.sqlite_store import SQLiteRegistrants
+
+        return SQLiteRegistrants()
+    return Registrants()
@@ -0,0 +1,583 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Synchronisation of the registrants between several stations (intake desks).
+Every station logs its own changes and fetches only the changes of the other stations it has not seen yet,
+either from a shared folder or from the HTTP endpoint of the other stations.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import threading
+import urllib.parse
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Sequence
+
+from disaster_id_scan.profiling import span
+from disaster_id_scan.store import Person, Registrants, person_from_dict, person_to_dict
+
+SYNC_FILENAME = "disaster-id-scan_sync.jsonl"
+# Seconds between two syncs in the background
+SYNC_INTERVAL = 5.0
+# Changes sent per HTTP response, the client asks again for the rest
+HTTP_BATCH = 1000
+HTTP_TIMEOUT = 10.0
+# Header with the token shared by all stations, the endpoint only answers requests that carry it
+TOKEN_HEADER = "X-Sync-Token"
+
+
+def record_hash(person: Person) -> str:
+    """
+    Fingerprint of the data of a person, to find edits made while no sync was running.
+    """
+    data = person_to_dict(person)
+    del data["person_id"]
+    return hashlib.blake2b(json.dumps(data, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+
+class Change:
+    """
+    A change of a record made on a station, person is None for a delete.
+    uid identifies the record on all stations (station it was created on and its id there), version is
+    (counter, station) with a Lamport counter. seq numbers the changes of a station.
+    """
+
+    __slots__ = ("person", "seq", "uid", "version")
+
+    def __init__(self, seq: int, uid: str, version: tuple[int, str], person: Optional[dict]):
+        self.seq = seq
+        self.uid = uid
+        self.version = version
+        self.person = person
+
+    def to_dict(self) -> dict:
+        return {"seq": self.seq, "uid": self.uid, "version": list(self.version), "person": self.person}
+
+    @staticmethod
+    def from_dict(data: dict) -> "Change":
+        return Change(data["seq"], data["uid"], tuple(data["version"]), data["person"])
+
+    def __repr__(self):
+        return f"Change(#{self.seq}, {self.uid}, {self.version}, {'delete' if self.person is None else 'set'})"
+
+
+class SyncResult:
+    sent: int
+    received: int
+    applied: int
+    # Stations or folders that could not be reached, they are tried again on the next sync
+    errors: list[str]
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.applied = 0
+        self.errors = []
+
+    def __str__(self):
+        text = f"sent {self.sent} changes, received {self.received}, applied {self.applied}"
+        if self.errors:
+            text += f", {len(self.errors)} failed: " + "; ".join(self.errors)
+        return text
+
+
+class FolderTransport:
+    """
+    Exchange through a shared folder, e.g. a network share. Every station appends its changes to its own file
+    <station>.jsonl, and reads the files of the others from the byte offset where it stopped last time.
+    """
+
+    folder: Path
+
+    def __init__(self, folder: Path):
+        self.folder = Path(folder)
+        self.key = f"folder:{self.folder}"
+
+    def push(self, station: str, changes: list[Change]):
+        if not changes:
+            return
+        self.folder.mkdir(parents=True, exist_ok=True)
+        with open(self.folder.joinpath(f"{station}.jsonl"), "a") as f:
+            # One write of complete lines, readers never see a partial change
+            f.write("".join(json.dumps(change.to_dict()) + "\n" for change in changes))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def pull(
+        self, station: str, cursors: dict[str, int], errors: Optional[list[str]] = None
+    ) -> list[tuple[str, list[Change], int]]:
+        """
+        Return (peer, changes, cursor) for every other station with new changes.
+        Files that cannot be read are skipped and reported in errors.
+        """
+        results = []
+        if not self.folder.is_dir():
+            return results
+        for path in sorted(self.folder.glob("*.jsonl")):
+            peer = path.stem
+            if peer == station:
+                continue
+            offset = cursors.get(peer, 0)
+            try:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    data = f.read()
+            except OSError as e:
+                if errors is not None:
+                    errors.append(f"Reading {path} failed: {e}")
+                continue
+            # A line without newline is still being written
+            complete = data[: data.rfind(b"\n") + 1]
+            if not complete:
+                continue
+            changes = [Change.from_dict(json.loads(line)) for line in complete.splitlines() if line.strip()]
+            results.append((peer, changes, offset + len(complete)))
+        return results
+
+
+class HTTPTransport:
+    """
+    Fetch the changes from the SyncServer of other stations, cursors are the sequence numbers of their changes.
+    Pushing is not needed, the other stations fetch from the own server. Every request carries the token shared by
+    the stations.
+    """
+
+    peers: list[str]
+
+    def __init__(self, peers: Sequence[str], token: str, timeout: float = HTTP_TIMEOUT):
+        self.peers = [peer.rstrip("/") for peer in peers]
+        for peer in self.peers:
+            if urllib.parse.urlparse(peer).scheme not in ("http", "https"):
+                message = f"Peer {peer} is not an http:// or https:// URL"
+                raise ValueError(message)
+        self.token = token
+        self.timeout = timeout
+        self.key = "http"
+
+    def push(self, station: str, changes: list[Change]):
+        pass
+
+    def pull(
+        self, station: str, cursors: dict[str, int], errors: Optional[list[str]] = None
+    ) -> list[tuple[str, list[Change], int]]:
+        """
+        Return (peer, changes, cursor) for every peer with new changes.
+        Peers that cannot be reached are skipped and reported in errors.
+        """
+        results = []
+        for peer in self.peers:
+            since = cursors.get(peer, 0)
+            changes = []
+            try:
+                while True:
+                    url = f"{peer}/changes?" + urllib.parse.urlencode({"since": since})
+                    request = urllib.request.Request(url, headers={TOKEN_HEADER: self.token})  # noqa: S310
+                    # The scheme of the peers was checked when the transport was created
+                    with urllib.request.urlopen(request, timeout=self.timeout) as response:  # noqa: S310
+                        data = json.loads(response.read())
+                    if data["station"] == station:
+                        break
+                    batch = [Change.from_dict(change) for change in data["changes"]]
+                    changes.extend(batch)
+                    if batch:
+                        since = batch[-1].seq
+                    if not data["more"]:
+                        break
+            except OSError as e:
+                # The station may be switched off, its changes are fetched on the next sync
+                if errors is not None:
+                    errors.append(f"Sync with {peer} failed: {e}")
+            if changes:
+                results.append((peer, changes, since))
+        return results
+
+
+class SyncManager:
+    """
+    Keeps the registrants of this station in sync with other stations.
+    Local changes are picked up as listener of the store and logged with a new version. Changes of other
+    stations are applied to the store if their version is higher than the known one, so every station ends up
+    with the same registrants whatever the order the changes arrive in: the higher Lamport counter wins, on
+    equal counters the higher station id. Deletes are kept as versioned tombstones.
+    The state (own changes, versions, cursors of the other stations) is appended to a log in the data folder,
+    the cost of a sync grows with the number of changes, not with the number of registrants.
+    """
+
+    store: Registrants
+    station: str
+    transports: list
+
+    def __init__(self, store: Registrants, transports: Iterable = (), on_change: Optional[Callable[[], None]] = None):
+        self.store = store
+        self.transports = list(transports)
+        self.on_change = on_change
+        self.path = store.save_path.joinpath(SYNC_FILENAME)
+        self.station = None
+        self._clock = 0
+        self._changes: list[Change] = []
+        self._versions: dict[str, tuple[int, str]] = {}
+        self._ids: dict[str, int] = {}
+        self._uids: dict[int, str] = {}
+        # Hash of every record as last logged or applied, by local id
+        self._hashes: dict[int, str] = {}
+        self._cursors: dict[str, dict[str, int]] = {}
+        self._pushed: dict[str, int] = {}
+        self._lock = threading.RLock()
+        # Set while changes of other stations are applied, so they are not logged as own changes
+        self._applying = threading.local()
+        self._file = None
+        self._timer: Optional[threading.Timer] = None
+        self._running = False
+        # Outcome of the last sync in the background, for the GUI to show
+        self.last_result: Optional[SyncResult] = None
+        self.last_error: Optional[str] = None
+        self._load()
+
+    def _load(self):
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Incomplete last entry of a crashed write
+                        break
+                    self._replay(entry)
+        self._file = open(self.path, "a")
+        if self.station is None:
+            self.station = uuid.uuid4().hex[:12]
+            self._log({"type": "station", "station": self.station})
+            self._file.flush()
+
+    def _replay(self, entry: dict):
+        kind = entry["type"]
+        if kind == "station":
+            self.station = entry["station"]
+        elif kind == "change":
+            change = Change.from_dict(entry["change"])
+            self._changes.append(change)
+            self._set_version(change.uid, change.version, entry["id"], entry.get("hash"))
+        elif kind == "remote":
+            self._set_version(entry["uid"], tuple(entry["version"]), entry["id"], entry.get("hash"))
+        elif kind == "cursor":
+            self._cursors.setdefault(entry["transport"], {})[entry["peer"]] = entry["cursor"]
+        elif kind == "pushed":
+            self._pushed[entry["transport"]] = entry["seq"]
+
+    def _log(self, entry: dict):
+        self._file.write(json.dumps(entry) + "\n")
+
+    def _set_version(self, uid: str, version: tuple[int, str], person_id: Optional[int], digest: Optional[str] = None):
+        self._versions[uid] = version
+        self._clock = max(self._clock, version[0])
+        old_id = self._ids.pop(uid, None)
+        if old_id is not None:
+            self._uids.pop(old_id, None)
+            self._hashes.pop(old_id, None)
+        if person_id is not None:
+            self._ids[uid] = person_id
+            self._uids[person_id] = uid
+            # Logs of older versions have no hashes, their records are only compared once logged again
+            if digest is not None:
+                self._hashes[person_id] = digest
+
+    def attach(self):
+        """
+        Start tracking the changes of the store. Persons registered, edited or deleted while no sync was running
+        are logged now.
+        """
+        with self.store._lock, self._lock:
+            self.store.listeners.append(self)
+            known = set(self._uids)
+            for person in self.store.get_all():
+                if person.person_id not in known:
+                    self._local_change(person.person_id, person)
+                elif person.person_id in self._hashes and record_hash(person) != self._hashes[person.person_id]:
+                    self._local_change(person.person_id, person)
+            present = {person.person_id for person in self.store.get_all()}
+            for person_id in known - present:
+                self._local_change(person_id, None)
+            self._file.flush()
+
+    def detach(self):
+        with self.store._lock, self._lock:
+            if self in self.store.listeners:
+                self.store.listeners.remove(self)
+
+    # Listener of the store, called with the lock of the store held
+
+    def added(self, persons: list[Person]):
+        if getattr(self._applying, "active", False):
+            return
+        with self._lock:
+            for person in persons:
+                self._local_change(person.person_id, person)
+            self._file.flush()
+
+    def updated(self, person: Person):
+        self.added([person])
+
+    def deleted(self, person_id: int):
+        if getattr(self._applying, "active", False):
+            return
+        with self._lock:
+            self._local_change(person_id, None)
+            self._file.flush()
+
+    def _local_change(self, person_id: int, person: Optional[Person]):
+        uid = self._uids.get(person_id, f"{self.station}:{person_id}")
+        self._clock += 1
+        data = digest = None
+        if person is not None:
+            data = person_to_dict(person)
+            # Ids are local to every station
+            del data["person_id"]
+            digest = record_hash(person)
+        change = Change(len(self._changes) + 1, uid, (self._clock, self.station), data)
+        self._changes.append(change)
+        self._set_version(uid, change.version, person_id if person is not None else None, digest)
+        self._log(
+            {
+                "type": "change",
+                "change": change.to_dict(),
+                "id": person_id if person is not None else None,
+                "hash": digest,
+            }
+        )
+
+    def changes_since(self, seq: int, limit: Optional[int] = None) -> list[Change]:
+        """
+        Own changes with a sequence number above seq, oldest first.
+        """
+        with self._lock:
+            end = len(self._changes) if limit is None else min(len(self._changes), seq + limit)
+            return self._changes[max(seq, 0) : end]
+
+    def last_seq(self) -> int:
+        with self._lock:
+            return len(self._changes)
+
+    def apply(self, changes: Iterable[Change]) -> int:
+        """
+        Apply changes of other stations, returns the number of changes that were newer than the known state.
+        """
+        applied = 0
+        with self.store._lock, self._lock:
+            self._applying.active = True
+            try:
+                for change in changes:
+                    known = self._versions.get(change.uid)
+                    if known is not None and tuple(known) >= tuple(change.version):
+                        self._clock = max(self._clock, change.version[0])
+                        continue
+                    person_id = self._ids.get(change.uid)
+                    digest = None
+                    if change.person is None:
+                        if person_id is not None and self._exists(person_id):
+                            self.store.delete(person_id)
+                        person_id = None
+                    else:
+                        person = person_from_dict(dict(change.person, person_id=None))
+                        if person_id is not None and self._exists(person_id):
+                            self.store.update(person_id, person)
+                        else:
+                            person_id = self.store.add(person)
+                        digest = record_hash(self.store.get_person_by_id(person_id))
+                    self._set_version(change.uid, change.version, person_id, digest)
+                    self._log(
+                        {
+                            "type": "remote",
+                            "uid": change.uid,
+                            "version": list(change.version),
+                            "id": person_id,
+                            "hash": digest,
+                        }
+                    )
+                    applied += 1
+            finally:
+                self._applying.active = False
+                self._file.flush()
+        if applied and self.on_change is not None:
+            self.on_change()
+        return applied
+
+    def _exists(self, person_id: int) -> bool:
+        # The person may have been deleted locally while the sync was not running
+        try:
+            self.store.get_person_by_id(person_id)
+        except KeyError:
+            return False
+        return True
+
+    def sync(self) -> SyncResult:
+        """
+        Send the own changes and apply the changes of the other stations, once over every transport.
+        """
+        result = SyncResult()
+        with span("sync"):
+            for transport in self.transports:
+                with self._lock:
+                    pushed = self._pushed.get(transport.key, 0)
+                    changes = self.changes_since(pushed)
+                transport.push(self.station, changes)
+                if changes:
+                    with self._lock:
+                        self._pushed[transport.key] = changes[-1].seq
+                        self._log({"type": "pushed", "transport": transport.key, "seq": changes[-1].seq})
+                    result.sent += len(changes)
+                cursors = dict(self._cursors.get(transport.key, {}))
+                for peer, changes, cursor in transport.pull(self.station, cursors, result.errors):
+                    result.received += len(changes)
+                    result.applied += self.apply(changes)
+                    with self._lock:
+                        self._cursors.setdefault(transport.key, {})[peer] = cursor
+                        self._log({"type": "cursor", "transport": transport.key, "peer": peer, "cursor": cursor})
+            with self._lock:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+        return result
+
+    def start(self, interval: float = SYNC_INTERVAL):
+        """
+        Sync in the background every interval seconds. Failures are kept in last_error until a sync succeeds.
+        """
+        self._running = True
+        self._schedule(0, interval)
+
+    def _schedule(self, delay: float, interval: float):
+        self._timer = threading.Timer(delay, self._sync_in_background, (interval,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _sync_in_background(self, interval: float):
+        try:
+            result = self.sync()
+        except Exception as e:
+            self.last_error = f"Sync failed: {e}"
+        else:
+            self.last_result = result
+            self.last_error = "; ".join(result.errors) or None
+        if self._running:
+            self._schedule(interval, interval)
+
+    def close(self):
+        self._running = False
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.detach()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class SyncServer:
+    """
+    HTTP endpoint of a station, GET /changes?since=<seq> returns its changes after seq as JSON.
+    Requests without the token shared by the stations are refused. The endpoint is plain HTTP, it is meant for the
+    network of the shelter only.
+    """
+
+    def __init__(self, manager: SyncManager, host: str = "127.0.0.1", port: int = 8765, *, token: str):
+        if not token:
+            message = "The sync endpoint needs a token"
+            raise ValueError(message)
+        self.manager = manager
+        expected = token.encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                given = self.headers.get(TOKEN_HEADER, "").encode()
+                if not hmac.compare_digest(given, expected):
+                    self.send_error(403)
+                    return
+                url = urllib.parse.urlparse(self.path)
+                if url.path != "/changes":
+                    self.send_error(404)
+                    return
+                try:
+                    since = int(urllib.parse.parse_qs(url.query).get("since", ["0"])[0])
+                except ValueError:
+                    self.send_error(400)
+                    return
+                changes = manager.changes_since(since, HTTP_BATCH)
+                body = json.dumps(
+                    {
+                        "station": manager.station,
+                        "changes": [change.to_dict() for change in changes],
+                        "more": since + len(changes) < manager.last_seq(),
+                    }
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="sync-server", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SyncSession:
+    """
+    Sync of a store as configured on the command line: a shared folder, peers and an own endpoint.
+    listen is [HOST:]PORT, without host only this computer can connect. Peers and the endpoint need the token
+    shared by the stations.
+    """
+
+    def __init__(
+        self,
+        store: Registrants,
+        *,
+        folder: Optional[Path] = None,
+        peers: Sequence[str] = (),
+        listen: Optional[str] = None,
+        token: Optional[str] = None,
+        on_change: Optional[Callable[[], None]] = None,
+    ):
+        if (peers or listen is not None) and not token:
+            message = "A sync token is needed to sync over HTTP"
+            raise ValueError(message)
+        transports = []
+        if folder is not None:
+            transports.append(FolderTransport(folder))
+        if peers:
+            transports.append(HTTPTransport(peers, token))
+        self.manager = SyncManager(store, transports, on_change)
+        self.manager.attach()
+        self.server = None
+        if listen is not None:
+            host, _, port = listen.rpartition(":")
+            self.server = SyncServer(self.manager, host or "127.0.0.1", int(port), token=token)
+            self.server.start()
+
+    def start(self, interval: float = SYNC_INTERVAL):
+        self.manager.start(interval)
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        self.manager.close()
@@ -0,0 +1,354 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Synthetic ID documents with a machine readable zone, to measure and test the recognition without real
+documents. The MRZs have valid check digits, the images can be degraded with noise, blur, skew and a lower
+resolution like camera frames.
+"""
+
+import random
+from datetime import date, timedelta
+from typing import Iterator, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from disaster_id_scan.detect import MRZ_FORMATS
+from disaster_id_scan.mrz import TD1, TD2, TD3, mrz_checksum
+from disaster_id_scan.preprocess import DOCUMENT_SIZES, GLYPH_HEIGHT
+
+# Character pitch and line pitch of the MRZ in mm (ICAO 9303 part 3)
+CHAR_PITCH = 2.54
+LINE_PITCH = 4.23
+# Distance of the last MRZ line from the bottom edge of the document in mm
+BOTTOM_MARGIN = 3.0
+# Line and position of the check digit of the optional personal number on passports
+TD3_PERSONAL_NUMBER_CHECK = (2, 43)
+
+DOCUMENT_TYPES = {"TD1": TD1, "TD2": TD2, "TD3": TD3}
+
+LAST_NAMES = [
+    "MUELLER",
+    "SCHMIDT",
+    "SCHNEIDER",
+    "FISCHER",
+    "WEBER",
+    "MEYER",
+    "WAGNER",
+    "BECKER",
+    "SCHULZ",
+    "HOFFMANN",
+    "KOCH",
+    "RICHTER",
+    "KLEIN",
+    "WOLF",
+    "SCHROEDER",
+    "NEUMANN",
+    "SCHWARZ",
+    "ZIMMERMANN",
+    "BRAUN",
+    "KRUEGER",
+    "HARTMANN",
+    "LANGE",
+    "SCHMITT",
+    "WERNER",
+    "KRAUSE",
+    "MEIER",
+    "LEHMANN",
+]
+FIRST_NAMES = [
+    "ANNA",
+    "MARIA",
+    "LUKAS",
+    "LEON",
+    "EMMA",
+    "MIA",
+    "PAUL",
+    "JONAS",
+    "SOPHIE",
+    "FELIX",
+    "HANNAH",
+    "ELIAS",
+    "LENA",
+    "NOAH",
+    "LEA",
+    "FINN",
+    "LAURA",
+    "BEN",
+    "JULIA",
+    "TIM",
+    "KARL",
+    "ERIKA",
+    "HANS",
+]
+COUNTRIES = ["D", "AUT", "CHE", "FRA", "NLD", "POL", "ITA", "ESP", "UKR"]
+
+
+class SyntheticDocument:
+    """
+    A rendered document with the MRZ (lines joined) and the values it encodes.
+    """
+
+    document_format: str
+    mrz: str
+    last_name: str
+    first_name: str
+    date_of_birth: date
+    image: np.ndarray
+
+    def __init__(
+        self,
+        document_format: str,
+        mrz: str,
+        *,
+        last_name: str,
+        first_name: str,
+        date_of_birth: date,
+        image: np.ndarray,
+    ):
+        self.document_format = document_format
+        self.mrz = mrz
+        self.last_name = last_name
+        self.first_name = first_name
+        self.date_of_birth = date_of_birth
+        self.image = image
+
+    def lines(self) -> list[str]:
+        length = MRZ_FORMATS[self.document_format][0]
+        return [self.mrz[i : i + length] for i in range(0, len(self.mrz), length)]
+
+    def __repr__(self):
+        height, width = self.image.shape[:2]
+        return f"SyntheticDocument({self.document_format}, {self.last_name}, {width}x{height})"
+
+
+def _field(text: str, length: int) -> str:
+    return text.upper().replace(" ", "<")[:length].ljust(length, "<")
+
+
+def _random_code(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice("ABCDEFGHJKLMNPRTVWXYZ0123456789") for _ in range(length))
+
+
+def build_mrz(
+    document_format: str,
+    *,
+    last_name: str,
+    first_name: str,
+    date_of_birth: date,
+    nationality: str,
+    document_number: str,
+    expiry: date,
+    sex: str = "<",
+) -> str:
+    """
+    Assemble the MRZ of a document and fill in all check digits.
+    """
+    chars, lines = MRZ_FORMATS[document_format]
+    names = _field(f"{last_name}<<{first_name}", 39 if document_format == "TD3" else chars - 5)
+    country = _field(nationality, 3)
+    number = _field(document_number, 9)
+    dob = date_of_birth.strftime("%y%m%d")
+    exp = expiry.strftime("%y%m%d")
+    if document_format == "TD1":
+        rows = [f"ID{country}{number}0{'<' * 15}", f"{dob}0{sex}{exp}0{country}{'<' * 11}0", _field(names, 30)]
+    elif document_format == "TD2":
+        rows = [f"I<{country}{names}", f"{number}0{country}{dob}0{sex}{exp}0{'<' * 7}0"]
+    else:
+        rows = [f"P<{country}{names}", f"{number}0{country}{dob}0{sex}{exp}0{'<' * 14}<0"]
+    mrz = [list(row) for row in rows]
+
+    document = DOCUMENT_TYPES[document_format]()
+    # The composite check digit covers the other ones, it is computed last
+    for fields, (row, start, _) in sorted(document.check_digits.values(), key=lambda check: len(check[0])):
+        data = "".join("".join(mrz[r - 1][s - 1 : e]) for r, s, e in fields)
+        if document_format == "TD3" and (row, start) == TD3_PERSONAL_NUMBER_CHECK and data.strip("<") == "":
+            # Empty personal number, the check digit may stay a filler
+            continue
+        mrz[row - 1][start - 1] = str(mrz_checksum(data))
+    result = "".join("".join(row) for row in mrz)
+    if len(result) != chars * lines:
+        message = f"MRZ has {len(result)} characters instead of {chars * lines}"
+        raise ValueError(message)
+    return result
+
+
+def random_identity(rng: random.Random) -> dict:
+    return {
+        "last_name": rng.choice(LAST_NAMES),
+        "first_name": rng.choice(FIRST_NAMES),
+        "date_of_birth": date(1940, 1, 1) + timedelta(days=rng.randrange(30000)),
+        "nationality": rng.choice(COUNTRIES),
+        "document_number": _random_code(rng, 9),
+        "expiry": date(2024, 1, 1) + timedelta(days=rng.randrange(3650)),
+        "sex": rng.choice("MF<"),
+    }
+
+
+def draw_text(image: np.ndarray, text: str, x: float, y: float, *, pitch: float, height: float, color: int = 20):
+    """
+    Draw monospaced text with the baseline at y, every character centered in a cell of width pitch.
+    """
+    # Hershey fonts have a cap height of about 22 px at scale 1
+    scale = height / 22
+    thickness = max(1, round(height / 9))
+    for i, char in enumerate(text):
+        if char == " ":
+            continue
+        (width, _), _ = cv2.getTextSize(char, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+        origin = (round(x + i * pitch + (pitch - width) / 2), round(y))
+        cv2.putText(image, char, origin, cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness, cv2.LINE_AA)
+
+
+def render_document(
+    document_format: str, mrz: str, px_per_mm: float = 8.0, rng: Optional[random.Random] = None
+) -> np.ndarray:
+    """
+    Render the front (TD1: back) of a document with the MRZ at the bottom, as BGR image.
+    The resolution is given in pixels per mm, 8 px/mm is a card filling a 1280 px wide frame.
+    """
+    rng = rng if rng is not None else random.Random(0)
+    width_mm, height_mm = DOCUMENT_SIZES[document_format]
+    chars, lines = MRZ_FORMATS[document_format]
+    width, height = int(width_mm * px_per_mm), int(height_mm * px_per_mm)
+    card = np.full((height, width), 235, np.uint8)
+    # Background print, the MRZ has to be found between other content
+    card[: int(height * 0.12), :] = 200
+    photo_width = int(width * 0.28)
+    photo_top = int(height * 0.18)
+    photo_bottom = height - int((BOTTOM_MARGIN + lines * LINE_PITCH + 3) * px_per_mm)
+    cv2.rectangle(card, (int(width * 0.04), photo_top), (int(width * 0.04) + photo_width, photo_bottom), 120, -1)
+    # The printed data stays clear of the MRZ, like on real documents
+    for row in range(4):
+        y = photo_top + (row + 1) * (photo_bottom - photo_top) / 7
+        text = " ".join(_random_code(rng, rng.randint(4, 9)) for _ in range(2))
+        draw_text(card, text, width * 0.38, y, pitch=1.6 * px_per_mm, height=1.6 * px_per_mm, color=70)
+
+    pitch = CHAR_PITCH * px_per_mm
+    left = (width - chars * pitch) / 2
+    for line in range(lines):
+        baseline = height - (BOTTOM_MARGIN + (lines - 1 - line) * LINE_PITCH) * px_per_mm
+        draw_text(
+            card,
+            mrz[line * chars : (line + 1) * chars],
+            left,
+            baseline,
+            pitch=pitch,
+            height=GLYPH_HEIGHT * px_per_mm,
+        )
+    return cv2.cvtColor(card, cv2.COLOR_GRAY2BGR)
+
+
+def degrade(
+    image: np.ndarray,
+    rng: random.Random,
+    *,
+    noise: float = 0.0,
+    blur: float = 0.0,
+    skew: float = 0.0,
+    scale: float = 1.0,
+    background: int = 60,
+) -> np.ndarray:
+    """
+    Put the document on a darker background like in a camera frame and degrade it.
+    noise is the standard deviation of Gaussian noise in gray values, blur the sigma of a Gaussian blur in
+    pixels, skew the rotation in degrees (a random perspective tilt of the same strength is added) and scale
+    the factor the result is resized with.
+    """
+    height, width = image.shape[:2]
+    margin_x, margin_y = int(width * 0.2), int(height * 0.2)
+    frame = np.full((height + 2 * margin_y, width + 2 * margin_x, 3), background, np.uint8)
+    frame[margin_y : margin_y + height, margin_x : margin_x + width] = image
+
+    if skew:
+        corners = np.array(
+            [
+                [margin_x, margin_y],
+                [margin_x + width, margin_y],
+                [margin_x + width, margin_y + height],
+                [margin_x, margin_y + height],
+            ],
+            np.float32,
+        )
+        center = corners.mean(axis=0)
+        angle = np.radians(skew)
+        rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]], np.float32)
+        tilt = abs(skew) / 100 * min(width, height)
+        jitter = np.array([[rng.uniform(-tilt, tilt), rng.uniform(-tilt, tilt)] for _ in range(4)], np.float32)
+        target = (corners - center) @ rotation.T + center + jitter
+        matrix = cv2.getPerspectiveTransform(corners, target)
+        frame = cv2.warpPerspective(
+            frame,
+            matrix,
+            (frame.shape[1], frame.shape[0]),
+            flags=cv2.INTER_LINEAR,
+            borderValue=(background, background, background),
+        )
+    if scale != 1.0:
+        frame = cv2.resize(
+            frame,
+            (int(frame.shape[1] * scale), int(frame.shape[0] * scale)),
+            interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR,
+        )
+    if blur:
+        frame = cv2.GaussianBlur(frame, (0, 0), blur)
+    if noise:
+        generator = np.random.default_rng(rng.randrange(2**32))
+        noisy = frame.astype(np.float32) + generator.normal(0, noise, frame.shape).astype(np.float32)
+        frame = np.clip(noisy, 0, 255).astype(np.uint8)
+    return frame
+
+
+def generate(
+    document_format: str = "TD3",
+    seed: int = 0,
+    *,
+    px_per_mm: float = 8.0,
+    noise: float = 0.0,
+    blur: float = 0.0,
+    skew: float = 0.0,
+    scale: float = 1.0,
+) -> SyntheticDocument:
+    """
+    Generate a document with a random identity, the same seed gives the same document.
+    """
+    rng = random.Random(f"{document_format}-{seed}")
+    identity = random_identity(rng)
+    mrz = build_mrz(document_format, **identity)
+    image = render_document(document_format, mrz, px_per_mm, rng)
+    image = degrade(image, rng, noise=noise, blur=blur, skew=skew, scale=scale)
+    return SyntheticDocument(
+        document_format,
+        mrz,
+        last_name=identity["last_name"],
+        first_name=identity["first_name"],
+        date_of_birth=identity["date_of_birth"],
+        image=image,
+    )
+
+
+def generate_set(
+    count: int,
+    formats: Sequence[str] = ("TD1", "TD2", "TD3"),
+    *,
+    seed: int = 0,
+    max_noise: float = 12.0,
+    max_blur: float = 1.5,
+    max_skew: float = 8.0,
+    resolutions: Sequence[float] = (6.0, 8.0, 12.0),
+) -> Iterator[SyntheticDocument]:
+    """
+    Generate count documents of the formats in turn, with noise, blur, skew and resolution varying up to the
+    given limits. The set is the same for the same arguments.
+    """
+    rng = random.Random(seed)
+    for index in range(count):
+        yield generate(
+            formats[index % len(formats)],
+            seed * 100_000 + index,
+            px_per_mm=rng.choice(resolutions),
+            noise=rng.uniform(0, max_noise),
+            blur=rng.uniform(0, max_blur),
+            skew=rng.uniform(-max_skew, max_skew),
+        )
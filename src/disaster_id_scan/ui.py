@@ -1,128 +1,102 @@
 # SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
 #
 # SPDX-License-Identifier: EUPL-1.2
+import threading
 import tkinter as tk
 from pathlib import Path
-from tkinter import ttk
-import sv_ttk
-from tkinter import filedialog
+from tkinter import filedialog, messagebox, ttk
+from typing import Optional, Sequence
+
 import cv2
-from PIL import ImageTk, Image
-import threading
-import easyocr
+import sv_ttk
 from tkcalendar import DateEntry
 
-from disaster_id_scan.mrz import parse_mrz
-from disaster_id_scan.store import Person, Registrants
-
-
-def get_available_cameras():
-    camera_indexes = []
-    for i in range(10):
-        cap = cv2.VideoCapture(i)
-        if cap.read()[0]:
-            camera_indexes.append(i)
-        cap.release()
-    return camera_indexes
+from disaster_id_scan import profiling
+from disaster_id_scan.autoscan import AutoScanner
+from disaster_id_scan.cameras import POSSIBLE_RESOLUTIONS, CameraRegistry, probe_resolutions
+from disaster_id_scan.frames import FrameGrabber
+from disaster_id_scan.ocr import DEFAULT_LANGUAGES, get_engine
+from disaster_id_scan.preprocessing import DEFAULT_PREPROCESSING, Preprocessing
+from disaster_id_scan.preview import PREVIEW_FPS, PreviewPipeline
+from disaster_id_scan.recognition import RecognitionQueue
+from disaster_id_scan.recognition_cache import RecognitionCache
+from disaster_id_scan.store import Person, create_registrants, person_label
 
 
 class VideoStreamer:
-    possible_resolutions = [
-        (640, 480),
-        (1024, 600),
-        (1024, 640),
-        (960, 720),
-        (1024, 768),
-        (1024, 800),
-        (1280, 720),
-        (1280, 768),
-        (1280, 800),
-        (1024, 1024),
-        (1080, 1200),
-        (1280, 1024),
-        (1440, 1024),
-        (1440, 1080),
-        (1600, 1024),
-        (1680, 1050),
-        (1600, 1200),
-        (1600, 1280),
-        (1920, 1080),
-        (2048, 1080),
-        (1920, 1200),
-        (2048, 1152),
-        (1920, 1280),
-        (2400, 1080),
-        (1800, 1440),
-        (2048, 1280),
-        (1920, 1400),
-        (2520, 1080),
-        (1920, 1440),
-        (2560, 1080),
-        (2160, 1440),
-        (2560, 1440),
-        (2560, 1600),
-        (2880, 1440),
-        (2960, 1440),
-        (2560, 1700),
-        (2560, 1800),
-        (2560, 1920),
-    ]
-
-    def __init__(self, camera_index, image_label):
+    possible_resolutions = POSSIBLE_RESOLUTIONS
+
+    def __init__(self, camera_index, image_label, resolution=None, fps: float = PREVIEW_FPS):
         self.camera_index = camera_index
         self.image_label = image_label
+        # Best resolution of the camera, from the camera cache
+        self.resolution = resolution
+        self.fps = fps
         self.is_running = False
         self.cap = None
+        self.grabber = None
+        self.preview = None
 
     def start(self):
         self.cap = cv2.VideoCapture(self.camera_index)
         # Set resolution
-        w, h = self.get_resolution()
+        w, h = self.resolution if self.resolution is not None else self.get_resolution()
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, w)
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, h)
+        # Frames waiting in the driver would only add latency
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         self.is_running = True
-        self.show_frame()
+        # The grabber is the only reader of the camera, preview and recognition take their frames from it
+        self.grabber = FrameGrabber(self.cap)
+        self.grabber.start()
+        self.preview = PreviewPipeline(self.grabber, self.image_label, self.fps)
+        self.preview.start()
 
     def stop(self):
         self.is_running = False
+        if self.preview:
+            self.preview.stop()
+        if self.grabber:
+            self.grabber.stop()
         if self.cap:
             self.cap.release()
 
     def get_resolution(self):
-        max_w, max_h = self.possible_resolutions[0]
-        for w, h in self.possible_resolutions:
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, w)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, h)
-            if self.cap.get(cv2.CAP_PROP_FRAME_WIDTH) == w and self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT) == h:
-                if w * h > max_w * max_h:
-                    max_w, max_h = w, h
-        return max_w, max_h
-
-    def show_frame(self):
-        if not self.is_running:
-            return
-
-        _, frame = self.cap.read()
-        # Convert the image to RGB
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        imgtk = ImageTk.PhotoImage(image=Image.fromarray(frame))
-        # if larger than 640x480, rescale
-        width = 1000
-        if imgtk.width() > width:
-            height = int(imgtk.height() * (width / imgtk.width()))
-            imgtk = ImageTk.PhotoImage(image=Image.fromarray(frame).resize((width, height)))
-        self.image_label.imgtk = imgtk
-        self.image_label.configure(image=imgtk, width=imgtk.width(), height=imgtk.height())
-        self.image_label.after(10, self.show_frame)  # Update the frame every 10 milliseconds
+        # Only needed if the camera is not in the camera cache yet
+        resolutions = probe_resolutions(self.cap) or [self.possible_resolutions[0]]
+        return max(resolutions, key=lambda size: size[0] * size[1])
 
 
 class GUI:
-    def __init__(self):
+    # Number of matches shown in the person list
+    person_list_length: int = 20
+
+    def __init__(
+        self,
+        languages: Sequence[str] = DEFAULT_LANGUAGES,
+        store_backend: str = "json",
+        *,
+        preview_fps: float = PREVIEW_FPS,
+        sync_options: Optional[dict] = None,
+        preprocessing: Preprocessing = DEFAULT_PREPROCESSING,
+        recognizer: str = "easyocr",
+    ):
+        self.preview_fps = preview_fps
+        # Sync with other stations, started when the data folder is selected
+        self.sync_options = sync_options
+        self.sync = None
+        self.sync_changed = threading.Event()
+        self.sync_error: Optional[str] = None
         self.loaded_person_id: int = None
+        # Person ids of the entries in the person list, in the same order
+        self.person_ids: list[int] = []
+        # Start loading the OCR models right away, so they are ready when the first document is scanned
+        self.ocr_engine = get_engine(languages, recognizer=recognizer)
+        self.ocr_engine.warm_up()
         self.window = tk.Tk()
         self.window.title("Disaster ID Scan")
         # self.style = ttk.Style("cosmo")
-        self.store = Registrants()
+        self.store = create_registrants(store_backend)
 
         self.frame = tk.LabelFrame(self.window, text="Camera")
         self.frame.grid(row=0, column=0, rowspan=4, padx=10, pady=20)
@@ -136,33 +110,67 @@ class GUI:
         self.buttons_frame = tk.LabelFrame(self.frame, text="Actions")
         self.buttons_frame.grid(row=1, column=0, columnspan=2, padx=10, pady=10, ipady=5, ipadx=5)
 
-        self.camera_indexes = get_available_cameras()
+        # Cameras of the last run are shown right away, they are probed again in the background if the devices
+        # changed
+        self.camera_registry = CameraRegistry()
+        self.cameras = self.camera_registry.cameras()
 
         self.camera_label = ttk.Label(self.buttons_frame, text="Camera:")
         self.camera_label.grid(row=0, column=1, padx=5, sticky="e")
-        self.camera_combobox = ttk.Combobox(self.buttons_frame, values=[str(idx) for idx in self.camera_indexes],
-                                            state="readonly")
-        if self.camera_indexes:
-            self.camera_combobox.current(self.camera_indexes[0])
+        self.camera_combobox = ttk.Combobox(
+            self.buttons_frame, values=[camera.label() for camera in self.cameras], state="readonly"
+        )
+        if self.cameras:
+            self.camera_combobox.current(0)
         self.camera_combobox.grid(row=0, column=2, pady=5)
+        self.camera_refresh = self.camera_registry.refresh()
+        self.window.after(200, self.poll_cameras)
 
         self.start_stop_video = ttk.Button(self.buttons_frame, text="Start video", command=self.start_or_stop_video)
         self.capture_text = ttk.Button(self.buttons_frame, text="Recognize Text", command=self.capture_frame_text)
-        self.select_data_folder = ttk.Button(self.buttons_frame, text="Select Data Folder",
-                                             command=self.open_data_folder_selector)
+        self.select_data_folder = ttk.Button(
+            self.buttons_frame, text="Select Data Folder", command=self.open_data_folder_selector
+        )
         self.start_stop_video.grid(row=1, column=0, padx=5)
         self.capture_text.grid(row=1, column=1, padx=5)
         self.select_data_folder.grid(row=1, column=2, padx=5)
 
+        # Recognition runs in the background, progress is shown below the buttons. A document lying still is
+        # only read once by the button and the auto scan.
+        self.recognition_cache = RecognitionCache()
+        self.recognition = RecognitionQueue(self.ocr_engine, preprocessing=preprocessing, cache=self.recognition_cache)
+        self.recognition_polling = False
+        self.recognition_progress = ttk.Progressbar(self.buttons_frame, mode="indeterminate", length=150)
+        self.recognition_progress.grid(row=2, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
+        self.recognition_status = ttk.Label(self.buttons_frame, text="")
+        self.recognition_status.grid(row=2, column=2, padx=5, sticky="w")
+
+        # Auto scan reads the live stream until a MRZ with valid check digits is found
+        self.auto_scanner = AutoScanner(
+            RecognitionQueue(self.ocr_engine, preprocessing=preprocessing, cache=self.recognition_cache),
+            on_error=self.auto_scan_failed,
+        )
+        self.auto_scan_running = False
+        # Sequence number of the last frame offered to the auto scan
+        self.auto_scan_sequence = None
+        self.auto_scan_button = ttk.Button(self.buttons_frame, text="Start auto scan", command=self.toggle_auto_scan)
+        self.auto_scan_button.grid(row=0, column=0, padx=5)
+
         # LabelFrame to Load existing person / data
         self.load_frame = ttk.LabelFrame(self.window, text="Load Person")
         self.load_frame.grid(row=1, column=3, columnspan=2, pady=10, padx=10, ipadx=5, ipady=5, sticky="nsew")
-        # Create Combobox to select existing person
+        # Search box, the list shows the best matches while typing, or the latest registrations
         self.load_frame.columnconfigure(0, weight=1)
-        self.person_combobox = ttk.Combobox(self.load_frame, values=self.store.get_name_list(), state="readonly")
-        self.person_combobox.grid(row=0, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
+        self.person_search = tk.StringVar()
+        self.person_search.trace_add("write", lambda *_: self.update_person_list())
+        self.person_search_entry = ttk.Entry(self.load_frame, textvariable=self.person_search)
+        self.person_search_entry.grid(row=0, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
         self.load_person_button = ttk.Button(self.load_frame, text="Load Person", command=self.load_person_from_list)
         self.load_person_button.grid(row=0, column=2, padx=5, pady=5, sticky="e")
+        self.person_listbox = tk.Listbox(self.load_frame, height=6, exportselection=False)
+        self.person_listbox.grid(row=1, column=0, columnspan=3, padx=5, pady=5, sticky="ew")
+        self.person_listbox.bind("<Double-Button-1>", lambda _: self.load_person_from_list())
+        self.person_search_entry.bind("<Return>", lambda _: self.load_person_from_list())
 
         self.data_frame = ttk.LabelFrame(self.window, text="Data")
         self.data_frame.grid(row=0, column=3, columnspan=2, pady=10, padx=10, sticky="nsew")
@@ -211,6 +219,12 @@ class GUI:
         self.error_label = tk.Label(self.window, text="", fg="red")
         # self.error_label.pack()
 
+        # Timings of the stages, only shown with --profile
+        self.profile_label = ttk.Label(self.window, text="")
+        if profiling.is_enabled():
+            self.profile_label.grid(row=4, column=0, columnspan=5, padx=10, pady=5, sticky="w")
+            self.update_profile_label()
+
         self.video_streamer = None
         self.data_folder_selected = False
 
@@ -237,15 +251,61 @@ class GUI:
             self.video_streamer.stop()
             self.start_stop_video.config(text="Start video")
         else:
-            try:
-                camera_index = int(self.camera_combobox.get())
-            except ValueError:
+            selected = self.camera_combobox.current()
+            if selected < 0:
                 self.display_error("Please check that a camera is available and selected.")
                 return
-            self.video_streamer = VideoStreamer(camera_index, self.image_label)
+            camera = self.cameras[selected]
+            self.video_streamer = VideoStreamer(
+                camera.index, self.image_label, camera.best_resolution(), self.preview_fps
+            )
             self.video_streamer.start()
             self.start_stop_video.config(text="Stop video")
 
+    def poll_cameras(self):
+        if not self.camera_refresh.done():
+            self.window.after(200, self.poll_cameras)
+            return
+        if self.camera_refresh.exception() is not None:
+            self.recognition_status.config(text=f"Probing cameras failed: {self.camera_refresh.exception()}")
+            return
+        selected = self.cameras[self.camera_combobox.current()].key if self.camera_combobox.current() >= 0 else None
+        self.cameras = self.camera_refresh.result()
+        self.camera_combobox["values"] = [camera.label() for camera in self.cameras]
+        keys = [camera.key for camera in self.cameras]
+        if selected in keys:
+            self.camera_combobox.current(keys.index(selected))
+        elif self.cameras:
+            self.camera_combobox.current(0)
+        else:
+            self.camera_combobox.set("")
+
+    def update_profile_label(self):
+        parts = []
+        for name, label in (
+            ("capture", "Capture"),
+            ("preprocess.card", "Card"),
+            ("preprocess", "Locate"),
+            ("cache.lookup", "Cache"),
+            ("ocr.load", "OCR load"),
+            ("ocr.grid", "Grid"),
+            ("ocr", "OCR"),
+            ("mrz.parse", "Parse"),
+            ("store.save", "Save"),
+            ("export", "Export"),
+        ):
+            stage = profiling.PROFILER.get(name)
+            if stage is not None and stage.count:
+                parts.append(f"{label} {stage.p50() * 1000:.0f}/{stage.p95() * 1000:.0f} ms")
+        text = "p50/p95: " + ", ".join(parts) if parts else "p50/p95: no timings yet"
+        if self.recognition_cache.stats.hit_rate() is not None:
+            text += f"\n{self.recognition_cache.stats}"
+        # Frame rate, drops, latency and CPU usage since the preview started
+        if self.video_streamer and self.video_streamer.is_running:
+            text += f"\n{self.video_streamer.preview.stats}"
+        self.profile_label.config(text=text)
+        self.window.after(1000, self.update_profile_label)
+
     def set_camera_placeholder(self):
         self.image_label = tk.Label(self.frame, text="No camera active", width=125, height=33, bg="black", fg="white")
 
@@ -254,34 +314,165 @@ class GUI:
             self.display_error("Please start the video before recognizing text.")
             return
 
-        frame = self.video_streamer.cap.read()[1]
-        reader = easyocr.Reader(['de'])
-        text = reader.readtext(frame, paragraph=True, allowlist='ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789<')
-        print(text)
-        for element in text:
-            if "<" in element[1]:
-                # Assume that it could be the MRZ, try to parse it
-                possible_mrz = element[1]
-                possible_mrz = possible_mrz.upper()
-                parsed = parse_mrz(possible_mrz)
-                if parsed is not None:
-                    # Set the values in the form
-                    self.set_person(parsed)
-                    self.set_buttons_enabled(False)
+        # The sharpest of the last frames, the document may have moved while the button was pressed
+        frame = self.video_streamer.grabber.sharpest()
+        if frame is None:
+            self.display_error("The camera has not delivered a frame yet.")
+            return
+        # A newer scan replaces one that is still being processed
+        self.recognition.submit(frame.image)
+        self.recognition_progress.start(10)
+        if not self.recognition_polling:
+            self.recognition_polling = True
+            self.poll_recognition()
+
+    def poll_recognition(self):
+        for _, result, error in self.recognition.poll():
+            if error is not None:
+                self.recognition_status.config(text=f"Recognition failed: {error}")
+                continue
+            if result.person is not None:
+                # Set the values in the form
+                self.set_person(result.person)
+                self.set_buttons_enabled(enabled=False)
+                if result.parsed.valid:
+                    self.recognition_status.config(text=f"MRZ recognized ({result.parsed.confidence:.0%} confidence)")
+                else:
+                    self.recognition_status.config(text="MRZ recognized, check digits do not match")
+            else:
+                self.recognition_status.config(text="No MRZ found, please try again")
+
+        job = self.recognition.current_job()
+        if job is None:
+            self.recognition_progress.stop()
+            self.recognition_polling = False
+            return
+        if not self.ocr_engine.is_ready():
+            self.recognition_status.config(text="Loading OCR models...")
+        else:
+            self.recognition_status.config(text=f"Recognizing: {job.stage}...")
+        self.window.after(100, self.poll_recognition)
+
+    def toggle_auto_scan(self):
+        if self.auto_scan_running:
+            self.stop_auto_scan()
+            return
+        if not self.video_streamer or not self.video_streamer.is_running:
+            self.display_error("Please start the video before scanning.")
+            return
+        self.auto_scan_running = True
+        self.auto_scan_button.config(text="Stop auto scan")
+        # Manual recognition would compete with the auto scan for the OCR engine
+        self.capture_text.config(state=tk.DISABLED)
+        self.recognition_progress.start(10)
+        self.auto_scan_tick()
+
+    def stop_auto_scan(self):
+        self.auto_scan_running = False
+        self.auto_scanner.reset()
+        self.auto_scan_button.config(text="Start auto scan")
+        self.capture_text.config(state=tk.NORMAL)
+        self.recognition_progress.stop()
+
+    def auto_scan_tick(self):
+        if not self.auto_scan_running:
+            return
+        if not self.video_streamer or not self.video_streamer.is_running:
+            self.stop_auto_scan()
+            return
+        frame = self.video_streamer.grabber.latest()
+        # A frame is only offered once, the camera may deliver fewer frames than the scan ticks
+        if frame is not None and frame.sequence != self.auto_scan_sequence:
+            self.auto_scan_sequence = frame.sequence
+            self.auto_scanner.offer_frame(frame.image, frame.quality())
+        person = self.auto_scanner.collect()
+        if self.auto_scanner.stopped:
+            error = self.auto_scanner.last_error
+            self.stop_auto_scan()
+            self.recognition_status.config(text=f"Auto scan stopped, recognition failed: {error}")
+            return
+        if person is not None:
+            self.set_person(person)
+            self.set_buttons_enabled(enabled=False)
+            self.stop_auto_scan()
+            self.recognition_status.config(text="MRZ recognized")
+            return
+        quality = self.auto_scanner.last_quality
+        # The error of a failed recognition stays shown (auto_scan_failed) until a recognition succeeds
+        if self.auto_scanner.errors_in_row == 0:
+            if quality is not None and not self.auto_scanner.is_promising(quality):
+                self.recognition_status.config(text="Scanning: hold the document still")
+            else:
+                self.recognition_status.config(text=f"Scanning: {self.auto_scanner.voter.reading_count()} readings")
+        self.window.after(200, self.auto_scan_tick)
+
+    def auto_scan_failed(self, error: Exception):
+        self.recognition_status.config(text=f"Recognition failed: {error}")
+
     def open_data_folder_selector(self):
         folder_selected = filedialog.askdirectory()
         if folder_selected:
             self.data_folder_selected = True
             self.display_error("")
-            print("Selected data folder:", folder_selected)
+            self.recognition_status.config(text=f"Data folder: {folder_selected}")
+            self.stop_sync()
             self.store.set_path(Path(folder_selected))
-            self.update_person_combobox()
+            self.update_person_list()
+            self.start_sync()
         else:
             self.data_folder_selected = False
             self.display_error("Please select a data folder.")
 
-    def update_person_combobox(self):
-        self.person_combobox['values'] = self.store.get_name_list()
+    def start_sync(self):
+        if self.sync_options is None:
+            return
+        # Imported here, only stations that sync need it
+        from disaster_id_scan.sync import SyncSession
+
+        self.sync = SyncSession(self.store, on_change=self.sync_changed.set, **self.sync_options)
+        self.sync.start()
+        self.window.after(500, self.poll_sync)
+
+    def stop_sync(self):
+        if self.sync is not None:
+            self.sync.close()
+            self.sync = None
+
+    def poll_sync(self):
+        if self.sync is None:
+            return
+        # Registrations of other stations were applied in the sync thread
+        if self.sync_changed.is_set():
+            self.sync_changed.clear()
+            self.update_person_list()
+        # Show failures of the sync thread until a sync succeeds
+        error = self.sync.manager.last_error
+        if error != self.sync_error:
+            self.sync_error = error
+            self.recognition_status.config(text=error if error is not None else "Sync with other stations restored")
+        self.window.after(500, self.poll_sync)
+
+    def update_person_list(self):
+        query = self.person_search.get()
+        if query.strip():
+            entries = self.store.search(query, self.person_list_length)
+        else:
+            entries = self.store.get_recent(self.person_list_length)
+        self.person_ids = [person_id for person_id, _ in entries]
+        self.person_listbox.delete(0, tk.END)
+        self.person_listbox.insert(tk.END, *(person_label(person) for _, person in entries))
+        # Preselect the best match, so Return loads it
+        if entries:
+            self.person_listbox.selection_set(0)
+
+    def select_person_in_list(self, person_id: int):
+        self.person_listbox.selection_clear(0, tk.END)
+        if person_id in self.person_ids:
+            self.person_listbox.selection_set(self.person_ids.index(person_id))
+
+    def get_selected_person_id(self):
+        selection = self.person_listbox.curselection()
+        return self.person_ids[selection[0]] if selection else None
 
     def get_person_from_form(self) -> Person:
         human = Person()
@@ -297,33 +488,31 @@ class GUI:
 
     def create_person(self):
         human = self.get_person_from_form()
+        duplicates = self.store.find_duplicates(human)
+        if duplicates:
+            matches = "\n".join(f"{person_label(person)} ({score:.0%})" for _, person, score in duplicates[:5])
+            if not messagebox.askyesno(
+                "Possible duplicate", f"This person may already be registered:\n\n{matches}\n\nRegister anyway?"
+            ):
+                return
         self.store.add(human)
-        self.store.save()
         self.clear_form()
-        self.update_person_combobox()
+        self.update_person_list()
 
     def save_changes(self):
         human = self.get_person_from_form()
-        # Get the ID of the person that is currently loaded
-        person_id, _ = self.store.get_person_by_list_entry(self.person_combobox.get())
         self.store.update(self.loaded_person_id, human)
-        self.update_person_combobox()
-        # Set the combobox to the person that was just edited
-        self.person_combobox.current(person_id)
-
+        self.update_person_list()
+        # Select the person that was just edited
+        self.select_person_in_list(self.loaded_person_id)
 
     def delete_person(self):
-        selected_id, _ = self.store.get_person_by_list_entry(self.person_combobox.get())
         self.store.delete(self.loaded_person_id)
+        self.loaded_person_id = None
         self.clear_form()
-        self.update_person_combobox()
-        if self.loaded_person_id == selected_id:
-            self.person_combobox.current(0)
-        elif self.loaded_person_id > selected_id:
-            self.person_combobox.current(self.loaded_person_id - 1)
-        else:
-            self.person_combobox.current(self.loaded_person_id)
-        self.set_buttons_enabled(False)
+        self.update_person_list()
+        self.person_listbox.selection_clear(0, tk.END)
+        self.set_buttons_enabled(enabled=False)
 
     def clear_form(self):
         self.first_name_entry.delete(0, tk.END)
@@ -335,7 +524,7 @@ class GUI:
         # self.place_of_catastrophe_entry.delete(0, tk.END)
         # self.place_of_shelter_entry.delete(0, tk.END)
         # self.date_of_catastrophe_entry.set_date(None)
-        self.set_buttons_enabled(False)
+        self.set_buttons_enabled(enabled=False)
 
     def set_text(self, entry: tk.Entry, text: str):
         # Sets the text of an entry, removes old text
@@ -356,25 +545,27 @@ class GUI:
         self.set_text(self.nationality_entry, person.nationality)
         self.set_text_if_not_none(self.place_of_catastrophe_entry, person.place_of_catastrophe)
         self.set_text_if_not_none(self.place_of_shelter_entry, person.place_of_shelter)
-        if person.date_of_catastrope is not None:
-            self.date_of_catastrophe_entry.set_date(person.date_of_catastrope)
+        if person.date_of_catastrophe is not None:
+            self.date_of_catastrophe_entry.set_date(person.date_of_catastrophe)
 
     def load_person_from_list(self):
-        # Get the choosen list entry from combobox
-        selected_person = self.person_combobox.get()
+        # Get the id of the choosen list entry
+        person_id = self.get_selected_person_id()
+        if person_id is None:
+            return
         # Get the person object from the self.store
-        person_id, person = self.store.get_person_by_list_entry(selected_person)
+        person = self.store.get_person_by_id(person_id)
         # Set the values in the form
         self.set_person(person)
         # Set the loaded person id
         self.loaded_person_id = person_id
         # Enable the save and delete button
-        self.set_buttons_enabled(True)
+        self.set_buttons_enabled(enabled=True)
 
-    def set_buttons_enabled(self, enabled: bool):
-        '''
+    def set_buttons_enabled(self, *, enabled: bool):
+        """
         Enables or disables the save and delete button. They should only be enabled if a person is loaded.
-        '''
+        """
         self.save_changes_button.config(state=tk.NORMAL if enabled else tk.DISABLED)
         self.delete_button.config(state=tk.NORMAL if enabled else tk.DISABLED)
 
@@ -384,12 +575,28 @@ class GUI:
     def start_gui(self):
         sv_ttk.use_light_theme()
         self.window.mainloop()
+        self.recognition.shutdown()
+        self.auto_scanner.shutdown()
+        self.stop_sync()
+        self.store.close()
         self.window.destroy()
 
 
-def start_gui():
-    gui = GUI()
+def start_gui(
+    languages: Sequence[str] = DEFAULT_LANGUAGES,
+    store_backend: str = "json",
+    *,
+    preview_fps: float = PREVIEW_FPS,
+    sync_options: Optional[dict] = None,
+    preprocessing: Preprocessing = DEFAULT_PREPROCESSING,
+    recognizer: str = "easyocr",
+):
+    gui = GUI(
+        languages,
+        store_backend,
+        preview_fps=preview_fps,
+        sync_options=sync_options,
+        preprocessing=preprocessing,
+        recognizer=recognizer,
+    )
     gui.start_gui()
-
-
-start_gui()
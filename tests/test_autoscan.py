@@ -0,0 +1,40 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+from disaster_id_scan.autoscan import AutoScanner, FrameQuality
+
+SHARP = FrameQuality(sharpness=500.0, contrast=50.0)
+
+
+class FailingQueue:
+    def __init__(self):
+        self.results = []
+
+    def submit(self, _frame, **_kwargs):
+        self.results.append((None, None, OSError("Model download failed")))
+
+    def poll(self):
+        results, self.results = self.results, []
+        return results
+
+    def current_job(self):
+        return None
+
+    def cancel(self):
+        self.results = []
+
+
+def test_scan_stops_after_repeated_errors():
+    errors = []
+    scanner = AutoScanner(FailingQueue(), max_errors=2, on_error=errors.append)
+    frame = object()
+    for _ in range(3):
+        scanner.offer_frame(frame, SHARP)
+        assert scanner.collect_mrz() is None
+    # The third frame was not recognized any more
+    assert [str(error) for error in errors] == ["Model download failed"] * 2
+    assert scanner.stopped
+    assert not scanner.offer_frame(frame, SHARP)
+    scanner.reset()
+    assert not scanner.stopped
+    assert scanner.offer_frame(frame, SHARP)
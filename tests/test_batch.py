@@ -0,0 +1,133 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import os
+from datetime import date
+
+import pytest
+
+from disaster_id_scan import batch
+from disaster_id_scan.batch import MANIFEST_FILENAME, BatchItem, BatchManifest, find_images, run_batch
+from disaster_id_scan.store import Person, Registrants
+
+
+def make_images(directory, count: int) -> list:
+    directory.mkdir()
+    (directory / "notes.txt").write_text("not an image")
+    paths = [directory / f"id{i}.JPG" for i in range(count)]
+    for path in paths:
+        path.write_bytes(b"image")
+    return paths
+
+
+def open_store(path) -> Registrants:
+    path.mkdir()
+    store = Registrants()
+    store.set_path(path)
+    return store
+
+
+def test_manifest_remembers_processed_images(tmp_path):
+    first, second = make_images(tmp_path / "photos", 2)
+    assert find_images(tmp_path / "photos") == [first, second]
+    manifest = BatchManifest(tmp_path / MANIFEST_FILENAME)
+    manifest.record(first, ok=True)
+    manifest.record(second, ok=False)
+    manifest.close()
+
+    manifest = BatchManifest(tmp_path / MANIFEST_FILENAME)
+    assert manifest.is_processed(first) and manifest.is_processed(second)
+    # Failed images are only processed again on request
+    assert not manifest.is_processed(second, include_failed=False)
+    # A changed image is processed again
+    stat = first.stat()
+    os.utime(first, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert not manifest.is_processed(first)
+
+
+def test_processed_images_are_skipped(tmp_path):
+    images = make_images(tmp_path / "photos", 3)
+    store = open_store(tmp_path / "data")
+    try:
+        manifest = BatchManifest(store.save_path / MANIFEST_FILENAME)
+        for image in images:
+            manifest.record(image, ok=True)
+        manifest.close()
+        # No worker is started when there is nothing to do
+        summary = run_batch(tmp_path / "photos", store)
+        assert (summary.skipped, summary.processed) == (3, 0)
+    finally:
+        store.close()
+
+
+class FailingPool:
+    """
+    Stands in for the process pool, delivers the first result, then the user presses Ctrl-C.
+    """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, _function, paths):
+        item = BatchItem(paths[0])
+        item.error = "no MRZ found"
+        yield item
+        raise KeyboardInterrupt
+
+
+def test_manifest_is_closed_on_interrupt(tmp_path, monkeypatch):
+    make_images(tmp_path / "photos", 2)
+    store = open_store(tmp_path / "data")
+    closed = []
+    close = BatchManifest.close
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", FailingPool)
+    monkeypatch.setattr(
+        BatchManifest, "close", lambda manifest: closed.append(manifest._file is not None) or close(manifest)
+    )
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            run_batch(tmp_path / "photos", store)
+    finally:
+        store.close()
+    assert closed == [True]
+    # The image processed before the interrupt is recorded, and the failure reported
+    assert BatchManifest(store.save_path / MANIFEST_FILENAME).entries.keys() == {
+        str((tmp_path / "photos" / "id0.JPG").resolve())
+    }
+    assert "no MRZ found" in (store.save_path / batch.REPORT_FILENAME).read_text()
+
+
+class RecognizingPool(FailingPool):
+    """
+    Recognizes the same person in every image.
+    """
+
+    def map(self, _function, paths):
+        for path in paths:
+            item = BatchItem(path)
+            item.person = Person()
+            item.person.last_name, item.person.first_name = "MUSTERMANN", "ERIKA"
+            item.person.date_of_birth = date(1964, 8, 12)
+            item.person.nationality = "D"
+            yield item
+
+
+def test_person_added_before_a_crash_is_not_added_again(tmp_path, monkeypatch):
+    make_images(tmp_path / "photos", 1)
+    store = open_store(tmp_path / "data")
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", RecognizingPool)
+    try:
+        run_batch(tmp_path / "photos", store)
+        # The process died after adding the person, before the image was recorded as processed
+        (store.save_path / MANIFEST_FILENAME).unlink()
+        summary = run_batch(tmp_path / "photos", store)
+        assert (summary.added, summary.skipped) == (0, 1)
+        assert len(store.get_all()) == 1
+    finally:
+        store.close()
@@ -0,0 +1,33 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+from disaster_id_scan import cameras
+from disaster_id_scan.cameras import CameraInfo, CameraRegistry
+
+USB_CAMERA = "/sys/devices/usb1/1-2|USB Camera|0"
+
+
+def test_renumbered_camera_is_not_probed_again(tmp_path, monkeypatch):
+    probed = []
+
+    def probe_cameras(devices, **_kwargs):
+        probed.append(devices)
+        return [CameraInfo(index, key, name, [(640, 480)]) for index, (key, name) in devices.items()]
+
+    monkeypatch.setattr(cameras, "probe_cameras", probe_cameras)
+    monkeypatch.setattr(cameras, "list_devices", lambda: {0: (USB_CAMERA, "USB Camera")})
+    registry = CameraRegistry(tmp_path / "cameras.json")
+    registry.refresh().result(timeout=5)
+
+    # Another camera was plugged in first, the known one is now /dev/video2
+    monkeypatch.setattr(
+        cameras,
+        "list_devices",
+        lambda: {0: ("/sys/devices/usb1/1-1|Webcam|0", "Webcam"), 2: (USB_CAMERA, "USB Camera")},
+    )
+    registry = CameraRegistry(tmp_path / "cameras.json")
+    assert registry.needs_probe(cameras.list_devices())
+    found = registry.refresh().result(timeout=5)
+    assert list(probed[-1]) == [0]
+    assert [(camera.index, camera.name) for camera in found] == [(0, "Webcam"), (2, "USB Camera")]
+    assert registry.get(2).resolutions == [(640, 480)]
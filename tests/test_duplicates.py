@@ -0,0 +1,78 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+from datetime import date
+
+import pytest
+
+from disaster_id_scan.duplicates import DuplicateIndex, NameSignature, cologne_phonetics, similarity
+from disaster_id_scan.store import Person, Registrants
+
+
+def make_index() -> DuplicateIndex:
+    index = DuplicateIndex()
+    index.add(0, "Meier", "Anna", date(1980, 1, 2))
+    index.add(1, "Schulz", "Eva", date(1975, 5, 6))
+    index.add(2, "Mayer", "Anna", date(1980, 2, 1))
+    index.add(3, "Meier", "Anna", None)
+    return index
+
+
+def test_cologne_phonetics():
+    # Reference values of the Cologne phonetics
+    assert cologne_phonetics("Müller-Lüdenscheidt") == "65752682"
+    assert cologne_phonetics("Wikipedia") == "3412"
+    assert cologne_phonetics("Meyer") == cologne_phonetics("Maier") == cologne_phonetics("Mayr")
+    assert cologne_phonetics("Schmidt") == cologne_phonetics("Schmitt")
+    assert cologne_phonetics(None) == ""
+
+
+def test_blocking_keys():
+    assert NameSignature("Müller", "Jörg", date(1980, 1, 2)).blocking_keys() == [
+        "name:MUELLER|1980-01-02",
+        f"phonetic:{cologne_phonetics('Mueller')}|{cologne_phonetics('Joerg')}",
+    ]
+    # Without date of birth the person is only found phonetically
+    assert NameSignature("Müller", None, None).blocking_keys() == [f"phonetic:{cologne_phonetics('Mueller')}|"]
+    assert NameSignature(None, None, None).blocking_keys() == []
+
+
+def test_similarity():
+    meier = NameSignature("Meier", "Anna", date(1980, 1, 2))
+    assert similarity(meier, NameSignature("MEIER", "ANNA", date(1980, 1, 2))) == 1.0
+    # Day and month swapped
+    assert similarity(meier, NameSignature("Meier", "Anna", date(1980, 2, 1))) == pytest.approx(0.7 + 0.3 * 0.7)
+    # Only the names count if a date of birth is missing
+    assert similarity(meier, NameSignature("Meier", "Anna", None)) == 1.0
+    assert similarity(meier, NameSignature("Schulz", "Eva", date(1975, 5, 6))) < 0.5
+
+
+def test_duplicates_are_found_in_their_blocks():
+    index = make_index()
+    assert [person_id for person_id, _ in index.find("Maier", "Anna", date(1980, 1, 2))] == [0, 3, 2]
+    # A person already registered is not its own duplicate
+    assert [person_id for person_id, _ in index.find("Meier", "Anna", date(1980, 1, 2), exclude_id=0)] == [3, 2]
+    assert index.find("Schultz", "Eva", date(1975, 5, 6))[0][0] == 1
+    assert index.find("Weber", "Anna", date(1980, 1, 2)) == []
+    assert [pair[:2] for pair in index.find_all()] == [(0, 3), (2, 3), (0, 2)]
+
+
+def test_index_follows_changes():
+    index = make_index()
+    index.remove(3)
+    index.update(2, "Weber", "Anna", date(1980, 2, 1))
+    assert [person_id for person_id, _ in index.find("Meier", "Anna", date(1980, 1, 2))] == [0]
+    assert index.find_all() == []
+    assert len(index) == 3
+
+
+def test_store_reports_duplicates():
+    store = Registrants()
+    for last_name, first_name in (("Meier", "Anna"), ("Schulz", "Eva")):
+        person = Person()
+        person.last_name, person.first_name, person.date_of_birth = last_name, first_name, date(1980, 1, 2)
+        store.add(person)
+    person = Person()
+    person.last_name, person.first_name, person.date_of_birth = "Mayer", "Anna", date(1980, 1, 2)
+    assert [(person_id, found.last_name) for person_id, found, _ in store.find_duplicates(person)] == [(0, "Meier")]
+    assert store.find_all_duplicates() == []
@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import time
+from datetime import date
+
+from disaster_id_scan import export
+from disaster_id_scan.export import CSVExporter
+from disaster_id_scan.sqlite_store import SQLiteRegistrants
+from disaster_id_scan.store import Person
+
+
+def make_person(person_id: int, last_name: str) -> Person:
+    person = Person()
+    person.person_id = person_id
+    person.last_name = last_name
+    person.first_name = "Anna"
+    person.date_of_birth = date(1980, 1, 2)
+    return person
+
+
+def count_writes(exporter: CSVExporter) -> list:
+    writes = []
+    write = exporter._write
+
+    def counting_write(persons, pending, versions):
+        writes.append(persons is not None)
+        write(persons, pending, versions)
+
+    exporter._write = counting_write
+    return writes
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_a_burst_of_changes_is_written_once(tmp_path):
+    persons = []
+    exporter = CSVExporter(tmp_path / "export.csv", lambda: list(persons), delay=0.3)
+    writes = count_writes(exporter)
+    try:
+        # The burst takes longer than the delay, but no two changes are delay seconds apart
+        for person_id in range(50):
+            person = make_person(person_id, f"Meier{person_id}")
+            persons.append(person)
+            exporter.added([person])
+            time.sleep(0.01)
+        wait_for(lambda: writes)
+        time.sleep(0.5)
+        assert writes == [True]
+
+        for _ in range(20):
+            exporter.changed(3)
+            time.sleep(0.01)
+        wait_for(lambda: len(writes) > 1)
+        time.sleep(0.5)
+        assert writes == [True, True]
+    finally:
+        exporter.close()
+    lines = (tmp_path / "export.csv").read_text().splitlines()
+    assert len(lines) == 51
+    assert lines[-1].startswith("Meier49,Anna,02.01.1980")
+
+
+def test_continuous_changes_are_written_after_max_delay(tmp_path):
+    exporter = CSVExporter(tmp_path / "export.csv", list, delay=0.2, max_delay=0.5)
+    writes = count_writes(exporter)
+    try:
+        deadline = time.monotonic() + 1.0
+        while time.monotonic() < deadline:
+            exporter.changed()
+            time.sleep(0.02)
+        assert len(writes) >= 1
+    finally:
+        exporter.close()
+
+
+def test_rows_are_only_formatted_again_after_a_change(tmp_path, monkeypatch):
+    store = SQLiteRegistrants()
+    store.set_path(tmp_path)
+    try:
+        person_ids = store.add_many(make_person(0, name) for name in ("Meier", "Schulz", "Weber"))
+        store.save()
+        formatted = []
+        format_row = export.format_row
+        monkeypatch.setattr(
+            export, "format_row", lambda person, year: formatted.append(person.last_name) or format_row(person, year)
+        )
+        # Every get_all of the SQLite store returns new Person objects
+        store.update(person_ids[1], make_person(0, "Schulze"))
+        store.save()
+        assert formatted == ["Schulze"]
+    finally:
+        store.close()
+    lines = store.get_export_path().read_text().splitlines()
+    assert [line.split(",")[0] for line in lines[1:]] == ["Meier", "Schulze", "Weber"]
@@ -0,0 +1,97 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import numpy as np
+import pytest
+
+from disaster_id_scan.detect import locate_mrz
+from disaster_id_scan.grid_ocr import GridOCREngine, GridReading
+from disaster_id_scan.mrz import detect_document_type, parse_mrz_checked
+from disaster_id_scan.ocr import MRZ_ALLOWLIST, OCREngine, get_engine
+from disaster_id_scan.preprocess import prepare_crop, prepare_frame
+from disaster_id_scan.recognition import recognize_frame
+from disaster_id_scan.synthetic import generate, generate_set
+
+
+class FallbackEngine:
+    """
+    Stands in for easyocr, reads the given MRZ from every image.
+    """
+
+    def __init__(self, mrz: str = ""):
+        self.mrz = mrz
+        self.calls = 0
+
+    def readtext(self, _image, **_kwargs):
+        self.calls += 1
+        return [(None, self.mrz)] if self.mrz else []
+
+
+def mrz_crop(document) -> np.ndarray:
+    return prepare_crop(locate_mrz(prepare_frame(document.image).image).crop)
+
+
+@pytest.mark.parametrize("document_format", ["TD1", "TD2", "TD3"])
+def test_grid_is_read_without_fallback(document_format):
+    document = generate(document_format, seed=3, noise=4, blur=0.8, skew=3)
+    fallback = FallbackEngine()
+    engine = GridOCREngine(fallback)
+    result = recognize_frame(document.image, engine)
+    assert result.mrz == document.mrz
+    assert fallback.calls == 0
+    assert engine.stats.calls == 1 and engine.stats.fallbacks == 0
+
+
+def test_unreadable_image_is_passed_to_the_fallback():
+    fallback = FallbackEngine()
+    engine = GridOCREngine(fallback)
+    assert engine.readtext(np.full((100, 600), 230, np.uint8)) == []
+    assert fallback.calls == 1 and engine.stats.fallbacks == 1
+
+
+def test_ambiguous_glyphs_need_a_check_digit():
+    # Two glyphs: the first looks like G and almost like Q, the second like O and almost like 0
+    correlations = np.full((2, len(MRZ_ALLOWLIST)), 0.2, np.float32)
+    correlations[0, [MRZ_ALLOWLIST.index("G"), MRZ_ALLOWLIST.index("Q")]] = [0.95, 0.94]
+    correlations[1, [MRZ_ALLOWLIST.index("O"), MRZ_ALLOWLIST.index("0")]] = [0.95, 0.94]
+    reading = GridReading(correlations, 2)
+    assert reading.text == "GO"
+    assert reading.ambiguous() == {0, 1}
+    # G and Q add the same to a check digit, O and 0 do not
+    assert reading.unverified({0, 1}) == {0}
+    assert reading.unverified(set()) == {0, 1}
+    # A 0 in a name is not possible
+    assert reading.constrained(set(), {1}).ambiguous() == {0}
+    assert reading.constrained({1}, set()).text == "G0"
+
+
+def test_fallback_readings_teach_the_recognizer():
+    document = list(generate_set(2))[1]
+    crop = mrz_crop(document)
+    fallback = FallbackEngine(document.mrz)
+    engine = GridOCREngine(fallback)
+    assert engine.read_grid(crop) is None
+    engine.readtext(crop)
+    assert fallback.calls == 1
+    assert engine.read_grid(crop) == " ".join(document.lines())
+
+
+def test_corrected_fallback_readings_are_not_learned():
+    document = list(generate_set(2))[1]
+    crop = mrz_crop(document)
+    # A letter in a date, the MRZ is only valid after a correction
+    index = min(i for i in detect_document_type(document.mrz).numeric_indexes() if document.mrz[i] in "058")
+    misread = document.mrz[:index] + {"0": "O", "5": "S", "8": "B"}[document.mrz[index]] + document.mrz[index + 1 :]
+    assert parse_mrz_checked(misread).corrections
+    engine = GridOCREngine(FallbackEngine(misread))
+    engine.readtext(crop)
+    assert engine.read_grid(crop) is None
+
+
+def test_grid_engine_is_selected_by_name():
+    engine = get_engine(recognizer="grid")
+    assert isinstance(engine, GridOCREngine)
+    assert engine.fallback is get_engine()
+    assert isinstance(engine.fallback, OCREngine)
+    with pytest.raises(ValueError):
+        get_engine(recognizer="tesseract")
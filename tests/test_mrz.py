@@ -0,0 +1,87 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+from datetime import date
+
+import pytest
+
+from disaster_id_scan.mrz import (
+    TD1,
+    TD3,
+    detect_document_type,
+    mrz_checksum,
+    mrz_checksums,
+    parse_mrz,
+    parse_mrz_checked,
+    validate_check_digits,
+    validate_mrz,
+)
+
+# Specimen of the ICAO 9303 passport
+PASSPORT = "P<UTOERIKSSON<<ANNA<MARIA<<<<<<<<<<<<<<<<<<<L898902C36UTO7408122F1204159ZE184226B<<<<<10"
+ID_CARD = "IDD<<D231458907<<<<<<<<<<<<<<<8308126F3110315D<<<<<<<<<<<<<2MUSTERMANN<<ERIKA<<<<<<<<<<<<<"
+
+
+def replace(mrz: str, index: int, text: str) -> str:
+    return mrz[:index] + text + mrz[index + len(text) :]
+
+
+def test_checksums():
+    assert mrz_checksum("L898902C3") == 6
+    assert mrz_checksum("740812") == 2
+    assert mrz_checksum("ZE184226B<<<<<") == 1
+    texts = ["L898902C3", "740812", "120415"] * 20
+    assert mrz_checksums(texts) == [mrz_checksum(text) for text in texts]
+    assert validate_check_digits(["L898902C3", "740812", "<<<<"], ["6", "3", "<"]).tolist() == [True, False, True]
+
+
+def test_document_types():
+    assert isinstance(detect_document_type(PASSPORT), TD3)
+    assert isinstance(detect_document_type(ID_CARD), TD1)
+    assert detect_document_type("") is None
+    assert validate_mrz(PASSPORT) and validate_mrz(ID_CARD)
+    assert not validate_mrz(replace(ID_CARD, 14, "8"))
+
+
+def test_valid_mrz_is_not_changed():
+    parsed = parse_mrz_checked(PASSPORT)
+    assert parsed.valid and parsed.mrz == PASSPORT
+    assert parsed.confidence == 1.0 and parsed.corrections == []
+    person = parsed.get_person()
+    assert (person.last_name, person.first_name) == ("ERIKSSON", "ANNA MARIA")
+    assert person.date_of_birth == date(1974, 8, 12)
+
+
+def test_letters_in_dates_are_repaired():
+    parsed = parse_mrz_checked(replace(ID_CARD, 30, "B"))
+    assert parsed.valid and parsed.mrz == ID_CARD
+    assert parsed.corrections == [(30, "B", "8")]
+    assert parsed.confidence > 0.9
+
+
+def test_one_confusion_is_corrected():
+    parsed = parse_mrz_checked(replace(ID_CARD, 13, "O"))
+    assert parsed.valid and parsed.mrz == ID_CARD
+    assert parsed.corrections == [(13, "O", "0")]
+    assert parsed.confidence == pytest.approx(0.5)
+
+
+def test_ambiguous_corrections_are_rejected():
+    # Read D23I4589O instead of D23145890: changing D to O alone makes the check digits match as well
+    read = replace(ID_CARD, 5, "D23I4589O")
+    parsed = parse_mrz_checked(read)
+    assert not parsed.valid
+    assert parsed.mrz == read and parsed.document.mrz == read
+    assert parsed.corrections == [] and parsed.confidence == 0.0
+
+
+def test_invalid_mrz_is_returned_as_read():
+    # The date can be repaired, the wrong check digit of the birthdate not
+    read = replace(replace(ID_CARD, 30, "B"), 36, "9")
+    parsed = parse_mrz_checked(read)
+    assert not parsed.valid and "birthdate" in parsed.failed_checks
+    assert parsed.mrz == read and parsed.corrections == []
+    # The person is built from the MRZ as read
+    person = parse_mrz(read)
+    assert (person.last_name, person.first_name) == ("MUSTERMANN", "ERIKA")
+    assert person.date_of_birth == date(1, 1, 1)
@@ -0,0 +1,51 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import sys
+import types
+
+import pytest
+
+from disaster_id_scan import profiling
+from disaster_id_scan.ocr import OCREngine
+
+
+class Reader:
+    def readtext(self, _image, **_kwargs):
+        return [(None, "P<UTO")]
+
+
+def test_failed_warm_up_is_retried():
+    engine = OCREngine()
+    attempts = []
+
+    def load():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            message = "Model download failed"
+            raise OSError(message)
+        engine._reader = Reader()
+
+    engine._load = load
+    engine.warm_up().join()
+    # The error of the warm up is raised once, then loading is tried again
+    with pytest.raises(OSError):
+        engine.readtext(None)
+    assert engine.readtext(None) == [(None, "P<UTO")]
+    assert attempts == [0, 1]
+    assert engine.is_ready()
+
+
+def test_load_time_is_profiled(monkeypatch):
+    monkeypatch.setitem(sys.modules, "easyocr", types.SimpleNamespace(Reader=lambda _languages: Reader()))
+    enabled = profiling.is_enabled()
+    profiling.PROFILER.reset()
+    profiling.enable()
+    try:
+        engine = OCREngine()
+        engine.readtext(None)
+        assert profiling.PROFILER.get("ocr.load").count == 1
+        assert engine.stats.load_time is not None
+    finally:
+        profiling.enable(enabled=enabled)
+        profiling.PROFILER.reset()
@@ -0,0 +1,68 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import cv2
+import numpy as np
+import pytest
+
+from disaster_id_scan.detect import locate_mrz
+from disaster_id_scan.preprocess import (
+    RESAMPLE_TOLERANCE,
+    estimate_glyph_height,
+    prepare_crop,
+    prepare_frame,
+    prepare_full_frame,
+)
+from disaster_id_scan.preprocessing import NO_PREPROCESSING, OCR_GLYPH_HEIGHT, Preprocessing
+from disaster_id_scan.synthetic import generate
+
+
+def test_unknown_step_is_rejected():
+    with pytest.raises(ValueError):
+        Preprocessing(["sharpen"])
+    assert not Preprocessing(["card"]).enabled("card")
+
+
+@pytest.mark.parametrize("document_format", ["TD1", "TD3"])
+def test_card_is_rectified(document_format):
+    document = generate(document_format, seed=2, skew=6)
+    prepared = prepare_frame(document.image)
+    assert prepared.card is not None
+    assert prepared.image.ndim == 2
+    assert prepared.document_format == ("TD1" if document_format == "TD1" else "TD3")
+    region = locate_mrz(prepared.image)
+    assert region is not None
+    # The MRZ is at the bottom of the upright document
+    _, y, _, height = region.bbox
+    assert y + height / 2 > prepared.image.shape[0] / 2
+
+
+def test_upside_down_card_is_turned():
+    document = generate("TD1", seed=4, skew=3)
+    prepared = prepare_frame(cv2.rotate(document.image, cv2.ROTATE_180))
+    region = locate_mrz(prepared.image)
+    _, y, _, height = region.bbox
+    assert y + height / 2 < prepared.image.shape[0] / 2
+    turned = prepare_crop(region.crop, upside_down=True)
+    kept = prepare_crop(region.crop, upside_down=True, preprocessing=Preprocessing(["orient"]))
+    assert np.array_equal(turned, prepare_crop(cv2.rotate(region.crop, cv2.ROTATE_180)))
+    assert not np.array_equal(turned, kept)
+
+
+def test_glyphs_are_resampled_to_the_target_height():
+    document = generate("TD2", seed=1, px_per_mm=16)
+    prepared = prepare_frame(document.image)
+    crop = prepare_crop(locate_mrz(prepared.image).crop)
+    glyph_height = estimate_glyph_height(crop)
+    assert OCR_GLYPH_HEIGHT / RESAMPLE_TOLERANCE**2 <= glyph_height <= OCR_GLYPH_HEIGHT * RESAMPLE_TOLERANCE**2
+    # The full frame fallback is smaller than the camera frame
+    full = prepare_full_frame(prepared)
+    assert full.size < document.image.size / 4
+
+
+def test_no_preprocessing_keeps_the_frame():
+    document = generate("TD3", seed=1)
+    prepared = prepare_frame(document.image, NO_PREPROCESSING)
+    assert prepared.card is None
+    assert prepared.image is document.image
+    assert prepare_full_frame(prepared, preprocessing=NO_PREPROCESSING) is document.image
@@ -0,0 +1,81 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import json
+import threading
+
+import pytest
+
+from disaster_id_scan import profiling
+from disaster_id_scan.profiling import Profiler, StageStats
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler()
+    with profiler.span("ocr"):
+        pass
+    profiler.record("ocr", 1.0)
+    assert profiler.stages() == []
+    assert profiler.report() == "No timings recorded"
+
+
+def test_spans_of_all_threads_are_recorded():
+    profiler = Profiler(enabled=True)
+
+    def work():
+        for _ in range(100):
+            with profiler.span("ocr"):
+                pass
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    profiler.record("capture", 0.5)
+    assert [stage.name for stage in profiler.stages()] == ["capture", "ocr"]
+    assert profiler.get("ocr").count == 400
+    assert profiler.get("capture").p95() == 0.5
+    assert "capture" in profiler.report()
+    profiler.reset()
+    assert profiler.get("ocr") is None
+
+
+def test_percentiles_use_the_recent_durations():
+    stage = StageStats("ocr", window=10)
+    assert stage.p50() is None
+    for seconds in range(1, 21):
+        stage.add(seconds)
+    assert (stage.count, stage.total) == (20, 210)
+    # Only the last 10 durations, 11 to 20
+    assert (stage.p50(), stage.p95()) == (16, 20)
+
+
+def test_dump(tmp_path):
+    profiler = Profiler(enabled=True)
+    profiler.record("ocr", 0.25)
+    profiler.dump(tmp_path / "profile.json")
+    data = json.loads((tmp_path / "profile.json").read_text())
+    assert data == {"ocr": {"count": 1, "total": 0.25, "p50": 0.25, "p95": 0.25}}
+
+
+@pytest.fixture
+def global_profiling():
+    enabled = profiling.is_enabled()
+    profiling.PROFILER.reset()
+    yield
+    profiling.enable(enabled=enabled)
+    profiling.PROFILER.reset()
+
+
+@pytest.mark.usefixtures("global_profiling")
+def test_module_functions_use_the_global_profiler():
+    profiling.enable(enabled=False)
+    with profiling.span("export"):
+        pass
+    assert profiling.PROFILER.get("export") is None
+    profiling.enable()
+    with profiling.span("export"):
+        pass
+    profiling.record("export", 0.1)
+    assert profiling.PROFILER.get("export").count == 2
@@ -0,0 +1,102 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import random
+
+import numpy as np
+
+from disaster_id_scan.id_scanner import ScanStats
+from disaster_id_scan.recognition import recognize_frame
+from disaster_id_scan.recognition_cache import Fingerprint, RecognitionCache
+from disaster_id_scan.synthetic import build_mrz, degrade, random_identity, render_document
+
+
+def document_frame(document_format: str, seed: int, noise_seed: int) -> tuple[np.ndarray, str]:
+    # The same document in the same place, only the camera noise differs
+    rng = random.Random(f"{document_format}-{seed}")
+    mrz = build_mrz(document_format, **random_identity(rng))
+    image = degrade(render_document(document_format, mrz, rng=rng), random.Random(0), blur=0.7, skew=3)
+    noise = np.random.default_rng(noise_seed).normal(0, 6, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8), mrz
+
+
+def fingerprint(document_format: str, seed: int, noise_seed: int = 0) -> Fingerprint:
+    return Fingerprint(document_frame(document_format, seed, noise_seed)[0])
+
+
+class CountingEngine:
+    """
+    Reads the given MRZ from every image, counts the calls.
+    """
+
+    def __init__(self, mrz: str):
+        self.mrz = mrz
+        self.calls = 0
+
+    def readtext(self, _image, **_kwargs):
+        self.calls += 1
+        return [(None, self.mrz)]
+
+
+def test_same_document_hits_and_other_document_misses():
+    cache = RecognitionCache()
+    cache.put(fingerprint("TD3", 1), "reading")
+    for noise_seed in (1, 2, 3):
+        assert cache.get(fingerprint("TD3", 1, noise_seed)) == "reading"
+    # Documents of other persons only differ in the printed text
+    for seed in (2, 3, 4, 5):
+        assert cache.get(fingerprint("TD3", seed)) is None
+    assert (cache.stats.hits, cache.stats.misses) == (3, 4)
+
+
+def test_scan_stats_report_the_cache():
+    cache = RecognitionCache()
+    stats = ScanStats(cache.stats)
+    # No lookups yet, nothing to report
+    assert "cache" not in str(stats)
+    cache.put(fingerprint("TD3", 1), "reading")
+    cache.get(fingerprint("TD3", 1, 1))
+    cache.get(fingerprint("TD3", 2))
+    assert "Recognition cache hits: 1, misses: 1 (50%)" in str(stats)
+
+
+def test_values_of_other_variants_are_not_returned():
+    cache = RecognitionCache()
+    cache.put(fingerprint("TD1", 1), "failed", variant="crop")
+    assert cache.get(fingerprint("TD1", 1, 1), variant="full frame") is None
+    assert cache.get(fingerprint("TD1", 1, 1), variant="crop") == "failed"
+    cache.put(fingerprint("TD1", 1), "parsed")
+    assert cache.get(fingerprint("TD1", 1, 1), variant="full frame") == "parsed"
+
+
+def test_entries_expire_and_are_bounded():
+    fingerprints = [fingerprint("TD1", seed) for seed in range(3)]
+    cache = RecognitionCache(max_entries=2)
+    for seed, entry in enumerate(fingerprints):
+        cache.put(entry, seed)
+    assert len(cache) == 2
+    assert cache.get(fingerprints[0]) is None
+    assert cache.get(fingerprints[2]) == 2
+
+    cache = RecognitionCache(ttl=0)
+    cache.put(fingerprints[0], 0)
+    assert cache.get(fingerprints[0]) is None
+    assert cache.stats.evictions == 1
+
+
+def test_recognize_frame_reuses_the_reading():
+    first, mrz = document_frame("TD2", 1, 0)
+    second, _ = document_frame("TD2", 1, 1)
+    engine = CountingEngine(mrz)
+    cache = RecognitionCache()
+    result = recognize_frame(first, engine, cache=cache)
+    again = recognize_frame(second, engine, cache=cache)
+    assert engine.calls == 1
+    assert not result.cached and again.cached
+    assert again.mrz == result.mrz
+    # The person is not shared, the store sets its id
+    assert again.person is not result.person
+    other, other_mrz = document_frame("TD2", 2, 0)
+    engine.mrz = other_mrz
+    assert recognize_frame(other, engine, cache=cache).mrz == other_mrz
+    assert engine.calls == 2
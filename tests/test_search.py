@@ -0,0 +1,60 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+from disaster_id_scan.names import normalize_name
+from disaster_id_scan.search import NameIndex
+
+
+def make_index() -> NameIndex:
+    index = NameIndex()
+    index.add_many(
+        [
+            (0, "Müller", "Anna"),
+            (1, "Mueller", "Jörg"),
+            (2, "MULLER", "Eva"),
+            (3, "Meier", "Jorg"),
+            (4, "Schmidt", "Ann-Kathrin"),
+        ]
+    )
+    return index
+
+
+def test_normalize_name():
+    assert normalize_name("Müller-Lüdenscheidt") == "MUELLER LUEDENSCHEIDT"
+    assert normalize_name("Müller-Lüdenscheidt", transliterate=False) == "MULLER LUDENSCHEIDT"
+    assert normalize_name("Strauß", transliterate=False) == "STRAUSS"
+    assert normalize_name(" José  ") == "JOSE"
+    assert normalize_name(None) == ""
+
+
+def test_umlauts_are_found_while_typing():
+    index = make_index()
+    # Typed without umlaut, with umlaut and transliterated
+    assert index.search("mull") == [0, 2]
+    assert index.search("Müll") == [0, 1, 2]
+    assert index.search("muell") == [0, 1]
+    assert index.search("jorg") == [1, 3]
+    assert index.search("Jörg") == [1, 3]
+
+
+def test_words_match_by_prefix_and_with_typos():
+    index = make_index()
+    assert index.search("ann") == [0, 4]
+    assert index.search("schmidt kath") == [4]
+    assert index.search("schmit") == [4]
+    # Exact prefix matches rank before typos
+    assert index.search("Muller")[:2] == [0, 2]
+    assert index.search("x") == []
+    assert index.search("") == []
+
+
+def test_index_follows_changes():
+    index = make_index()
+    index.remove(0)
+    assert index.search("mull") == [2]
+    index.update(2, "Weber", "Eva")
+    assert index.search("mull") == []
+    assert index.search("web") == [2]
+    assert len(index) == 4
+    index.clear()
+    assert index.search("weber") == []
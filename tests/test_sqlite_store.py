@@ -0,0 +1,122 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+from datetime import date
+
+import pytest
+
+from disaster_id_scan.sqlite_store import SQLiteRegistrants
+from disaster_id_scan.store import Person, Registrants, create_registrants
+
+
+def make_person(last_name: str, first_name: str = "Anna", date_of_birth: date = date(1980, 1, 2)) -> Person:
+    person = Person()
+    person.last_name = last_name
+    person.first_name = first_name
+    person.date_of_birth = date_of_birth
+    person.place_of_shelter = "Halle"
+    return person
+
+
+def open_store(path) -> SQLiteRegistrants:
+    store = create_registrants("sqlite")
+    assert isinstance(store, SQLiteRegistrants)
+    store.set_path(path)
+    return store
+
+
+def test_changes_are_stored(tmp_path):
+    store = open_store(tmp_path)
+    try:
+        meier, schulz = store.add_many([make_person("Müller"), make_person("Schulz", "Eva")])
+        weber = store.add(make_person("Weber"))
+        store.update(schulz, make_person("Schulze", "Eva", date(1975, 5, 6)))
+        store.delete(meier)
+        with pytest.raises(KeyError):
+            store.update(meier, make_person("Meier"))
+        with pytest.raises(KeyError):
+            store.delete(meier)
+        with pytest.raises(KeyError):
+            store.get_person_by_id(meier)
+    finally:
+        store.close()
+
+    store = open_store(tmp_path)
+    try:
+        assert store.get_name_entries() == [(schulz, f"Schulze, Eva #{schulz}"), (weber, f"Weber, Anna #{weber}")]
+        person = store.get_person_by_id(schulz)
+        assert (person.person_id, person.date_of_birth, person.place_of_shelter) == (schulz, date(1975, 5, 6), "Halle")
+        assert [person_id for person_id, _ in store.get_recent(1)] == [weber]
+        # Ids of deleted persons are not handed out again
+        assert store.add(make_person("Wagner")) == weber + 1
+    finally:
+        store.close()
+
+
+def test_find_compares_normalized_names(tmp_path):
+    store = open_store(tmp_path)
+    try:
+        store.add_many([make_person("Müller"), make_person("Mueller", "Jörg"), make_person("Schulz")])
+        assert [person.first_name for _, person in store.find(last_name="MUELLER")] == ["Anna", "Jörg"]
+        assert [person.last_name for _, person in store.find(first_name="joerg")] == ["Mueller"]
+        assert len(store.find(date_of_birth=date(1980, 1, 2), place_of_shelter="Halle")) == 3
+        assert store.find(last_name="Schulz", first_name="Eva") == []
+        # The name index and the duplicate index are kept up to date as well
+        assert [person.last_name for _, person in store.search("mull")] == ["Müller"]
+        assert store.find_duplicates(make_person("Muller"))[0][1].last_name in ("Müller", "Mueller")
+    finally:
+        store.close()
+
+
+def test_autosave_is_migrated(tmp_path):
+    legacy = Registrants()
+    legacy.set_path(tmp_path)
+    legacy.add(make_person("Meier"))
+    legacy.add(make_person("Schulz"))
+    legacy.delete(0)
+    legacy.close()
+
+    store = open_store(tmp_path)
+    try:
+        assert [(person_id, person.last_name) for person_id, person in store.find()] == [(1, "Schulz")]
+        assert store.add(make_person("Weber")) == 2
+    finally:
+        store.close()
+    # The autosave file is kept as backup
+    assert legacy.get_savepoint_path().exists()
+
+    reader = SQLiteRegistrants()
+    reader.load(tmp_path)
+    try:
+        assert [person.last_name for person in reader.get_all()] == ["Schulz", "Weber"]
+    finally:
+        reader.close()
+
+
+def test_folder_without_database_is_read(tmp_path):
+    legacy = Registrants()
+    legacy.set_path(tmp_path)
+    legacy.add(make_person("Meier"))
+    legacy.add(make_person("Maier"))
+    legacy.close()
+
+    reader = SQLiteRegistrants()
+    reader.load(tmp_path)
+    try:
+        assert [person.last_name for person in reader.get_all()] == ["Meier", "Maier"]
+        assert reader.find_all_duplicates()[0][:2] == (0, 1)
+    finally:
+        reader.close()
+    assert not reader.get_db_path().exists()
+
+
+def test_indexes_are_built_on_the_first_search(tmp_path):
+    store = open_store(tmp_path)
+    try:
+        store.add(make_person("Meier"))
+        assert len(store.name_index) == 0
+        assert [person.last_name for _, person in store.search("meier")] == ["Meier"]
+        store.add(make_person("Meyer"))
+        assert "Meyer" in [person.last_name for _, person in store.search("meyer")]
+    finally:
+        store.close()
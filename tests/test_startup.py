@@ -0,0 +1,74 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Seconds the imports may take, the interpreter start is not included
+IMPORT_BUDGET = 0.5
+
+# Modules that are slow to import or need a display, only commands that need them may load them
+HEAVY_MODULES = ["cv2", "easyocr", "torch", "numpy", "PIL", "tkinter", "tkcalendar", "sv_ttk", "jsonpickle"]
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+for module in sys.argv[1:]:
+    __import__(module)
+print(json.dumps({"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}))
+"""
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    # The child process finds the package where this process found it
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    return subprocess.run([sys.executable, *args], check=False, capture_output=True, text=True, env=env, timeout=60)
+
+
+def measure_import(*modules: str) -> dict:
+    result = run_python("-c", MEASURE, *modules)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout)
+
+
+@pytest.mark.parametrize(
+    "module",
+    ["disaster_id_scan.cli", "disaster_id_scan.mrz", "disaster_id_scan.store", "disaster_id_scan.preprocessing"],
+)
+def test_import_is_light(module):
+    measured = measure_import(module)
+    loaded = [name for name in HEAVY_MODULES if name in measured["modules"]]
+    assert loaded == []
+
+
+def test_import_budget():
+    # Best of a few runs, the first one may have to compile the modules
+    seconds = min(measure_import("disaster_id_scan.cli", "disaster_id_scan.mrz")["seconds"] for _ in range(3))
+    assert seconds < IMPORT_BUDGET
+
+
+def test_version_does_not_start_gui():
+    result = run_python("-X", "importtime", "-m", "disaster_id_scan", "--version")
+    assert result.returncode == 0, result.stderr
+    assert "Disaster ID Scan" in result.stdout
+    imported = {line.split("|")[-1].strip() for line in result.stderr.splitlines() if line.startswith("import time:")}
+    assert imported.isdisjoint(HEAVY_MODULES)
+
+
+def test_parse_mrz_without_ocr_modules():
+    result = run_python(
+        "-c",
+        """
+import sys
+from disaster_id_scan.mrz import parse_mrz
+person = parse_mrz("P<UTOERIKSSON<<ANNA<MARIA<<<<<<<<<<<<<<<<<<<L898902C36UTO7408122F1204159ZE184226B<<<<<10")
+assert person.last_name.upper() == "ERIKSSON", person.last_name
+print(",".join(name for name in ("cv2", "easyocr", "torch", "numpy") if name in sys.modules))
+""",
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
@@ -0,0 +1,133 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import json
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from disaster_id_scan.store import Person, Registrants
+
+# Autosave file of version 1, a jsonpickle dump of the list of persons with the misspelled date_of_catastrope
+LEGACY_SNAPSHOT = (
+    '[{"py/object": "disaster_id_scan.store.Person", "first_name": "Anna", "last_name": "Meier", "date_of_birth": '
+    '{"py/object": "datetime.date", "__reduce__": [{"py/type": "datetime.date"}, ["B7wBAg=="]]}, "nationality": '
+    '"D", "place_of_shelter": "Halle", "date_of_catastrope": {"py/object": "datetime.date", "__reduce__": '
+    '[{"py/type": "datetime.date"}, ["B+cCBg=="]]}}]'
+)
+
+
+def make_person(last_name: str, first_name: str = "Anna") -> Person:
+    person = Person()
+    person.last_name = last_name
+    person.first_name = first_name
+    person.date_of_birth = date(1980, 1, 2)
+    return person
+
+
+def open_store(path, compact_delay: float = 60.0) -> Registrants:
+    store = Registrants()
+    store.compact_delay = compact_delay
+    store.set_path(path)
+    return store
+
+
+def load_store(path) -> Registrants:
+    # Reads the data folder like after a crash, while the writing store is still open
+    store = Registrants()
+    store.load(path)
+    return store
+
+
+def wait_for_compaction(store: Registrants):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and (
+        store.get_journal_path().stat().st_size or store.get_compacting_journal_path().exists()
+    ):
+        time.sleep(0.05)
+
+
+def summary(store: Registrants) -> list:
+    return [(person_id, person.last_name, person.first_name) for person_id, person in store.registrants.items()]
+
+
+def test_journal_is_replayed(tmp_path):
+    store = open_store(tmp_path)
+    try:
+        meier = store.add(make_person("Meier"))
+        schulz = store.add(make_person("Schulz"))
+        store.add(make_person("Weber"))
+        store.update(schulz, make_person("Schulze", "Eva"))
+        store.delete(meier)
+        # Nothing was compacted, the changes are only in the journal
+        assert store.get_journal_path().read_text().count("\n") == 5
+        assert summary(load_store(tmp_path)) == [(1, "Schulze", "Eva"), (2, "Weber", "Anna")]
+    finally:
+        store.close()
+    # Ids are not handed out again after reopening
+    store = open_store(tmp_path)
+    try:
+        assert store.add(make_person("Wagner")) == 3
+    finally:
+        store.close()
+
+
+def test_torn_last_journal_record_is_ignored(tmp_path):
+    store = open_store(tmp_path)
+    try:
+        store.add(make_person("Meier"))
+        with open(store.get_journal_path(), "a") as f:
+            f.write(json.dumps({"op": "add", "id": 1, "person": {"last_name": "Schulz"}, "seq": 2})[:30])
+        assert summary(load_store(tmp_path)) == [(0, "Meier", "Anna")]
+    finally:
+        store.close()
+
+
+def test_journal_is_compacted_in_the_background(tmp_path):
+    store = open_store(tmp_path, compact_delay=0.2)
+    try:
+        threads = threading.active_count()
+        for i in range(200):
+            store.add(make_person(f"Meier{i}"))
+        # One compaction thread, not one per change
+        assert threading.active_count() <= threads + 1
+        wait_for_compaction(store)
+        assert store.get_journal_path().stat().st_size == 0
+        lines = store.get_savepoint_path().read_text().splitlines()
+        assert json.loads(lines[0])["next_id"] == 200
+        assert len(lines) == 201
+    finally:
+        store.close()
+
+
+def test_many_changes_compact_without_pause(tmp_path):
+    store = open_store(tmp_path)
+    store.compact_records = 50
+    try:
+        for i in range(60):
+            store.add(make_person(f"Meier{i}"))
+        deadline = time.monotonic() + 5
+        while store._journal_records > 10 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert store._journal_records <= 10
+    finally:
+        store.close()
+
+
+def test_legacy_snapshot_is_upgraded(tmp_path):
+    pytest.importorskip("jsonpickle")
+    (tmp_path / Registrants.json_filename).write_text(LEGACY_SNAPSHOT)
+    store = open_store(tmp_path)
+    try:
+        person = store.get_person_by_id(0)
+        assert (person.last_name, person.date_of_birth) == ("Meier", date(1980, 1, 2))
+        assert person.date_of_catastrophe == date(2023, 2, 6)
+        assert person.residence is None and person.time_of_registration is None
+    finally:
+        store.close()
+    # The snapshot is written in the current format
+    header = json.loads(store.get_savepoint_path().read_text().splitlines()[0])
+    assert header["format"] == "disaster-id-scan" and header["next_id"] == 1
+    assert summary(load_store(tmp_path)) == [(0, "Meier", "Anna")]
@@ -0,0 +1,280 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import os
+import subprocess
+import sys
+import time
+from datetime import date
+
+import pytest
+
+from disaster_id_scan.store import Person, Registrants
+from disaster_id_scan.sync import Change, HTTPTransport, SyncManager, SyncServer, SyncSession
+
+
+def make_person(last_name: str, first_name: str = "Anna") -> Person:
+    person = Person()
+    person.last_name = last_name
+    person.first_name = first_name
+    person.date_of_birth = date(1980, 1, 2)
+    return person
+
+
+def open_station(path, shared) -> tuple[Registrants, SyncSession]:
+    path.mkdir(exist_ok=True)
+    store = Registrants()
+    store.set_path(path)
+    return store, SyncSession(store, folder=shared)
+
+
+def last_names(store: Registrants) -> list[str]:
+    return sorted(person.last_name for person in store.get_all())
+
+
+def test_folder_sync_exchanges_changes(tmp_path):
+    shared = tmp_path / "shared"
+    first, first_sync = open_station(tmp_path / "a", shared)
+    second, second_sync = open_station(tmp_path / "b", shared)
+    try:
+        first.add(make_person("Meier"))
+        second.add(make_person("Schulz"))
+        first_sync.manager.sync()
+        second_sync.manager.sync()
+        first_sync.manager.sync()
+        assert last_names(first) == last_names(second) == ["Meier", "Schulz"]
+
+        # Only the changes since the last sync are exchanged
+        person_id = second.find(last_name="Meier")[0][0]
+        second.delete(person_id)
+        result = second_sync.manager.sync()
+        assert result.sent == 1
+        assert result.received == 0
+        result = first_sync.manager.sync()
+        assert (result.received, result.applied) == (1, 1)
+        assert last_names(first) == ["Schulz"]
+    finally:
+        for session, store in ((first_sync, first), (second_sync, second)):
+            session.close()
+            store.close()
+
+
+def test_conflicts_resolve_the_same_on_every_station(tmp_path):
+    shared = tmp_path / "shared"
+    first, first_sync = open_station(tmp_path / "a", shared)
+    second, second_sync = open_station(tmp_path / "b", shared)
+    try:
+        first.add(make_person("Meier"))
+        first_sync.manager.sync()
+        second_sync.manager.sync()
+        # Both stations edit the same person before they sync again
+        first_id = first.find(last_name="Meier")[0][0]
+        second_id = second.find(last_name="Meier")[0][0]
+        first.update(first_id, make_person("Maier"))
+        second.update(second_id, make_person("Mayer"))
+        for _ in range(2):
+            first_sync.manager.sync()
+            second_sync.manager.sync()
+        # Same counter, the higher station id wins
+        winner = "Maier" if first_sync.manager.station > second_sync.manager.station else "Mayer"
+        assert last_names(first) == last_names(second) == [winner]
+    finally:
+        for session, store in ((first_sync, first), (second_sync, second)):
+            session.close()
+            store.close()
+
+
+def test_older_changes_are_ignored(tmp_path):
+    store = Registrants()
+    store.set_path(tmp_path)
+    manager = SyncManager(store)
+    manager.attach()
+    try:
+        person = {"last_name": "Meier", "first_name": "Anna"}
+        assert manager.apply([Change(1, "other:0", (5, "other"), person)]) == 1
+        assert manager.apply([Change(2, "other:0", (3, "other"), None)]) == 0
+        assert last_names(store) == ["Meier"]
+        assert manager.apply([Change(3, "other:0", (6, "other"), None)]) == 1
+        assert store.get_all() == []
+        # Applied changes are not sent on as own changes
+        assert manager.last_seq() == 0
+    finally:
+        manager.close()
+        store.close()
+
+
+def test_state_survives_restart(tmp_path):
+    shared = tmp_path / "shared"
+    first, first_sync = open_station(tmp_path / "a", shared)
+    second, second_sync = open_station(tmp_path / "b", shared)
+    first.add(make_person("Meier"))
+    first_sync.manager.sync()
+    second_sync.manager.sync()
+    station = second_sync.manager.station
+    second_sync.close()
+    second.close()
+
+    second, second_sync = open_station(tmp_path / "b", shared)
+    try:
+        assert second_sync.manager.station == station
+        result = second_sync.manager.sync()
+        assert (result.sent, result.received) == (0, 0)
+        assert last_names(second) == ["Meier"]
+    finally:
+        for session, store in ((first_sync, first), (second_sync, second)):
+            session.close()
+            store.close()
+
+
+def test_offline_edits_are_sent(tmp_path):
+    shared = tmp_path / "shared"
+    first, first_sync = open_station(tmp_path / "a", shared)
+    second, second_sync = open_station(tmp_path / "b", shared)
+    meier = first.add(make_person("Meier"))
+    first.add(make_person("Schulz"))
+    first_sync.manager.sync()
+    second_sync.manager.sync()
+    first_sync.close()
+    # Edited while no sync was running
+    first.update(meier, make_person("Maier"))
+    first_sync = SyncSession(first, folder=shared)
+    try:
+        # Only the edited person is logged again
+        assert first_sync.manager.sync().sent == 1
+        second_sync.manager.sync()
+        assert last_names(second) == ["Maier", "Schulz"]
+        # Unchanged persons are not logged on the next start
+        first_sync.close()
+        first_sync = SyncSession(first, folder=shared)
+        assert first_sync.manager.sync().sent == 0
+    finally:
+        for session, store in ((first_sync, first), (second_sync, second)):
+            session.close()
+            store.close()
+
+
+def test_http_sync(tmp_path):
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+    server_store = Registrants()
+    server_store.set_path(tmp_path / "a")
+    server_manager = SyncManager(server_store)
+    server_manager.attach()
+    server = SyncServer(server_manager, "127.0.0.1", 0, token="secret")
+    server.start()
+    client_store = Registrants()
+    client_store.set_path(tmp_path / "b")
+    client_manager = SyncManager(client_store, [HTTPTransport([f"http://127.0.0.1:{server.port}"], "secret")])
+    client_manager.attach()
+    try:
+        server_store.add_many(make_person(f"Person{number}") for number in range(3))
+        assert client_manager.sync().applied == 3
+        server_store.add(make_person("Schulz"))
+        result = client_manager.sync()
+        assert (result.received, result.applied) == (1, 1)
+        assert last_names(client_store) == last_names(server_store)
+    finally:
+        server.close()
+        for manager, store in ((server_manager, server_store), (client_manager, client_store)):
+            manager.close()
+            store.close()
+
+
+def test_http_sync_needs_the_token(tmp_path):
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+    server_store = Registrants()
+    server_store.set_path(tmp_path / "a")
+    server_manager = SyncManager(server_store)
+    server_manager.attach()
+    server = SyncServer(server_manager, "127.0.0.1", 0, token="secret")
+    server.start()
+    client_store = Registrants()
+    client_store.set_path(tmp_path / "b")
+    client_manager = SyncManager(client_store, [HTTPTransport([f"http://127.0.0.1:{server.port}"], "guess")])
+    client_manager.attach()
+    try:
+        server_store.add(make_person("Schulz"))
+        result = client_manager.sync()
+        assert result.applied == 0
+        assert len(result.errors) == 1
+        assert "403" in result.errors[0]
+        assert last_names(client_store) == []
+    finally:
+        server.close()
+        for manager, store in ((server_manager, server_store), (client_manager, client_store)):
+            manager.close()
+            store.close()
+
+
+def test_http_sync_is_refused_without_token(tmp_path):
+    store = Registrants()
+    store.set_path(tmp_path)
+    try:
+        with pytest.raises(ValueError, match="token"):
+            SyncSession(store, listen="0")
+        with pytest.raises(ValueError, match="http"):
+            HTTPTransport(["file:///etc"], "secret")
+    finally:
+        store.close()
+
+
+def test_unreachable_peer_is_reported(tmp_path):
+    store = Registrants()
+    store.set_path(tmp_path)
+    # Nothing listens on the discard port
+    manager = SyncManager(store, [HTTPTransport(["http://127.0.0.1:9"], "secret", timeout=1.0)])
+    manager.attach()
+    try:
+        assert len(manager.sync().errors) == 1
+        manager.start(interval=60)
+        deadline = time.monotonic() + 10
+        while manager.last_result is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert manager.last_error.startswith("Sync with http://127.0.0.1:9 failed")
+        assert "1 failed" in str(manager.last_result)
+    finally:
+        manager.close()
+        store.close()
+
+
+STATION = """
+import sys
+from pathlib import Path
+from disaster_id_scan.store import Person, Registrants
+from disaster_id_scan.sync import SyncSession
+
+Path(sys.argv[1]).mkdir(exist_ok=True)
+store = Registrants()
+store.set_path(Path(sys.argv[1]))
+session = SyncSession(store, folder=Path(sys.argv[2]))
+for number in range(int(sys.argv[4])):
+    person = Person()
+    person.last_name = f"{sys.argv[3]}{number}"
+    store.add(person)
+for _ in range(2):
+    session.manager.sync()
+session.close()
+store.close()
+"""
+
+
+def run_station(data, shared, prefix: str, count: int) -> subprocess.Popen:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    return subprocess.Popen([sys.executable, "-c", STATION, str(data), str(shared), prefix, str(count)], env=env)
+
+
+def test_stations_in_separate_processes(tmp_path):
+    shared = tmp_path / "shared"
+    stations = [(tmp_path / name, name, 20) for name in ("a", "b", "c")]
+    processes = [run_station(data, shared, prefix, count) for data, prefix, count in stations]
+    assert [process.wait(timeout=60) for process in processes] == [0, 0, 0]
+    # A second round picks up the changes of stations that finished earlier
+    processes = [run_station(data, shared, prefix, 0) for data, prefix, _ in stations]
+    assert [process.wait(timeout=60) for process in processes] == [0, 0, 0]
+
+    expected = sorted(f"{prefix}{number}" for _, prefix, count in stations for number in range(count))
+    for data, _, _ in stations:
+        store = Registrants()
+        store.load(data)
+        assert last_names(store) == expected
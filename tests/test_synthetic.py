@@ -0,0 +1,41 @@
+# SPDX-FileCopyrightText: 2023-present anjomro <py@anjomro.de>
+#
+# SPDX-License-Identifier: EUPL-1.2
+import numpy as np
+import pytest
+
+from disaster_id_scan.detect import MRZ_FORMATS, locate_mrz
+from disaster_id_scan.mrz import parse_mrz_checked
+from disaster_id_scan.synthetic import generate, generate_set
+
+
+@pytest.mark.parametrize("document_format", list(MRZ_FORMATS))
+def test_generated_mrz_is_valid(document_format):
+    document = generate(document_format, seed=3)
+    parsed = parse_mrz_checked(document.mrz)
+    assert parsed.valid, parsed.failed_checks
+    assert type(parsed.document).__name__ == document_format
+    person = parsed.get_person()
+    assert person.last_name.upper() == document.last_name
+    assert person.date_of_birth == document.date_of_birth
+    assert len(document.lines()) == MRZ_FORMATS[document_format][1]
+
+
+def test_generation_is_deterministic():
+    first = generate("TD2", seed=5, noise=10, blur=1, skew=4)
+    second = generate("TD2", seed=5, noise=10, blur=1, skew=4)
+    assert first.mrz == second.mrz
+    assert np.array_equal(first.image, second.image)
+
+
+def test_generate_set_varies_formats():
+    documents = list(generate_set(6, max_noise=0, max_blur=0, max_skew=0))
+    assert [document.document_format for document in documents] == ["TD1", "TD2", "TD3"] * 2
+    assert len({document.mrz for document in documents}) == 6
+
+
+def test_mrz_is_located():
+    document = generate("TD1", seed=1)
+    region = locate_mrz(document.image)
+    assert region is not None
+    assert region.document_format == "TD1"